@@ -0,0 +1,36 @@
+"""add document texts table
+
+Revision ID: c7a24e815f3b
+Revises: 9b3f0d6e5c21
+Create Date: 2025-12-21 14:02:48.117592
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7a24e815f3b'
+down_revision: Union[str, Sequence[str], None] = '9b3f0d6e5c21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('document_texts',
+    sa.Column('document_id', sa.UUID(), nullable=False),
+    sa.Column('pages', sa.LargeBinary(), nullable=False),
+    sa.Column('page_count', sa.Integer(), nullable=False),
+    sa.Column('char_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['document_id'], ['documents.document_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('document_id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('document_texts')
@@ -0,0 +1,30 @@
+"""add batch id to ingestion jobs
+
+Revision ID: e5a8d3c19f42
+Revises: c7a24e815f3b
+Create Date: 2026-01-08 10:42:13.517204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a8d3c19f42'
+down_revision: Union[str, Sequence[str], None] = 'c7a24e815f3b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('ingestion_jobs', sa.Column('batch_id', sa.UUID(), nullable=True))
+    op.create_index(op.f('ix_ingestion_jobs_batch_id'), 'ingestion_jobs', ['batch_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_ingestion_jobs_batch_id'), table_name='ingestion_jobs')
+    op.drop_column('ingestion_jobs', 'batch_id')
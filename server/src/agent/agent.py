@@ -1,12 +1,15 @@
 
 import json
-from typing import Dict, Any, List
+import uuid
+from typing import Awaitable, Callable, Dict, Any, List, Optional
 from dotenv import load_dotenv 
 from langchain_core.messages import  BaseMessage
 from langchain.agents import create_agent
+from langchain.agents.middleware import AgentMiddleware, ModelRequest, ModelResponse
 
 from .builder import build_knowledge_graph
 from .model_factory import ModelFactory
+from .llm_scheduler import PRIORITY_INTERACTIVE, estimate_tokens, llm_scheduler
 from .output_schema import KnowledgeGraphAnswer
 import ast
 from .tools import _create_kg_search_tool,_create_kg_entity_lookup_tool,_create_multi_hop_tool,_create_structured_retrieval_tools
@@ -19,6 +22,25 @@ from langgraph.checkpoint.memory import InMemorySaver
 load_dotenv()
 
 
+class SchedulerMiddleware(AgentMiddleware):
+    """
+    Runs each chat model call of the agent loop under llm_scheduler, ahead of queued
+    ingestion calls: every call is charged against RPM/TPM on its own, the slot is
+    released while tools run, and a retried 429 repeats only the model call.
+    """
+
+    def __init__(self, provider: str):
+        super().__init__()
+        self.provider = provider
+
+    async def awrap_model_call(self, request: ModelRequest, handler: Callable[[ModelRequest], Awaitable[ModelResponse]]) -> ModelResponse:
+        prompt = (request.system_prompt or "") + "".join(str(message.content) for message in request.messages)
+        return await llm_scheduler.run(
+            self.provider, lambda: handler(request),
+            priority=PRIORITY_INTERACTIVE, tokens=estimate_tokens(prompt)
+        )
+
+
 class Neo4jRAGSystem:
     def __init__(self, user_id, document_id, provider, model):
    
@@ -28,6 +50,7 @@ class Neo4jRAGSystem:
         self.provider = provider 
         self.model = model
         self.llm = ModelFactory.create_chat_model(provider=provider, model_name=model, temperature=0.3)
+        self.checkpointer = InMemorySaver()
         self.agent_executor = self._create_agent()
      
 
@@ -330,19 +353,27 @@ You are now ready to provide comprehensive, well-structured answers in clear hie
             tools=tools,
             system_prompt=system_prompt,
             response_format=KnowledgeGraphAnswer,
-            checkpointer=InMemorySaver()
+            checkpointer=self.checkpointer,
+            middleware=[SchedulerMiddleware(self.provider)]
         )
    
         return agent
 
 
-    async def answer_question(self, question: str) -> Dict[str, Any]:
+    async def answer_question(self, question: str, thread_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        thread_id: conversation to continue; when omitted the question runs on a
+        throwaway thread so a pooled instance never leaks history between callers.
+        """
         print(f"\n{'='*90}")
         print(f"❓ {question}")
         print(f"{'='*90}")
         print("🤖 Agent is reasoning...\n")
-        config = RunnableConfig(configurable={"thread_id": "thread-abc"})
+        ephemeral = thread_id is None
+        thread_id = thread_id or f"ephemeral-{uuid.uuid4()}"
+        config = RunnableConfig(configurable={"thread_id": thread_id})
         try:
+            # every model call of the tool loop goes through the scheduler (SchedulerMiddleware)
             result = await self.agent_executor.ainvoke({
                 "messages": [{"role": "user", "content": question}],
             },config=config)
@@ -375,6 +406,9 @@ You are now ready to provide comprehensive, well-structured answers in clear hie
                 "answer": f"Error: {str(e)}",
                 "success": False
             }
+        finally:
+            if ephemeral:
+                self.checkpointer.delete_thread(thread_id)
 
 
 
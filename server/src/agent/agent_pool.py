@@ -0,0 +1,65 @@
+"""
+In-process pool of Neo4jRAGSystem instances.
+
+Building an agent re-creates the chat model, recompiles the langgraph agent and
+loads spaCy for the search tool, so instances are kept per (document_id, provider, model)
+and reused while the session is active. Entries expire after AGENT_POOL_TTL seconds
+without use (same sliding window as the redis session key) and the least recently
+used entry is evicted once AGENT_POOL_MAX_SIZE is reached.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Tuple
+from .agent import Neo4jRAGSystem
+
+AGENT_POOL_TTL=int(os.getenv("AGENT_POOL_TTL","1800"))
+AGENT_POOL_MAX_SIZE=int(os.getenv("AGENT_POOL_MAX_SIZE","32"))
+
+PoolKey=Tuple[str,str,str]
+
+
+class AgentPool:
+    def __init__(self,max_size:int=AGENT_POOL_MAX_SIZE,ttl:int=AGENT_POOL_TTL) -> None:
+        self.max_size=max_size
+        self.ttl=ttl
+        self._agents:"OrderedDict[PoolKey,Tuple[Neo4jRAGSystem,float]]"=OrderedDict()
+        self._locks:Dict[PoolKey,asyncio.Lock]={}
+        self.hits=0
+        self.misses=0
+
+    def _evict_expired(self):
+        now=time.monotonic()
+        for key in [key for key,(_,last_used) in self._agents.items() if now-last_used>self.ttl]:
+            del self._agents[key]
+            self._locks.pop(key,None)
+
+    async def get(self,user_id,document_id,provider:str,model:str)->Neo4jRAGSystem:
+        key=(str(document_id),provider,model)
+        self._evict_expired()
+        entry=self._agents.get(key)
+        if entry is None:
+            lock=self._locks.setdefault(key,asyncio.Lock())
+            async with lock:
+                entry=self._agents.get(key)
+                if entry is None:
+                    self.misses+=1
+                    agent=await asyncio.to_thread(Neo4jRAGSystem,user_id=user_id,document_id=str(document_id),provider=provider,model=model)
+                    entry=(agent,time.monotonic())
+        else:
+            self.hits+=1
+
+        agent=entry[0]
+        self._agents[key]=(agent,time.monotonic())
+        self._agents.move_to_end(key)
+        while len(self._agents)>self.max_size:
+            evicted,_=self._agents.popitem(last=False)
+            self._locks.pop(evicted,None)
+        return agent
+
+    def stats(self)->Dict[str,int]:
+        return {"size":len(self._agents),"hits":self.hits,"misses":self.misses}
+
+
+agent_pool=AgentPool()
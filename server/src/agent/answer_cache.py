@@ -0,0 +1,164 @@
+"""
+Redis cache of agent answers for /agent/session/ask.
+
+Answers are keyed by (document_id, graph version, provider, model, normalized question):
+ - answer:{document_id}:{version}:{provider}:{model}:{question hash} -> answer json
+ - answer:index:{document_id}:{version}:{provider}:{model}          -> hash of question hash -> embedding
+
+Re-ingestion bumps the graph version (see graph_version.py), so answers computed on the
+old graph are never served again and simply expire after ANSWER_CACHE_TTL.
+
+With ANSWER_CACHE_SEMANTIC=1 an exact miss falls back to the most similar cached question
+of the same scope (cosine similarity of local embeddings >= ANSWER_CACHE_SIMILARITY).
+"""
+import asyncio
+import hashlib
+import json
+import math
+import os
+import re
+import unicodedata
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+from src.database.redis_client import redis_client
+from .graph_version import get_graph_version
+from .model_registry import model_registry
+
+ANSWER_CACHE_ENABLED=os.getenv("ANSWER_CACHE_ENABLED","1")=="1"
+ANSWER_CACHE_TTL=int(os.getenv("ANSWER_CACHE_TTL",str(24*3600)))
+ANSWER_CACHE_SEMANTIC=os.getenv("ANSWER_CACHE_SEMANTIC","0")=="1"
+ANSWER_CACHE_SIMILARITY=float(os.getenv("ANSWER_CACHE_SIMILARITY","0.92"))
+# questions per scope compared on a semantic lookup
+ANSWER_CACHE_MAX_QUESTIONS=int(os.getenv("ANSWER_CACHE_MAX_QUESTIONS","500"))
+ANSWER_CACHE_EMBEDDING_PROVIDER=os.getenv("ANSWER_CACHE_EMBEDDING_PROVIDER","hugging-face")
+ANSWER_CACHE_EMBEDDING_MODEL=os.getenv("ANSWER_CACHE_EMBEDDING_MODEL","sentence-transformers/all-MiniLM-L6-v2")
+
+
+def normalize_question(question:str)->str:
+    text=unicodedata.normalize("NFKC",question).lower()
+    text=re.sub(r"\s+"," ",text).strip()
+    # "What is X?" and "what is x" are the same question
+    return text.rstrip("?!. ")
+
+
+def _unit(vector:List[float])->array:
+    norm=math.sqrt(sum(v*v for v in vector)) or 1.0
+    return array("f",(v/norm for v in vector))
+
+
+def _embed_sync(question:str)->array:
+    # loading the model on first use and encoding are both blocking
+    embedding=model_registry.get_embedding(ANSWER_CACHE_EMBEDDING_PROVIDER,ANSWER_CACHE_EMBEDDING_MODEL)
+    return _unit(embedding.embed_query(question))
+
+
+def _most_similar(vector:array,index:Dict[Any,bytes])->Tuple[Optional[Any],float]:
+    """Field of the indexed unit vector with the highest cosine similarity to `vector`"""
+    best_field,best=None,-1.0
+    for field,packed in index.items():
+        candidate=array("f")
+        candidate.frombytes(packed)
+        if len(candidate)!=len(vector):
+            continue
+        similarity=sum(a*b for a,b in zip(vector,candidate))
+        if similarity>best:
+            best_field,best=field,similarity
+    return best_field,best
+
+
+class AnswerLookup:
+    """Result of AnswerCache.get, passed back to AnswerCache.set on a miss"""
+
+    def __init__(self,scope:Optional[str],question_hash:str) -> None:
+        self.scope=scope
+        self.question_hash=question_hash
+        self.answer:Optional[Any]=None
+        self.similarity:Optional[float]=None
+        self.vector:Optional[array]=None
+
+
+class AnswerCache:
+    def __init__(self,ttl:int=ANSWER_CACHE_TTL,semantic:bool=ANSWER_CACHE_SEMANTIC,threshold:float=ANSWER_CACHE_SIMILARITY) -> None:
+        self.ttl=ttl
+        self.semantic=semantic
+        self.threshold=threshold
+        self.hits=0
+        self.semantic_hits=0
+        self.misses=0
+
+    def _answer_key(self,scope:str,question_hash:str)->str:
+        return f"answer:{scope}:{question_hash}"
+
+    def _index_key(self,scope:str)->str:
+        return f"answer:index:{scope}"
+
+    async def _embed(self,question:str)->array:
+        return await asyncio.to_thread(_embed_sync,question)
+
+    async def get(self,document_id,provider:str,model:str,question:str)->AnswerLookup:
+        normalized=normalize_question(question)
+        question_hash=hashlib.sha256(normalized.encode()).hexdigest()
+        if not ANSWER_CACHE_ENABLED:
+            return AnswerLookup(None,question_hash)
+        version=await get_graph_version(document_id)
+        if version<0:
+            # redis unavailable: no caching
+            return AnswerLookup(None,question_hash)
+        lookup=AnswerLookup(f"{document_id}:{version}:{provider}:{model}",question_hash)
+        try:
+            data=await redis_client.get(self._answer_key(lookup.scope,question_hash))  # type: ignore
+            if data is not None:
+                self.hits+=1
+                lookup.answer=json.loads(data)
+                return lookup
+            if self.semantic:
+                await self._get_similar(lookup,normalized)
+        except Exception as e:
+            print(f"Answer cache read error: {e}")
+        if lookup.answer is None:
+            self.misses+=1
+        return lookup
+
+    async def _get_similar(self,lookup:AnswerLookup,normalized:str):
+        assert lookup.scope is not None
+        lookup.vector=await self._embed(normalized)
+        index=await redis_client.hgetall(self._index_key(lookup.scope))  # type: ignore
+        best_hash,best=await asyncio.to_thread(_most_similar,lookup.vector,index)
+        if best_hash is None or best<self.threshold:
+            return
+        best_hash=best_hash.decode() if isinstance(best_hash,bytes) else best_hash
+        data=await redis_client.get(self._answer_key(lookup.scope,best_hash))
+        if data is not None:
+            self.semantic_hits+=1
+            lookup.answer=json.loads(data)
+            lookup.similarity=best
+
+    async def set(self,lookup:AnswerLookup,answer:Any)->None:
+        if lookup.scope is None:
+            return
+        try:
+            index_key=self._index_key(lookup.scope)
+            # the first ANSWER_CACHE_MAX_QUESTIONS questions of a scope keep a semantic lookup bounded
+            indexed=(self.semantic and lookup.vector is not None
+                and await redis_client.hlen(index_key)<ANSWER_CACHE_MAX_QUESTIONS)  # type: ignore
+            async with redis_client.pipeline(transaction=True) as pipe:
+                pipe.setex(self._answer_key(lookup.scope,lookup.question_hash),self.ttl,json.dumps(answer,default=str))
+                if indexed:
+                    pipe.hset(index_key,lookup.question_hash,lookup.vector.tobytes())  # type: ignore
+                    pipe.expire(index_key,self.ttl)
+                await pipe.execute()
+        except Exception as e:
+            print(f"Answer cache write error: {e}")
+
+    def stats(self)->Dict[str,Any]:
+        total=self.hits+self.semantic_hits+self.misses
+        return {
+            "hits":self.hits,
+            "semantic_hits":self.semantic_hits,
+            "misses":self.misses,
+            "hit_rate":(self.hits+self.semantic_hits)/total if total else 0.0,
+            "semantic":self.semantic,
+        }
+
+
+answer_cache=AnswerCache()
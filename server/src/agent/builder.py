@@ -1,101 +1,240 @@
 """
 File contains:
- -text extractor from pdf  
  -knowledge graph builder handler
+ -the staged ingestion pipeline behind it
 """
 
-import spacy
-
-from unstructured.partition.pdf import partition_pdf
 from .graph_store import kg_store
-from .extractor import Entity_Relation_Extractor
-import requests
-from io import BytesIO
-from .graph_tools import parse_str_to_json
-from .graph_tools import build_structured_graph
+from .extractor import EXTRACTION_MAX_IN_FLIGHT, EXTRACTION_PROMPT_VERSION, STRUCTURE_PROMPT_VERSION, Entity_Relation_Extractor, TripleReducer, coverage_metrics
+from .graph_tools import build_structured_graph, build_structured_graph_stream, parse_str_to_json, replace_structured_graph_tx
+from .partitioner import download_pdf, partition_pdf_bytes_async
+from .extraction_cache import content_hash, extraction_cache
+from .model_registry import model_registry
+from .graph_version import bump_graph_version
+from .pipeline import Pipeline, PipelineContext, Stage
+from typing import Any, Dict, List, Optional
+import asyncio
 import os
 import time
 
-
-
-def clean_text(text: str) -> str:
-    text = text.replace("“", '"').replace("”", '"').replace("‘", "'").replace("’", "'")
-    return text
-
-def extract_text_from_pdf(url: str, quality: str) -> str:
-    """Extraction using unstructured: returns a single string with page markers"""
-    response = requests.get(url, allow_redirects=True)
-    response.raise_for_status()  
-    pdf_bytes = response.content
-    pdf_file_like = BytesIO(pdf_bytes)
-    elements = partition_pdf(
-        file=pdf_file_like,
-        strategy="hi_res" if quality == "H" else "fast",
-        infer_table_structure=True if quality == "H" else False,
-        languages=['english']  
-    )
-    pages = {}
-    # Group text by page
-    for el in elements:
-        if hasattr(el, "text") and el.text.strip():
-            page = getattr(el.metadata, "page_number", 0)
-            pages.setdefault(page, []).append((el.category, el.text.strip()))
-
-    # Combine each page into a single string with page marker
-    all_text = ""
-    for page, items in sorted(pages.items()):
-        all_text += f"{{PAGE {page}}}\\n"
-        for category, text in items:
-            cleaned_text = clean_text(text)  # clean each text block
-            all_text += f"[{category}] {cleaned_text}\\n"
-        all_text += "\\n"
-
-    return all_text
-
-
-
-
-async def build_knowledge_graph(pdf_path: str,document_id:str,provider:str,model:str,quality:str):
-    """Build knowledge graph from PDF"""
-
-    nlp = spacy.load("en_core_web_sm")
-    print(f"Reading: {pdf_path}")
-    start=time.perf_counter()
-    text = extract_text_from_pdf(pdf_path,quality)
-    end=time.perf_counter()
-
-  
-  
-    print(f"✓ Extracted {len(text):,} characters\n")
-    # Extract relationships
-    extractor = Entity_Relation_Extractor(nlp_model=nlp, use_llm=True,provider=provider,model=model)
-    
-
+# diff against the stored graph instead of merging everything on re-ingestion
+INGESTION_INCREMENTAL=os.getenv("INGESTION_INCREMENTAL","1")=="1"
+
+# tiered ingestion (off by default): uploads are indexed with the fast partitioning strategy
+# first, then a background hi_res job rebuilds the document and swaps its graph in (see
+# src/ingestion/worker.py). Chunks are page aligned and keyed by their text, so the upgrade
+# only sends the pages whose hi_res text differs from the fast text (plus the single structure
+# call) to the llm; the others reuse the fast tier's cached chunk triples.
+INGESTION_TIERED=os.getenv("INGESTION_TIERED","0")=="1"
+FAST_QUALITY="F"
+HI_RES_QUALITY="H"
+
+PIPELINE_QUEUE_SIZE=int(os.getenv("PIPELINE_QUEUE_SIZE","64"))
+PIPELINE_DOWNLOAD_WORKERS=int(os.getenv("PIPELINE_DOWNLOAD_WORKERS","4"))
+PIPELINE_PARTITION_WORKERS=int(os.getenv("PIPELINE_PARTITION_WORKERS","2"))
+PIPELINE_CHUNK_WORKERS=int(os.getenv("PIPELINE_CHUNK_WORKERS","2"))
+PIPELINE_EXTRACT_WORKERS=int(os.getenv("PIPELINE_EXTRACT_WORKERS",str(EXTRACTION_MAX_IN_FLIGHT)))
+PIPELINE_WRITE_WORKERS=int(os.getenv("PIPELINE_WRITE_WORKERS","4"))
+
+
+class DocumentContext(PipelineContext):
+    """One build_knowledge_graph call as it moves through the ingestion pipeline"""
+
+    def __init__(self,pdf_path:str,document_id:str,provider:str,model:str,quality:str,on_progress,file_hash:Optional[str],incremental:bool,upgrade:bool,on_download=None) -> None:
+        super().__init__()
+        self.pdf_path=pdf_path
+        self.document_id=document_id
+        self.provider=provider
+        self.model=model
+        self.quality=quality
+        self.on_progress=on_progress
+        self.file_hash=file_hash
+        self.incremental=incremental
+        self.upgrade=upgrade
+        self.on_download=on_download
+        self.text:Optional[str]=None
+        self.extractor:Optional[Entity_Relation_Extractor]=None
+        self.structure:Optional[asyncio.Task]=None
+        self.triples_key:Optional[str]=None
+        self.reducer:Optional[TripleReducer]=None
+        self.last_percent=50
+        self.start=time.perf_counter()
+
+    @property
+    def chunks_failed(self)->int:
+        # triples served from the document cache come from a complete extraction
+        return self.reducer.failed if self.reducer is not None else 0
+
+    async def report(self,stage:str,percent:int):
+        if self.on_progress is not None:
+            await self.on_progress(stage,percent)
+
+    def structure_done(self,task:asyncio.Task):
+        # fail the document right away instead of at the write stage
+        if not task.cancelled() and task.exception() is not None:
+            self.fail(task.exception())  # type: ignore
+
+    def fail(self,error:BaseException):
+        if self.structure is not None:
+            self.structure.cancel()
+        super().fail(error)
+
+
+async def _download_stage(ctx:DocumentContext,_):
+    await ctx.report("partitioning",5)
+    if ctx.file_hash:
+        ctx.text = await extraction_cache.get(extraction_cache.key("text",ctx.file_hash,ctx.quality))
+        if ctx.text is not None:
+            print(f"✓ Partitioned text cache hit for {ctx.file_hash}")
+            await ingestion_pipeline["chunk"].put(ctx)
+            return
+    print(f"Reading: {ctx.pdf_path}")
+    pdf_bytes = await download_pdf(ctx.pdf_path)
+    ctx.file_hash = content_hash(pdf_bytes)
+    if ctx.on_download is not None:
+        await ctx.on_download(pdf_bytes)
+    await ingestion_pipeline["partition"].put(ctx,pdf_bytes)
+
+
+async def _partition_stage(ctx:DocumentContext,pdf_bytes:bytes):
+    text_key = extraction_cache.key("text",ctx.file_hash,ctx.quality)
+    ctx.text = await extraction_cache.get(text_key)
+    if ctx.text is None:
+        ctx.text = await partition_pdf_bytes_async(pdf_bytes,ctx.quality)
+        await extraction_cache.set(text_key,ctx.text)
+    await ingestion_pipeline["chunk"].put(ctx)
+
+
+async def _extract_structure(ctx:DocumentContext)->Optional[Dict]:
+    """Structure nodes of the document; an upgrade only returns them, the write stage swaps them in"""
+    assert ctx.extractor is not None and ctx.text is not None
+    structure_key=extraction_cache.key("structure",ctx.file_hash,ctx.quality,STRUCTURE_PROMPT_VERSION,ctx.provider,ctx.model)
+    struct_data=await extraction_cache.get(structure_key)
+    if struct_data is not None:
+        if not ctx.upgrade:
+            await build_structured_graph(struct_data,ctx.document_id)
+        return struct_data
     s_start=time.perf_counter()
-    structure=extractor._extract_structure_with_llm(text)
+    if ctx.upgrade:
+        struct_data=parse_str_to_json(await ctx.extractor._extract_structure_with_llm_async(ctx.text))
+    else:
+        # paper/author/section nodes are written while the llm is still generating
+        struct_data=await build_structured_graph_stream(ctx.extractor._stream_structure_with_llm(ctx.text),ctx.document_id)
     s_end=time.perf_counter()
     print(f"Structure data extraction time: {s_end-s_start:.4f}")
-
-    print(structure)
-    struct_data=parse_str_to_json(structure)
-    await build_structured_graph(struct_data,document_id)
-
-    triples = await extractor.extract_from_text(text)
-    await kg_store.store_triples_batch(document_id,triples, os.path.basename(pdf_path))
-
-    print(f"PDF extraction time: {end-start:.4f} seconds ")
-
-
-    """
-    print(structure)
-    if not structure:
-        print("Failed to fetch the structured data")
+    await extraction_cache.set(structure_key,struct_data)
+    return struct_data
+
+
+async def _chunk_stage(ctx:DocumentContext,_):
+    assert ctx.text is not None
+    print(f"✓ Extracted {len(ctx.text):,} characters\n")
+    ctx.extractor = Entity_Relation_Extractor(nlp_model=model_registry.get_spacy(), use_llm=True,provider=ctx.provider,model=ctx.model)
+    await ctx.report("structure_extraction",30)
+    # the structure pass is a single llm call: it runs beside the chunk extraction
+    ctx.structure=asyncio.ensure_future(_extract_structure(ctx))
+    ctx.structure.add_done_callback(ctx.structure_done)
+    ctx.triples_key=extraction_cache.key("triples",ctx.file_hash,ctx.quality,EXTRACTION_PROMPT_VERSION,ctx.provider,ctx.model)
+    triples = await extraction_cache.get(ctx.triples_key)
+    if triples is not None:
+        await ingestion_pipeline["write"].put(ctx,triples)
+        return
+    if not ctx.extractor.llm:
+        print("=== No LLM initialized ===")
+        await ingestion_pipeline["write"].put(ctx,[])
         return
-    
+    chunks = ctx.extractor.chunk_document(ctx.text)
+    ctx.reducer = TripleReducer(ctx.extractor,chunks)
+    if not chunks:
+        await ingestion_pipeline["write"].put(ctx,[])
+        return
+    print(f"Extracting relationships from {len(chunks)} chunks...")
+    # blocks while the extract queue is full, which in turn stalls partitioning
+    for chunk in chunks:
+        await ingestion_pipeline["extract"].put(ctx,chunk)
+
+
+async def _extract_stage(ctx:DocumentContext,chunk:str):
+    assert ctx.extractor is not None and ctx.reducer is not None
+    chunk_triples,cached = await ctx.extractor.extract_chunk(chunk)
+    complete = ctx.reducer.add(chunk,chunk_triples,cached)
+    # triple extraction spans 50% -> 85%
+    percent = 50+(35*ctx.reducer.done)//max(1,ctx.reducer.total)
+    if percent != ctx.last_percent:
+        ctx.last_percent = percent
+        await ctx.report("triple_extraction",percent)
+    if complete:
+        triples = ctx.reducer.triples()
+        # a partial extraction is not cached, so a retry re-runs the failed chunks
+        if not ctx.reducer.failed:
+            await extraction_cache.set(ctx.triples_key,triples)
+        await ingestion_pipeline["write"].put(ctx,triples)
+
+
+async def _write_stage(ctx:DocumentContext,triples:List[Dict[str,Any]]):
+    assert ctx.structure is not None
+    await ctx.report("storing",85)
+    source = os.path.basename(ctx.pdf_path)
+    if ctx.upgrade:
+        if ctx.chunks_failed:
+            # keep serving the complete fast tier graph; the job is retried
+            raise RuntimeError(f"hi_res upgrade incomplete: {ctx.chunks_failed}/{ctx.reducer.total} chunks failed")
+        struct_data = await ctx.structure
+        # triples and structure nodes change in one transaction, then caches see the new version
+        await kg_store.swap_triples(
+            ctx.document_id,triples,source,
+            before=lambda tx: replace_structured_graph_tx(tx,struct_data,ctx.document_id)
+        )
+        await bump_graph_version(ctx.document_id)
+    elif ctx.incremental:
+        # failed chunks must not read as deleted triples
+        diff = await kg_store.sync_triples(ctx.document_id,triples, source, partial=ctx.chunks_failed>0)
+        if diff["insert"] or diff["update"] or diff["delete"]:
+            await bump_graph_version(ctx.document_id)
+    else:
+        await kg_store.store_triples_batch(ctx.document_id,triples, source)
+        await bump_graph_version(ctx.document_id)
+    # usually done long before the last chunk; a failure fails the document
+    await ctx.structure
+    print(f"PDF ingestion time: {time.perf_counter()-ctx.start:.4f} seconds ")
+    await ctx.report("completed",100)
+    ctx.resolve(kg_store)
+
+
+# download -> partition -> chunk -> extract (per chunk) -> write, shared by every
+# build of the process so stages overlap across chunks and documents
+ingestion_pipeline=Pipeline([
+    Stage("download",_download_stage,PIPELINE_DOWNLOAD_WORKERS,PIPELINE_QUEUE_SIZE),
+    Stage("partition",_partition_stage,PIPELINE_PARTITION_WORKERS,PIPELINE_QUEUE_SIZE),
+    Stage("chunk",_chunk_stage,PIPELINE_CHUNK_WORKERS,PIPELINE_QUEUE_SIZE),
+    Stage("extract",_extract_stage,PIPELINE_EXTRACT_WORKERS,PIPELINE_QUEUE_SIZE),
+    Stage("write",_write_stage,PIPELINE_WRITE_WORKERS,PIPELINE_QUEUE_SIZE),
+],extra_metrics={"coverage":coverage_metrics.stats})
+
+
+async def build_knowledge_graph(pdf_path: str,document_id:str,provider:str,model:str,quality:str,on_progress=None,file_hash:Optional[str]=None,incremental:bool=INGESTION_INCREMENTAL,upgrade:bool=False,on_download=None):
+    """Build knowledge graph from PDF
+
+    on_progress: optional async callback(stage, percent) used by the ingestion worker
+    to report progress; raising from it aborts the build.
+    file_hash: sha256 of the pdf bytes if already known (skips the download on a cache hit).
+    incremental: only write the difference between the stored and the extracted triples.
+    upgrade: rebuild of an already indexed document (hi_res after the fast tier); the new
+    triples and structure replace the old ones atomically once extraction is complete.
+    on_download: optional async callback(pdf_bytes), called if the pdf had to be downloaded,
+    so callers can reuse the bytes instead of fetching the pdf again.
+
+    The document is submitted to the process wide ingestion_pipeline; this returns once
+    its write stage completed (or raises the error of the stage that failed).
     """
-    
-    # Store
-   
-
-    return kg_store
-
+    ingestion_pipeline.start()
+    ctx=DocumentContext(pdf_path,document_id,provider,model,quality,on_progress,file_hash,incremental,upgrade,on_download)
+    try:
+        await ingestion_pipeline["download"].put(ctx)
+        return await ctx.future
+    finally:
+        # cancelled or failed: remaining items of the document are dropped by the stages
+        if not ctx.future.done():
+            ctx.future.cancel()
+        if ctx.structure is not None and not ctx.structure.done():
+            ctx.structure.cancel()
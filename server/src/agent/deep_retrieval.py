@@ -0,0 +1,149 @@
+"""
+Retrieval for deep mode: instead of putting the whole pdf into the prompt, index the
+document's pages into page-aware chunks and send only the top-k passages.
+
+ - lexical ranking with an in-process BM25 index (no extra dependency)
+ - optional semantic ranking with local embeddings from Embedding_Factory,
+   fused with BM25 by reciprocal rank (DEEP_RETRIEVAL_EMBEDDINGS=1)
+ - one index per document, built lazily and kept in a process level LRU
+"""
+import asyncio
+import math
+import os
+import re
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from .model_registry import model_registry
+
+DEEP_CHUNK_SIZE=int(os.getenv("DEEP_CHUNK_SIZE","1200"))
+DEEP_CHUNK_OVERLAP=int(os.getenv("DEEP_CHUNK_OVERLAP","200"))
+DEEP_TOP_K=int(os.getenv("DEEP_TOP_K","8"))
+DEEP_INDEX_CACHE_SIZE=int(os.getenv("DEEP_INDEX_CACHE_SIZE","64"))
+DEEP_RETRIEVAL_EMBEDDINGS=os.getenv("DEEP_RETRIEVAL_EMBEDDINGS","0")=="1"
+DEEP_EMBEDDING_PROVIDER=os.getenv("DEEP_EMBEDDING_PROVIDER","hugging-face")
+DEEP_EMBEDDING_MODEL=os.getenv("DEEP_EMBEDDING_MODEL","sentence-transformers/all-MiniLM-L6-v2")
+
+_TOKEN_RE=re.compile(r"[a-z0-9]+")
+_STOPWORDS={
+    "a","an","the","and","or","of","to","in","on","for","with","by","is","are","was","were",
+    "be","been","this","that","these","those","it","its","as","at","from","what","which",
+    "how","why","does","do","paper","about"
+}
+
+
+def tokenize(text:str)->List[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS and len(t)>1]
+
+
+def chunk_pages(pages:List[str],chunk_size:int=DEEP_CHUNK_SIZE,chunk_overlap:int=DEEP_CHUNK_OVERLAP)->List[Dict[str,Any]]:
+    """Split each page separately so every chunk keeps its page number"""
+    splitter=RecursiveCharacterTextSplitter(chunk_size=chunk_size,chunk_overlap=chunk_overlap)
+    chunks=[]
+    for page_number,page_text in enumerate(pages,start=1):
+        if not page_text.strip():
+            continue
+        for text in splitter.split_text(page_text):
+            chunks.append({"id":len(chunks),"page":page_number,"text":text})
+    return chunks
+
+
+class BM25Index:
+    def __init__(self,documents:List[str],k1:float=1.5,b:float=0.75) -> None:
+        self.k1=k1
+        self.b=b
+        self.term_freqs=[Counter(tokenize(doc)) for doc in documents]
+        self.doc_lengths=[sum(tf.values()) for tf in self.term_freqs]
+        self.avg_length=(sum(self.doc_lengths)/len(self.doc_lengths)) if self.doc_lengths else 0.0
+        doc_freq=Counter(term for tf in self.term_freqs for term in tf)
+        n=len(documents)
+        self.idf={term:math.log(1+(n-df+0.5)/(df+0.5)) for term,df in doc_freq.items()}
+
+    def scores(self,query:str)->List[float]:
+        terms=tokenize(query)
+        scores=[]
+        for tf,length in zip(self.term_freqs,self.doc_lengths):
+            score=0.0
+            norm=self.k1*(1-self.b+self.b*length/(self.avg_length or 1))
+            for term in terms:
+                freq=tf.get(term)
+                if freq:
+                    score+=self.idf[term]*freq*(self.k1+1)/(freq+norm)
+            scores.append(score)
+        return scores
+
+
+def _get_embedding_model():
+    return model_registry.get_embedding(DEEP_EMBEDDING_PROVIDER,DEEP_EMBEDDING_MODEL)
+
+
+def _cosine(a:List[float],b:List[float])->float:
+    dot=sum(x*y for x,y in zip(a,b))
+    norm=math.sqrt(sum(x*x for x in a))*math.sqrt(sum(y*y for y in b))
+    return dot/norm if norm else 0.0
+
+
+class DocumentChunkIndex:
+    """Page-aware chunk index of one document"""
+
+    def __init__(self,pages:List[str],use_embeddings:bool=DEEP_RETRIEVAL_EMBEDDINGS) -> None:
+        self.chunks=chunk_pages(pages)
+        self.bm25=BM25Index([chunk["text"] for chunk in self.chunks])
+        self.use_embeddings=use_embeddings
+        self.vectors:Optional[List[List[float]]]=None
+
+    async def _ensure_vectors(self):
+        if self.vectors is None:
+            texts=[chunk["text"] for chunk in self.chunks]
+            self.vectors=await asyncio.to_thread(_get_embedding_model().embed_documents,texts)
+
+    async def search(self,query:str,k:int=DEEP_TOP_K)->List[Dict[str,Any]]:
+        if not self.chunks:
+            return []
+        bm25_scores=self.bm25.scores(query)
+        ranked=sorted(range(len(self.chunks)),key=lambda i:bm25_scores[i],reverse=True)
+
+        if self.use_embeddings:
+            await self._ensure_vectors()
+            query_vector=await asyncio.to_thread(_get_embedding_model().embed_query,query)
+            semantic=[_cosine(query_vector,vector) for vector in self.vectors]  # type: ignore
+            semantic_ranked=sorted(range(len(self.chunks)),key=lambda i:semantic[i],reverse=True)
+            # reciprocal rank fusion
+            fused:Dict[int,float]={}
+            for ranking in (ranked,semantic_ranked):
+                for rank,i in enumerate(ranking):
+                    fused[i]=fused.get(i,0.0)+1/(60+rank)
+            ranked=sorted(fused,key=lambda i:fused[i],reverse=True)
+
+        top=ranked[:k]
+        # keep reading order in the prompt
+        return [self.chunks[i] for i in sorted(top)]
+
+
+def format_passages(chunks:List[Dict[str,Any]])->str:
+    return "\n\n".join(f"{{PAGE {chunk['page']}}}\n{chunk['text']}" for chunk in chunks)
+
+
+class ChunkIndexCache:
+    def __init__(self,max_size:int) -> None:
+        self.max_size=max_size
+        self._items:OrderedDict[str,DocumentChunkIndex]=OrderedDict()
+
+    async def get_or_build(self,document_id,pages:List[str])->DocumentChunkIndex:
+        key=str(document_id)
+        index=self._items.get(key)
+        if index is None:
+            index=await asyncio.to_thread(DocumentChunkIndex,pages)
+            self._items[key]=index
+        self._items.move_to_end(key)
+        while len(self._items)>self.max_size:
+            self._items.popitem(last=False)
+        return index
+
+
+chunk_index_cache=ChunkIndexCache(DEEP_INDEX_CACHE_SIZE)
+
+
+async def retrieve_passages(document_id,pages:List[str],query:str,k:int=DEEP_TOP_K)->str:
+    index=await chunk_index_cache.get_or_build(document_id,pages)
+    return format_passages(await index.search(query,k))
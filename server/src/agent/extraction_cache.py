@@ -0,0 +1,111 @@
+"""
+Content addressed cache for ingestion artifacts.
+
+Entries are keyed by the sha256 of the uploaded pdf bytes so re-uploads of the same
+paper skip partitioning and both LLM passes:
+ - text      -> partitioned text, keyed by (hash, quality)
+ - structure -> parsed structure json, keyed by (hash, quality, structure prompt version, provider, model)
+ - triples   -> extracted triples, keyed by (hash, quality, prompt version, provider, model)
+ - chunk     -> triples of one LLM chunk, keyed by (chunk text hash, prompt version, provider, model)
+
+Values are gzip compressed json in redis. A sorted set tracks last access time, a hash
+tracks entry sizes and a counter keeps their running total, so a write costs O(log n)
+and evicts least recently used entries only once EXTRACTION_CACHE_MAX_MB is exceeded.
+Reads refresh the TTL, so an entry expires after EXTRACTION_CACHE_TTL seconds without
+access; writes also drop index entries of expired values so the total does not drift.
+"""
+import gzip
+import hashlib
+import json
+import os
+import time
+from typing import Any, Optional
+from src.database.redis_client import redis_client
+
+EXTRACTION_CACHE_MAX_MB=int(os.getenv("EXTRACTION_CACHE_MAX_MB","512"))
+EXTRACTION_CACHE_TTL=int(os.getenv("EXTRACTION_CACHE_TTL",str(30*24*3600)))
+
+
+def content_hash(pdf_bytes:bytes)->str:
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+
+# KEYS: entry, lru zset, sizes hash, byte total
+# ARGV: data, ttl, now, max bytes, max entries expired/evicted per write
+_SET_SCRIPT="""
+if redis.call('EXISTS', KEYS[4]) == 0 then
+    local total = 0
+    for _, size in ipairs(redis.call('HVALS', KEYS[3])) do total = total + tonumber(size) end
+    redis.call('SET', KEYS[4], total)
+end
+local function drop(key)
+    local size = tonumber(redis.call('HGET', KEYS[3], key) or '0')
+    redis.call('DEL', key)
+    redis.call('ZREM', KEYS[2], key)
+    redis.call('HDEL', KEYS[3], key)
+    return redis.call('DECRBY', KEYS[4], size)
+end
+local old = tonumber(redis.call('HGET', KEYS[3], KEYS[1]) or '0')
+local size = string.len(ARGV[1])
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+redis.call('ZADD', KEYS[2], ARGV[3], KEYS[1])
+redis.call('HSET', KEYS[3], KEYS[1], size)
+local total = redis.call('INCRBY', KEYS[4], size - old)
+-- not accessed for ttl seconds: the value expired, only its index entries are left
+local cutoff = tonumber(ARGV[3]) - tonumber(ARGV[2])
+for _, key in ipairs(redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', cutoff, 'LIMIT', 0, ARGV[5])) do
+    if redis.call('EXISTS', key) == 0 then total = drop(key) end
+end
+local evicted = 0
+while total > tonumber(ARGV[4]) and evicted < tonumber(ARGV[5]) do
+    local oldest = redis.call('ZRANGE', KEYS[2], 0, 0)[1]
+    if not oldest or oldest == KEYS[1] then break end
+    total = drop(oldest)
+    evicted = evicted + 1
+end
+return total
+"""
+# bounds the work of a single write; a large overshoot is evicted over the next writes
+_SWEEP_BATCH=64
+
+
+class ExtractionCache:
+    """Size bounded LRU cache of partition/LLM outputs in redis"""
+
+    def __init__(self,prefix:str="extraction",max_bytes:int=EXTRACTION_CACHE_MAX_MB*1024*1024,ttl:int=EXTRACTION_CACHE_TTL) -> None:
+        self.prefix=prefix
+        self.max_bytes=max_bytes
+        self.ttl=ttl
+        self.index_key=f"{prefix}:lru"
+        self.sizes_key=f"{prefix}:sizes"
+        self.total_key=f"{prefix}:bytes"
+
+    def key(self,artifact:str,*parts:str)->str:
+        return f"{self.prefix}:{artifact}:{':'.join(parts)}"
+
+    async def get(self,key:str)->Optional[Any]:
+        try:
+            data=await redis_client.get(key)
+            if data is None:
+                return None
+            async with redis_client.pipeline(transaction=False) as pipe:
+                pipe.zadd(self.index_key,{key:time.time()})
+                pipe.expire(key,self.ttl)
+                await pipe.execute()
+            return json.loads(gzip.decompress(data))
+        except Exception as e:
+            print(f"Extraction cache read error: {e}")
+            return None
+
+    async def set(self,key:str,value:Any)->None:
+        try:
+            data=gzip.compress(json.dumps(value,default=str).encode())
+            await redis_client.eval(  # type: ignore
+                _SET_SCRIPT,4,key,self.index_key,self.sizes_key,self.total_key,
+                data,self.ttl,time.time(),self.max_bytes,_SWEEP_BATCH
+            )
+        except Exception as e:
+            print(f"Extraction cache write error: {e}")
+
+
+extraction_cache=ExtractionCache()
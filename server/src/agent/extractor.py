@@ -5,12 +5,29 @@ File contains:
     - if sentences are below 5000 character then llm extraction will be appended with manual extraction.
 """
 import re
-from typing import Dict,List,Any
+import os
+from typing import Dict,List,Any,Optional,AsyncIterator,Tuple
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 import json
 from .model_factory import ModelFactory
-import asyncio
+from .extraction_cache import content_hash, extraction_cache
+from .llm_scheduler import PRIORITY_INGESTION, estimate_tokens, llm_scheduler
+
+# bump whenever the triple extraction prompt or the per-triple cleaning changes,
+# so cached chunk triples from the old prompt are not reused
+EXTRACTION_PROMPT_VERSION="v1"
+# same for the structure (paper/authors/sections) prompt and its json parsing
+STRUCTURE_PROMPT_VERSION="v1"
+
+EXTRACTION_CHUNK_SIZE=int(os.getenv("EXTRACTION_CHUNK_SIZE","5500"))
+# chunks being processed (cache lookup + scheduled llm call) at once by the ingestion
+# pipeline's extract stage; the llm scheduler still bounds the calls actually in flight
+EXTRACTION_MAX_IN_FLIGHT=int(os.getenv("EXTRACTION_MAX_IN_FLIGHT","32"))
+
+# the {PAGE X} markers and [Category] labels of the partitioned text (see partitioner.py)
+_PAGE_SPLIT=re.compile(r"(?=\{PAGE \d+\})")
+_CATEGORY_LABEL=re.compile(r"\[[A-Za-z]+\] ")
 
 class Entity_Relation_Extractor:
     """Extract high-quality relationships with proper relations"""
@@ -18,32 +35,30 @@ class Entity_Relation_Extractor:
     def __init__(self, nlp_model, use_llm: bool = True,provider:str="gemini",model:str="gemini-2.5-flash"):
         self.nlp = nlp_model
         self.use_llm = use_llm
+        self.provider = provider
+        self.model = model
         self.llm = None
+        self._prompt: Optional[ChatPromptTemplate] = None
         try:
             self.llm = ModelFactory.create_chat_model(provider,model,0.3)
             print("✓ LLM initialized for extraction\n")
         except Exception as e:
             print(f"LLM not available: {e}\n")
     
-    async def extract_from_text(self, text: str) -> List[Dict[str,Any]]:
-        """Extract relationships from text with proper cleaning"""
-        print("Extracting relationships...")
-        
-        # Clean text first
-        text = self._clean_text(text)
-        
-        
-        all_triples = []
-        print("Using LLM for enhanced extraction...")
-        llm_triples = await self._extract_with_llm_async(text)
-        all_triples.extend(llm_triples)
-        
-        # Post-process
-        processed = self._post_process(all_triples)
-        
-        print(f"✓ Extracted {len(processed)} high-quality relationships\n")
-        return processed
-    
+    def chunk_document(self, text: str) -> List[str]:
+        """
+        Cleaned text split into the chunks sent to extract_chunk.
+        Chunks never span pages and leave out the [Category] labels, which depend on the
+        partitioning strategy: a page whose text the fast and hi_res tiers agree on yields
+        the same chunks, so the hi_res upgrade reuses their cached triples.
+        """
+        chunks = []
+        for page in _PAGE_SPLIT.split(text):
+            page = self._clean_text(_CATEGORY_LABEL.sub("", page))
+            if page:
+                chunks.extend(self._chunk_text(page))
+        return chunks
+
     def _clean_text(self, text: str) -> str:
         """Clean text before processing"""
         # Remove multiple spaces
@@ -69,32 +84,24 @@ class Entity_Relation_Extractor:
         
         return text.strip()
     
-    def _chunk_text(self, text: str, max_length: int,max_chunks:int=10,min_chunk_size:int=1000) -> List[str]:
-        """Split text into chunks""" 
-        text_length=len(text)
-        chunk_size=max(min_chunk_size,text_length // max_chunks)
+    def _chunk_text(self, text: str, max_length: int = EXTRACTION_CHUNK_SIZE) -> List[str]:
+        """Split text into chunks of at most max_length characters
 
-        overlap=min(500,int(chunk_size * 0.1))
+        The chunk size does not depend on the document length, so long papers produce
+        more chunks instead of bigger ones, and unchanged text keeps its chunk boundaries.
+        """
+        overlap=min(500,int(max_length * 0.1))
         splitter = RecursiveCharacterTextSplitter(
-                chunk_size=chunk_size,
+                chunk_size=max_length,
                 chunk_overlap=overlap,
                 separators=["\n\n","\n",""," "],
                 is_separator_regex=False,
                 )
-        chunks = splitter.split_text(text)
-        while len(chunks) > max_chunks:
-            # Merge last two chunks
-            chunks[-2] = chunks[-2] + chunks[-1]
-            chunks.pop()
-
-        return chunks
+        return splitter.split_text(text)
 
 
     
-    def _extract_structure_with_llm(self,text:str)->str:
-        
-        if not self.llm:
-          return ""
+    def _structure_prompt(self)->ChatPromptTemplate:
         section_extraction_prompt = ChatPromptTemplate.from_messages([
     ("system", '''You are an expert at analyzing academic paper structure and extracting ONLY the most important sections.
 
@@ -227,11 +234,33 @@ REMEMBER: Quality over quantity. 5 well-extracted important sections is better t
 ])
 
 
-        
-        chain=section_extraction_prompt | self.llm 
-        response=chain.invoke({"text":text})
+        return section_extraction_prompt
 
+    async def _extract_structure_with_llm_async(self,text:str)->str:
+        """Non blocking variant, scheduled like the triple extraction calls"""
+        if not self.llm:
+          return ""
+        chain=self._structure_prompt() | self.llm
+        response=await llm_scheduler.run(
+            self.provider, lambda: chain.ainvoke({"text":text}),
+            priority=PRIORITY_INGESTION, tokens=estimate_tokens(text)
+        )
         return str(response.content)
+
+    async def _stream_structure_with_llm(self,text:str)->AsyncIterator[str]:
+        """Yields the structure json as it is generated, so sections can be stored before the answer is complete"""
+        if not self.llm:
+          return
+        chain=self._structure_prompt() | self.llm
+        stream=llm_scheduler.stream(
+            self.provider, lambda: chain.astream({"text":text}),
+            priority=PRIORITY_INGESTION, tokens=estimate_tokens(text)
+        )
+        async for chunk in stream:
+            content=chunk.content
+            if isinstance(content,list):
+                content="".join(part if isinstance(part,str) else part.get("text","") for part in content)
+            yield str(content)
     
     def _clean_entity(self, text: str) -> str:
         """Clean and normalize entity"""
@@ -303,17 +332,9 @@ REMEMBER: Quality over quantity. 5 well-extracted important sections is better t
         
         return unique
 
-    async def _extract_with_llm_async(self, text: str) -> List[Dict[str, Any]]:
-      """Use LLM for high-quality extraction with async parallel processing"""
-      if not self.llm:
-          print("=== No LLM initialized ===")
-          return []
-      
-      chunks = self._chunk_text(text, 5500)
-      
-      # Reduce chunk processing if needed
-      chunks_to_process = chunks[:10]
-      
+    def _triple_prompt(self)->ChatPromptTemplate:
+      if self._prompt is not None:
+          return self._prompt
       prompt = ChatPromptTemplate.from_messages([
                 ("system", """
 You are an expert knowledge graph engineer extracting precise, formal relationships from academic and technical documents with SOURCE ATTRIBUTION.
@@ -390,76 +411,164 @@ Text:
 
 Return ONLY the JSON object with triples array (no markdown, no explanation):""")
             ])
+      self._prompt = prompt
+      return prompt
+
+    async def extract_chunk(self, chunk: str) -> Tuple[Optional[List[Dict[str, Any]]], bool]:
+      """Triples of a single chunk (None when the chunk failed) and whether they came from the cache"""
+      chunk_triples = []  # Initialize here, not after try
+      # unchanged chunks of a re-ingested or retried document are not sent again
+      chunk_key = extraction_cache.key(
+          "chunk", content_hash(chunk.encode()), EXTRACTION_PROMPT_VERSION, self.provider, self.model
+      )
+      cached = await extraction_cache.get(chunk_key)
+      if cached is not None:
+          return cached, True
+      try:
+          chain = self._triple_prompt() | self.llm # type: ignore
+            
+          print("calling api .....")
+          # bounded, rate limited and retried on 429s by the shared scheduler
+          response = await llm_scheduler.run(
+              self.provider, lambda: chain.ainvoke({"text": chunk}),
+              priority=PRIORITY_INGESTION, tokens=estimate_tokens(chunk)
+          )
+          
+          content = str(response.content).strip()
+          
+          print(content)
+          # Remove markdown
+          if "```json" in content:
+              content = content.split("```json")[1].split("```")[0]
+          elif "```" in content:
+              content = content.split("```")[1].split("```")[0]
+          
+          # Parse JSON
+          triples_data = json.loads(content)
       
-      async def process_chunk(chunk: str) -> List[Dict[str, Any]]:
-          """Process a single chunk asynchronously"""
-          chunk_triples = []  # Initialize here, not after try
-          try:
-              chain = prompt | self.llm # type: ignore
-                
-              print("calling api .....")
-              response = await chain.ainvoke({"text": chunk})
-              
-              content = str(response.content).strip()
-              
-              print(content)
-              # Remove markdown
-              if "```json" in content:
-                  content = content.split("```json")[1].split("```")[0]
-              elif "```" in content:
-                  content = content.split("```")[1].split("```")[0]
-              
-              # Parse JSON
-              triples_data = json.loads(content)
+
+          if isinstance(triples_data, dict) and "triples" in triples_data:
+                for triple in triples_data["triples"]:
+                    # Clean entities carefully
+                    sub = self._clean_entity(triple.get("subject", ""))
+                    obj = self._clean_entity(triple.get("object", ""))
+                    
+                    # Relation normalization
+                    rel = triple.get("relation", "")
+                    if rel:
+                        rel = "_".join(rel.strip().split()).lower()  # spaces → underscores
+
+                    # Escape JSON special characters in evidence
+                    evidence = triple.get("evidence", "")
+                    evidence = evidence.replace('"', '\\"').replace("\n", "\\n").replace("\t", "\\t")
+                    
+                    # Default values for new fields
+                    sub_type = triple.get("subject_type", "Concept")
+                    obj_type = triple.get("object_type", "Concept")
+                    formality = triple.get("formality_level", "conceptual")
+                    page = triple.get("page", "NAN")
+                    confidence = triple.get("confidence", "medium")
+
+                    # Only append valid triples
+                    if self._is_valid_triple(sub, rel, obj):
+                        chunk_triples.append({
+                            "subject": sub,
+                            "subject_type": sub_type,
+                            "relation": rel,
+                            "object": obj,
+                            "object_type": obj_type,
+                            "evidence": evidence,
+                            "formality_level": formality,
+                            "page": page,
+                            "confidence": confidence
+                        })
+                 
+          # only successfully parsed responses are cached
+          await extraction_cache.set(chunk_key, chunk_triples)
+          return chunk_triples, False
           
+      except Exception as e:
+          print(f"   LLM chunk error: {e}")
+          return None, False
+
+
+class TripleReducer:
+    """
+    Reduce side of the per chunk extraction of one document: chunk results are merged as
+    they complete (in any order), deduplicated, and chunk coverage is tracked.
+    """
+
+    def __init__(self, extractor: Entity_Relation_Extractor, chunks: List[str]):
+        self.extractor = extractor
+        self.total = len(chunks)
+        self.total_chars = sum(len(chunk) for chunk in chunks)
+        self.done = self.failed = self.cached = self.covered_chars = 0
+        self._merged: Dict[tuple, Dict[str, Any]] = {}
+
+    def add(self, chunk: str, chunk_triples: Optional[List[Dict[str, Any]]], cached: bool = False) -> bool:
+        """Merge one chunk result (None = failed chunk); True once every chunk is in"""
+        self.done += 1
+        if chunk_triples is None:
+            self.failed += 1
+        else:
+            self.cached += int(cached)
+            self.covered_chars += len(chunk)
+            # same key as _post_process, first occurrence wins
+            for triple in chunk_triples:
+                key = (triple["subject"].lower(), triple["relation"].lower(), triple["object"].lower())
+                self._merged.setdefault(key, triple)
+        return self.complete
+
+    @property
+    def complete(self) -> bool:
+        return self.done >= self.total
+
+    def coverage(self) -> Dict[str, Any]:
+        return {
+            "chunks": self.total,
+            "succeeded": self.done - self.failed,
+            "cached": self.cached,
+            "failed": self.failed,
+            "coverage": self.covered_chars / self.total_chars if self.total_chars else 1.0,
+        }
+
+    def triples(self) -> List[Dict[str, Any]]:
+        processed = self.extractor._post_process(list(self._merged.values()))
+        coverage_metrics.record(self)
+        print(f"✓ Extracted {len(processed)} high-quality relationships\n")
+        return processed
 
-              if isinstance(triples_data, dict) and "triples" in triples_data:
-                    for triple in triples_data["triples"]:
-                        # Clean entities carefully
-                        sub = self._clean_entity(triple.get("subject", ""))
-                        obj = self._clean_entity(triple.get("object", ""))
-                        
-                        # Relation normalization
-                        rel = triple.get("relation", "")
-                        if rel:
-                            rel = "_".join(rel.strip().split()).lower()  # spaces → underscores
-
-                        # Escape JSON special characters in evidence
-                        evidence = triple.get("evidence", "")
-                        evidence = evidence.replace('"', '\\"').replace("\n", "\\n").replace("\t", "\\t")
-                        
-                        # Default values for new fields
-                        sub_type = triple.get("subject_type", "Concept")
-                        obj_type = triple.get("object_type", "Concept")
-                        formality = triple.get("formality_level", "conceptual")
-                        page = triple.get("page", "NAN")
-                        confidence = triple.get("confidence", "medium")
-
-                        # Only append valid triples
-                        if self._is_valid_triple(sub, rel, obj):
-                            chunk_triples.append({
-                                "subject": sub,
-                                "subject_type": sub_type,
-                                "relation": rel,
-                                "object": obj,
-                                "object_type": obj_type,
-                                "evidence": evidence,
-                                "formality_level": formality,
-                                "page": page,
-                                "confidence": confidence
-                            })
-                     
-              return chunk_triples  # Return the list we built
-              
-          except Exception as e:
-              print(f"   LLM chunk error: {e}")
-              return []  # Return empty list on error
-            # Process all chunks in parallel
-   
-      results = await asyncio.gather(*[process_chunk(chunk) for chunk in chunks_to_process])
-      
-      # Flatten results
-      all_triples = [triple for chunk_result in results for triple in chunk_result]
-      
-      print(all_triples)
-      return all_triples
+
+class CoverageMetrics:
+    """Chunk coverage of the documents reduced by this process, published with the pipeline metrics"""
+
+    def __init__(self):
+        self.documents = self.partial_documents = 0
+        self.chunks = self.cached = self.failed = 0
+        self.covered_chars = self.total_chars = 0
+        self.last_document: Optional[Dict[str, Any]] = None
+
+    def record(self, reducer: TripleReducer):
+        self.documents += 1
+        self.partial_documents += int(reducer.failed > 0)
+        self.chunks += reducer.total
+        self.cached += reducer.cached
+        self.failed += reducer.failed
+        self.covered_chars += reducer.covered_chars
+        self.total_chars += reducer.total_chars
+        self.last_document = reducer.coverage()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "documents": self.documents,
+            "partial_documents": self.partial_documents,
+            "chunks": self.chunks,
+            "cached": self.cached,
+            "failed": self.failed,
+            "coverage": self.covered_chars / self.total_chars if self.total_chars else 1.0,
+            "cache_hit_rate": self.cached / self.chunks if self.chunks else 0.0,
+            "last_document": self.last_document,
+        }
+
+
+coverage_metrics = CoverageMetrics()
@@ -1,7 +1,10 @@
 from dotenv import load_dotenv 
 from neo4j import AsyncGraphDatabase
 from py2neo import Graph
+import asyncio
 import os
+import time
+from typing import Any, Dict
 load_dotenv()
 
 
@@ -12,5 +15,65 @@ NEO4J_USER = os.getenv("NEO4J_USER")
 NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
-driver = AsyncGraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
+# connection pool
+NEO4J_MAX_POOL_SIZE = int(os.getenv("NEO4J_MAX_POOL_SIZE", "100"))
+NEO4J_ACQUISITION_TIMEOUT = float(os.getenv("NEO4J_ACQUISITION_TIMEOUT", "30"))
+NEO4J_CONNECTION_TIMEOUT = float(os.getenv("NEO4J_CONNECTION_TIMEOUT", "15"))
+NEO4J_MAX_CONNECTION_LIFETIME = float(os.getenv("NEO4J_MAX_CONNECTION_LIFETIME", "3600"))
+# connections idle longer than this are pinged before being handed out
+NEO4J_LIVENESS_CHECK_TIMEOUT = float(os.getenv("NEO4J_LIVENESS_CHECK_TIMEOUT", "60"))
+NEO4J_WARMUP_CONNECTIONS = int(os.getenv("NEO4J_WARMUP_CONNECTIONS", "10"))
+# total time execute_read/execute_write keep retrying transient errors (with backoff)
+NEO4J_MAX_TRANSACTION_RETRY_TIME = float(os.getenv("NEO4J_MAX_TRANSACTION_RETRY_TIME", "15"))
+
+POOL_CONFIG = {
+    "max_connection_pool_size": NEO4J_MAX_POOL_SIZE,
+    "connection_acquisition_timeout": NEO4J_ACQUISITION_TIMEOUT,
+    "connection_timeout": NEO4J_CONNECTION_TIMEOUT,
+    "max_connection_lifetime": NEO4J_MAX_CONNECTION_LIFETIME,
+    "liveness_check_timeout": NEO4J_LIVENESS_CHECK_TIMEOUT,
+    "max_transaction_retry_time": NEO4J_MAX_TRANSACTION_RETRY_TIME,
+}
+
+driver = AsyncGraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD), **POOL_CONFIG)
+
+_warmup_seconds = None
+
+
+async def warmup_driver(connections: int = NEO4J_WARMUP_CONNECTIONS):
+    """Verify connectivity and open `connections` pooled connections up front,
+    so the first burst of tool calls doesn't pay for TCP + TLS + auth handshakes"""
+    global _warmup_seconds
+    start = time.perf_counter()
+
+    async def ping():
+        async with driver.session() as session:
+            result = await session.run("RETURN 1")
+            await result.consume()
+
+    try:
+        await driver.verify_connectivity()
+        # concurrent sessions each hold their own connection while running
+        await asyncio.gather(*(ping() for _ in range(max(0, connections))))
+        _warmup_seconds = time.perf_counter() - start
+        print(f"Neo4j pool warmed up with {connections} connections in {_warmup_seconds:.3f}s")
+    except Exception as e:
+        print(f"Neo4j warm-up failed: {e}")
+
+
+async def close_driver():
+    """Close pooled connections gracefully; in-flight sessions finish first"""
+    await driver.close()
+    print("Neo4j driver closed")
+
+
+def pool_metrics() -> Dict[str, Any]:
+    """Pool configuration and warm-up time.
+    The driver has no public api for live pool usage, so per connection counts are not reported"""
+    return {
+        **POOL_CONFIG,
+        "warmup_connections": NEO4J_WARMUP_CONNECTIONS,
+        "warmup_seconds": _warmup_seconds,
+        "encrypted": driver.encrypted,
+    }
 
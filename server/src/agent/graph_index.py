@@ -0,0 +1,64 @@
+"""
+Indexes used by the retrieval tools so entity lookups never scan every Entity node.
+
+ - entity_name_fulltext : lucene full-text index on Entity(name_lower, document_id)
+ - entity_doc_name      : composite range index on Entity(document_id, name_lower)
+ - name_lower           : lower-cased copy of name, written with every Entity MERGE
+ - related_document     : range index on RELATED(document_id), used to load graph snapshots
+"""
+import re
+from typing import List
+
+ENTITY_FULLTEXT_INDEX="entity_name_fulltext"
+
+INDEX_STATEMENTS=[
+    "CREATE CONSTRAINT entity_name IF NOT EXISTS "
+    "FOR (e:Entity) "
+    "REQUIRE (e.name, e.document_id) IS UNIQUE",
+
+    "CREATE INDEX entity_doc_name IF NOT EXISTS "
+    "FOR (e:Entity) ON (e.document_id, e.name_lower)",
+
+    f"CREATE FULLTEXT INDEX {ENTITY_FULLTEXT_INDEX} IF NOT EXISTS "
+    "FOR (e:Entity) ON EACH [e.name_lower, e.document_id]",
+
+    "CREATE INDEX related_document IF NOT EXISTS "
+    "FOR ()-[r:RELATED]-() ON (r.document_id)",
+]
+
+# entities stored before name_lower existed
+BACKFILL_NAME_LOWER="""
+MATCH (e:Entity) WHERE e.name_lower IS NULL
+WITH e LIMIT $limit
+SET e.name_lower = toLower(e.name)
+RETURN count(e) AS updated
+"""
+
+_LUCENE_SPECIAL=re.compile(r'([+\-&|!(){}\[\]^"~*?:\\/])')
+
+
+def _escape(term:str)->str:
+    return _LUCENE_SPECIAL.sub(r"\\\1",term)
+
+
+def name_terms(text:str)->List[str]:
+    return [t for t in re.findall(r"\w+",text.lower()) if t]
+
+
+def fulltext_query(text:str,document_id:str,match_all:bool=True)->str:
+    """
+    Lucene query matching entities of one document where every word of `text` is the
+    prefix of a word of the name ("graph neu" matches "Graph Neural Network").
+    This is word-prefix matching, not toLower(name) CONTAINS text: substrings in the
+    middle of a word ("raph" in "graph") do not match.
+    match_all=False matches any word instead, for free-form phrases.
+    Returns "" when `text` has no searchable words.
+    """
+    terms=name_terms(text)
+    if not match_all:
+        terms=[t for t in terms if len(t)>2]
+    if not terms:
+        return ""
+    operator=" AND " if match_all else " OR "
+    name_clause=operator.join(f"name_lower:{_escape(t)}*" for t in terms)
+    return f'document_id:"{_escape(document_id)}" AND ({name_clause})'
@@ -0,0 +1,293 @@
+"""
+Compact in-process snapshot of one document's knowledge graph.
+
+A paper's graph is a few hundred triples, so the agent tools answer from memory
+instead of making a neo4j round trip per call:
+ - entity names are interned once (by exact name, like the Entity nodes) and referenced
+   by integer id; a lowercase index serves case-insensitive lookups
+ - relation types are stored as integer codes
+ - adjacency is CSR style: array-backed offsets + edge ids, for both directions
+
+Snapshots live in a process level LRU and are reloaded when the document's graph
+version (bumped on every ingestion) changes. Documents above SNAPSHOT_MAX_TRIPLES
+are not snapshotted and the tools fall back to neo4j.
+"""
+import asyncio
+import os
+import re
+from array import array
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional, Tuple
+from .graph_config import driver
+from .graph_version import get_graph_version
+from .multi_hop import MULTI_HOP_ANCHORS, MULTI_HOP_FANOUT, MULTI_HOP_MAX_DEPTH, MULTI_HOP_MAX_FRONTIER, MULTI_HOP_MAX_PATHS, split_path_query
+
+SNAPSHOT_CACHE_SIZE=int(os.getenv("SNAPSHOT_CACHE_SIZE","128"))
+SNAPSHOT_MAX_TRIPLES=int(os.getenv("SNAPSHOT_MAX_TRIPLES","20000"))
+
+LOAD_QUERY="""
+MATCH (n:Entity)-[r:RELATED]->(m:Entity)
+WHERE r.document_id = $document_id
+RETURN n.name AS subject, n.type AS subject_type,
+    r.type AS relation, r.evidence AS evidence,
+    r.page AS page, r.confidence AS confidence,
+    m.name AS object, m.type AS object_type
+LIMIT $limit
+"""
+
+_CONFIDENCE_RANK={"high":0,"medium":1}
+
+
+def _words(text:str)->List[str]:
+    return re.findall(r"\w+",text.lower())
+
+
+class GraphSnapshot:
+    def __init__(self,rows:List[Dict[str,Any]],version:int) -> None:
+        self.version=version
+        self.names:List[str]=[]
+        self.types:List[str]=[]
+        self._name_ids:Dict[str,int]={}
+        self._lower_ids:Dict[str,List[int]]={}
+        self._name_words:List[List[str]]=[]
+        self.relation_types:List[str]=[]
+        self._relation_codes:Dict[str,int]={}
+
+        self.edge_src=array("i")
+        self.edge_dst=array("i")
+        self.edge_rel=array("i")
+        self.edge_rank=array("b")
+        self.edge_evidence:List[str]=[]
+        self.edge_page:List[Any]=[]
+        self.edge_confidence:List[Any]=[]
+
+        for row in rows:
+            if not row.get("subject") or not row.get("object") or not row.get("relation"):
+                continue
+            self.edge_src.append(self._intern(row["subject"],row.get("subject_type")))
+            self.edge_dst.append(self._intern(row["object"],row.get("object_type")))
+            self.edge_rel.append(self._relation_code(row["relation"]))
+            self.edge_rank.append(_CONFIDENCE_RANK.get(row.get("confidence"),2))
+            self.edge_evidence.append(row.get("evidence") or "")
+            self.edge_page.append(row.get("page","NAN"))
+            self.edge_confidence.append(row.get("confidence","medium"))
+
+        self.out_offsets,self.out_edges=self._csr(self.edge_src)
+        self.in_offsets,self.in_edges=self._csr(self.edge_dst)
+
+    def _intern(self,name:str,entity_type:Optional[str])->int:
+        node=self._name_ids.get(name)
+        if node is None:
+            node=len(self.names)
+            self._name_ids[name]=node
+            self._lower_ids.setdefault(name.lower(),[]).append(node)
+            self.names.append(name)
+            self.types.append(entity_type or "Concept")
+            self._name_words.append(_words(name))
+        return node
+
+    def _relation_code(self,relation:str)->int:
+        code=self._relation_codes.get(relation)
+        if code is None:
+            code=len(self.relation_types)
+            self._relation_codes[relation]=code
+            self.relation_types.append(relation)
+        return code
+
+    def _csr(self,endpoints:array)->Tuple[array,array]:
+        """offsets[n]..offsets[n+1] index into edges for node n; edges sorted by confidence"""
+        counts=[0]*(len(self.names)+1)
+        for node in endpoints:
+            counts[node+1]+=1
+        offsets=array("i",counts)
+        for i in range(1,len(offsets)):
+            offsets[i]+=offsets[i-1]
+        edges=array("i",[0]*len(endpoints))
+        cursor=array("i",offsets[:-1]) if len(offsets)>1 else array("i")
+        for edge in sorted(range(len(endpoints)),key=lambda e:self.edge_rank[e]):
+            node=endpoints[edge]
+            edges[cursor[node]]=edge
+            cursor[node]+=1
+        return offsets,edges
+
+    @property
+    def triple_count(self)->int:
+        return len(self.edge_src)
+
+    def out_edges_of(self,node:int):
+        return self.out_edges[self.out_offsets[node]:self.out_offsets[node+1]]
+
+    def in_edges_of(self,node:int):
+        return self.in_edges[self.in_offsets[node]:self.in_offsets[node+1]]
+
+    def match_entities(self,text:str,match_all:bool=True,limit:int=25)->List[int]:
+        """Same semantics as the full-text query: every (or any) word of `text` prefixes a word of the name"""
+        terms=_words(text)
+        if not match_all:
+            terms=[t for t in terms if len(t)>2]
+        if not terms:
+            return []
+        matches=[]
+        for node,words in enumerate(self._name_words):
+            hits=sum(1 for t in terms if any(w.startswith(t) for w in words))
+            if hits and (hits==len(terms) or not match_all):
+                # more matched terms and shorter names rank first, like lucene scoring
+                matches.append((-hits,len(words),node))
+        matches.sort()
+        return [node for _,_,node in matches[:limit]]
+
+    def triple(self,edge:int)->Dict[str,Any]:
+        src,dst=self.edge_src[edge],self.edge_dst[edge]
+        return {
+            "subject":self.names[src],
+            "subject_type":self.types[src],
+            "relation":self.relation_types[self.edge_rel[edge]],
+            "object":self.names[dst],
+            "object_type":self.types[dst],
+            "evidence":self.edge_evidence[edge],
+            "page":self.edge_page[edge],
+            "confidence":self.edge_confidence[edge],
+        }
+
+    def search(self,entities:List[str],limit_per_entity:int=50)->List[Dict[str,Any]]:
+        """Equivalent of the batched search_kg query"""
+        hits:Dict[int,int]={}
+        best:Dict[int,int]={}
+        for entity in entities:
+            touched=set()
+            for rank,node in enumerate(self.match_entities(entity)):
+                for edge in list(self.out_edges_of(node))+list(self.in_edges_of(node)):
+                    if edge not in touched:
+                        touched.add(edge)
+                        best[edge]=min(best.get(edge,rank),rank)
+            for edge in touched:
+                hits[edge]=hits.get(edge,0)+1
+        ranked=sorted(hits,key=lambda e:(-hits[e],best[e],e))
+        return [self.triple(edge) for edge in ranked[:limit_per_entity*max(1,len(entities))]]
+
+    def lookup(self,entity_name:str,limit:int=20)->List[Dict[str,Any]]:
+        """Outgoing relationships of the case-insensitive name matches, else of the best prefix matches"""
+        nodes=self._lower_ids.get(entity_name.strip().lower()) or self.match_entities(entity_name,limit=10)
+        results=[]
+        for node in nodes:
+            for edge in self.out_edges_of(node):
+                results.append({
+                    "relationship":f"{self.names[node]} --RELATED--> {self.names[self.edge_dst[edge]]}",
+                    "evidence":self.edge_evidence[edge]
+                })
+                if len(results)>=limit:
+                    return results
+        return results
+
+    def _path(self,edges:List[int])->Dict[str,Any]:
+        return {
+            "entities":[self.names[self.edge_src[edges[0]]]]+[self.names[self.edge_dst[e]] for e in edges],
+            "relations":[self.relation_types[self.edge_rel[e]] for e in edges],
+            "evidence":[self.edge_evidence[e] for e in edges],
+        }
+
+    def paths(self,path_query:str,max_depth:int=MULTI_HOP_MAX_DEPTH,fanout:int=MULTI_HOP_FANOUT,limit:int=MULTI_HOP_MAX_PATHS)->List[Dict[str,Any]]:
+        """Equivalent of multi_hop.find_paths, without leaving the process"""
+        start_text,end_text=split_path_query(path_query)
+        starts=self.match_entities(start_text,match_all=False,limit=MULTI_HOP_ANCHORS)
+        if not starts:
+            return []
+        if end_text:
+            ends=set(self.match_entities(end_text,match_all=False,limit=MULTI_HOP_ANCHORS))
+            found=self._shortest_paths(starts,ends,max_depth,limit) if ends else []
+            if found:
+                return found
+
+        paths=[]
+        frontier=[(node,[]) for node in starts]
+        for _ in range(max_depth):
+            next_frontier=[]
+            for node,edges in frontier:
+                visited={self.edge_src[e] for e in edges}|{node}
+                for edge in self.out_edges_of(node)[:fanout]:
+                    target=self.edge_dst[edge]
+                    if target in visited:
+                        continue
+                    path=edges+[edge]
+                    paths.append(path)
+                    if len(next_frontier)<MULTI_HOP_MAX_FRONTIER:
+                        next_frontier.append((target,path))
+            if len(paths)>=limit or not next_frontier:
+                break
+            frontier=next_frontier
+        return [self._path(p) for p in paths[:limit]]
+
+    def _shortest_paths(self,starts:List[int],ends:set,max_depth:int,limit:int)->List[Dict[str,Any]]:
+        found=[]
+        for start in starts:
+            # plain BFS from each start; first visit of a node is along a shortest path
+            parent:Dict[int,Optional[int]]={start:None}
+            queue=deque([(start,0)])
+            while queue:
+                node,depth=queue.popleft()
+                if depth>=max_depth:
+                    continue
+                for edge in self.out_edges_of(node):
+                    target=self.edge_dst[edge]
+                    if target in parent:
+                        continue
+                    parent[target]=edge
+                    if target in ends and target!=start:
+                        edges=[]
+                        cursor=target
+                        while parent[cursor] is not None:
+                            e=parent[cursor]
+                            edges.append(e)
+                            cursor=self.edge_src[e]  # type: ignore
+                        found.append(list(reversed(edges)))
+                    queue.append((target,depth+1))
+        found.sort(key=len)
+        return [self._path(p) for p in found[:limit]]
+
+
+class SnapshotCache:
+    def __init__(self,max_size:int=SNAPSHOT_CACHE_SIZE,max_triples:int=SNAPSHOT_MAX_TRIPLES) -> None:
+        self.max_size=max_size
+        self.max_triples=max_triples
+        self._items:"OrderedDict[str,GraphSnapshot]"=OrderedDict()
+        self._locks:Dict[str,asyncio.Lock]={}
+        self._oversized:Dict[str,int]={}
+
+    async def _load(self,document_id:str,version:int)->Optional[GraphSnapshot]:
+        async with driver.session() as session:
+            result=await session.run(LOAD_QUERY,document_id=document_id,limit=self.max_triples+1)
+            rows=[record.data() async for record in result]
+        if len(rows)>self.max_triples:
+            self._oversized[document_id]=version
+            return None
+        return await asyncio.to_thread(GraphSnapshot,rows,version)
+
+    async def get(self,document_id)->Optional[GraphSnapshot]:
+        """Current snapshot or None (graph too large, version unknown, or load failed)"""
+        key=str(document_id)
+        version=await get_graph_version(key)
+        if version<0 or self._oversized.get(key)==version:
+            return None
+        snapshot=self._items.get(key)
+        if snapshot is None or snapshot.version!=version:
+            lock=self._locks.setdefault(key,asyncio.Lock())
+            async with lock:
+                snapshot=self._items.get(key)
+                if snapshot is None or snapshot.version!=version:
+                    try:
+                        snapshot=await self._load(key,version)
+                    except Exception as e:
+                        print(f"Graph snapshot load error for {key}: {e}")
+                        return None
+                    if snapshot is None:
+                        self._items.pop(key,None)
+                        return None
+                    self._items[key]=snapshot
+        self._items.move_to_end(key)
+        while len(self._items)>self.max_size:
+            evicted,_=self._items.popitem(last=False)
+            self._locks.pop(evicted,None)
+        return snapshot
+
+
+snapshot_cache=SnapshotCache()
@@ -1,25 +1,248 @@
+import asyncio
+import os
 import time
-from typing import List, Dict, Any
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 from .graph_config import driver
+from .graph_index import BACKFILL_NAME_LOWER, INDEX_STATEMENTS
+
+NEO4J_WRITE_BATCH_SIZE=int(os.getenv("NEO4J_WRITE_BATCH_SIZE","500"))
+NEO4J_WRITE_CONCURRENCY=int(os.getenv("NEO4J_WRITE_CONCURRENCY","4"))
+# how long concurrent triple writes wait for more documents to join their transactions (0 disables coalescing)
+NEO4J_COALESCE_WINDOW=float(os.getenv("NEO4J_COALESCE_WINDOW","0.05"))
+
+# rows carry their document_id/source so one transaction can hold several documents
+MERGE_ENTITIES_QUERY = """
+UNWIND $rows AS row
+MERGE (e:Entity {name: row.name, document_id: row.document_id})
+SET e.type = row.type, e.name_lower = toLower(row.name)
+"""
+
+# nodes already exist, so each row is two unique index seeks plus one relationship MERGE
+MERGE_RELATIONSHIPS_QUERY = """
+UNWIND $rows AS row
+MATCH (s:Entity {name: row.subject, document_id: row.document_id})
+MATCH (o:Entity {name: row.object, document_id: row.document_id})
+MERGE (s)-[r:RELATED {type: row.relation, source: row.source, document_id: row.document_id}]->(o)
+ON CREATE SET
+    r.evidence = row.evidence,
+    r.page = row.page,
+    r.confidence = row.confidence,
+    r.formality_level = row.formality_level
+"""
+
+
+STORED_TRIPLES_QUERY = """
+MATCH (s:Entity)-[r:RELATED]->(o:Entity)
+WHERE r.document_id = $document_id
+RETURN elementId(r) AS id, s.name AS subject, s.type AS subject_type,
+    r.type AS relation, o.name AS object, o.type AS object_type,
+    r.evidence AS evidence, r.formality_level AS formality_level,
+    r.page AS page, r.confidence AS confidence, r.source AS source
+"""
+
+UPDATE_RELATIONSHIPS_QUERY = """
+UNWIND $rows AS row
+MATCH (s:Entity)-[r:RELATED]->(o:Entity)
+WHERE elementId(r) = row.id
+SET s.type = row.subject_type,
+    o.type = row.object_type,
+    r.evidence = row.evidence,
+    r.page = row.page,
+    r.confidence = row.confidence,
+    r.formality_level = row.formality_level,
+    r.source = $source
+"""
+
+DELETE_RELATIONSHIPS_QUERY = """
+UNWIND $rows AS row
+MATCH ()-[r:RELATED]->()
+WHERE elementId(r) = row.id
+DELETE r
+"""
+
+# entities left without any relationship after a diff
+DELETE_ORPHAN_ENTITIES_QUERY = """
+MATCH (e:Entity {document_id: $document_id})
+WHERE NOT (e)-[:RELATED]-()
+DELETE e
+"""
+
+# properties compared to decide whether a kept triple (or its entity types) needs an update
+_DIFF_FIELDS=("evidence","formality_level","page","confidence","source","subject_type","object_type")
+
+
+def normalize_relation(relation:str)->str:
+    return relation.upper().replace(' ', '_').replace('-', '_')
+
+
+def triple_key(subject:str,relation:str,obj:str)->tuple:
+    """Case-insensitive identity of a triple, as in Entity_Relation_Extractor._post_process"""
+    return (subject.lower(),normalize_relation(relation).lower(),obj.lower())
+
+
+def _triple_row(triple:Dict[str,Any],source:str)->Dict[str,Any]:
+    return {
+        "subject": triple["subject"],
+        "subject_type": triple.get("subject_type", "Concept"),
+        "relation": normalize_relation(triple["relation"]),
+        "object": triple["object"],
+        "object_type": triple.get("object_type", "Concept"),
+        "evidence": triple.get("evidence", ""),
+        "formality_level": triple.get("formality_level", "conceptual"),
+        "page": triple.get("page", None),
+        "confidence": triple.get("confidence", "medium"),
+        "source": source,
+    }
+
+
+def diff_triples(stored:List[Dict[str,Any]],triples:List[Dict[str,Any]],source:str)->Dict[str,List[Dict[str,Any]]]:
+    """
+    Compare stored RELATED edges (with their element ids) against newly extracted triples.
+    Returns {"insert": triples, "update": rows with id, "delete": rows with id, "unchanged": rows}
+    """
+    new:Dict[tuple,Dict[str,Any]]={}
+    for triple in triples:
+        key=triple_key(triple["subject"],triple["relation"],triple["object"])
+        if key not in new:
+            new[key]=_triple_row(triple,source)
+
+    insert,update,delete,unchanged=[],[],[],[]
+    kept=set()
+    for row in stored:
+        key=triple_key(row["subject"],row["relation"],row["object"])
+        if key not in new or key in kept:
+            # gone from the new extraction, or a duplicate of an edge already kept
+            delete.append({"id":row["id"]})
+            continue
+        kept.add(key)
+        fresh=new[key]
+        if any(row.get(field)!=fresh[field] for field in _DIFF_FIELDS):
+            update.append({**fresh,"id":row["id"]})
+        else:
+            unchanged.append(fresh)
+    insert=[new[key] for key in new if key not in kept]
+    return {"insert":insert,"update":update,"delete":delete,"unchanged":unchanged}
+
+
+def _merge_rows(document_id:str,triples:List[Dict[str,Any]],source:str)->Tuple[List[Dict[str,Any]],List[Dict[str,Any]]]:
+    """Entity and relationship rows of MERGE_ENTITIES_QUERY / MERGE_RELATIONSHIPS_QUERY, each merged once"""
+    entities:Dict[str,Dict[str,Any]]={}
+    relationships:Dict[tuple,Dict[str,Any]]={}
+    for triple in triples:
+        subject,obj=triple["subject"],triple["object"]
+        # last type seen wins, as with the per-row SET before
+        entities[subject]={"name":subject,"type":triple.get("subject_type", "Concept"),"document_id":document_id}
+        entities[obj]={"name":obj,"type":triple.get("object_type", "Concept"),"document_id":document_id}
+        relation=normalize_relation(triple["relation"])
+        key=(subject,relation,obj)
+        # the first occurrence wins, as with ON CREATE SET before
+        if key not in relationships:
+            relationships[key]={
+                "subject": subject,
+                "relation": relation,
+                "object": obj,
+                "evidence": triple.get("evidence", ""),
+                "formality_level": triple.get("formality_level", "conceptual"),
+                "page": triple.get("page", None),
+                "confidence": triple.get("confidence", "medium"),
+                "source": source,
+                "document_id": document_id,
+            }
+    return list(entities.values()),list(relationships.values())
+
+
+async def _run_and_consume(tx,query:str,**params):
+    result=await tx.run(query,**params)
+    return await result.consume()
+
+
+class WriteCoalescer:
+    """
+    Collects triple writes of several documents ingested concurrently by one worker and
+    sends them as one set of chunked transactions (MERGE writes are idempotent, so a failed
+    shared flush is simply replayed per document).
+    """
+
+    def __init__(self,write:Callable[[List[Dict[str,Any]],List[Dict[str,Any]]],Awaitable[None]],window:float=NEO4J_COALESCE_WINDOW) -> None:
+        self._write=write
+        self.window=window
+        self._pending:List[Tuple[List[Dict[str,Any]],List[Dict[str,Any]],asyncio.Future]]=[]
+        self._flushing:Optional[asyncio.Task]=None
+        self.stats={"submissions":0,"flushes":0,"fallbacks":0}
+
+    async def submit(self,entities:List[Dict[str,Any]],relationships:List[Dict[str,Any]]):
+        future=asyncio.get_running_loop().create_future()
+        self._pending.append((entities,relationships,future))
+        self.stats["submissions"]+=1
+        if self._flushing is None or self._flushing.done():
+            self._flushing=asyncio.ensure_future(self._flush())
+        await future
+
+    async def _flush(self):
+        while self._pending:
+            if len(self._pending)>1:
+                # several documents are writing: give the others a moment to join this flush.
+                # A lone write goes out at once; writes arriving meanwhile share the next flush.
+                await asyncio.sleep(self.window)
+            pending,self._pending=self._pending,[]
+            self.stats["flushes"]+=1
+            if len(pending)>1:
+                print(f"Coalescing triple writes of {len(pending)} documents")
+            try:
+                await self._write(
+                    [row for entities,_,_ in pending for row in entities],
+                    [row for _,relationships,_ in pending for row in relationships],
+                )
+            except Exception as e:
+                if len(pending)==1:
+                    self._settle(pending[0][2],e)
+                    continue
+                # one document's bad rows must not fail the others: write each on its own
+                print(f"Coalesced write failed ({e}), writing {len(pending)} documents separately")
+                self.stats["fallbacks"]+=1
+                for entities,relationships,future in pending:
+                    try:
+                        await self._write(entities,relationships)
+                    except Exception as document_error:
+                        self._settle(future,document_error)
+                    else:
+                        self._settle(future)
+            else:
+                for *_,future in pending:
+                    self._settle(future)
+
+    @staticmethod
+    def _settle(future:asyncio.Future,error:Optional[BaseException]=None):
+        if future.done():
+            return
+        if error is None:
+            future.set_result(None)
+        else:
+            future.set_exception(error)
+
+
 class Neo4jKnowledgeGraph:
     """Optimized Neo4j storage"""
     
     def __init__(self):
         self.driver=driver
+        self.coalescer=WriteCoalescer(self._write_rows)
     
     async def initialize(self):
-        """Initialize database"""
+        """Initialize database: constraints, lookup indexes and name_lower backfill"""
         print("Initializing Neo4j...")
         async with self.driver.session() as session:
             try:
- 
-                await session.execute_write(
-                    lambda tx:tx.run(
-                              "CREATE CONSTRAINT entity_name IF NOT EXISTS "
-                             "FOR (e:Entity) "
-                            "REQUIRE (e.name, e.document_id) IS UNIQUE"
+                for statement in INDEX_STATEMENTS:
+                    await session.execute_write(
+                        lambda tx,statement=statement:tx.run(statement)
                     )
-                )
+
+                while True:
+                    result = await session.run(BACKFILL_NAME_LOWER, limit=10000)
+                    record = await result.single()
+                    if not record or record["updated"] == 0:
+                        break
         
                 print("✓ Database ready\n")
             except Exception as e:
@@ -43,63 +266,132 @@ class Neo4jKnowledgeGraph:
         print(f"Database cleared for document_id={document_id}")
 
     
-    async def store_triples_batch(self,document_id:str, triples: List[Dict[str,Any]], source: str):
-        """Store triples efficiently"""
+    async def _write_chunk(self,query:str,rows:List[Dict[str,Any]],label:str,**params)->int:
+        """
+        One write transaction. execute_write retries transient errors with backoff for up to
+        NEO4J_MAX_TRANSACTION_RETRY_TIME seconds; MERGE makes the retry idempotent
+        """
+        start=time.perf_counter()
+        async with self.driver.session() as session:
+            summary=await session.execute_write(
+                lambda tx:_run_and_consume(tx,query,rows=rows,**params)
+            )
+        print(f"{label}: {len(rows)} rows in {time.perf_counter()-start:.4f}s")
+        counters=summary.counters
+        return counters.nodes_created+counters.relationships_created
+
+    async def _write_chunks(self,query:str,rows:List[Dict[str,Any]],label:str,**params)->int:
+        chunks=[rows[i:i+NEO4J_WRITE_BATCH_SIZE] for i in range(0,len(rows),NEO4J_WRITE_BATCH_SIZE)]
+        semaphore=asyncio.Semaphore(NEO4J_WRITE_CONCURRENCY)
+
+        async def write(index:int,chunk:List[Dict[str,Any]])->int:
+            async with semaphore:
+                return await self._write_chunk(query,chunk,f"{label} batch {index}/{len(chunks)}",**params)
+
+        created=await asyncio.gather(*(write(i,chunk) for i,chunk in enumerate(chunks,start=1)))
+        return sum(created)
+
+    async def store_triples_batch(self,document_id:str, triples: List[Dict[str,Any]], source: str)->Dict[str,Any]:
+        """
+        Store triples in chunks of NEO4J_WRITE_BATCH_SIZE:
+        every entity is merged exactly once, then relationships are merged between the existing nodes,
+        with up to NEO4J_WRITE_CONCURRENCY transactions in flight.
+        A failed chunk is retried on its own instead of rolling back the whole document.
+        Writes of documents stored at the same time are coalesced into shared transactions.
+        """
         if not triples:
-            return
+            return {"entities":0,"relationships":0,"seconds":0.0}
         
         print(f"Storing {len(triples)} triples...")
+        entities,relationships=_merge_rows(document_id,triples,source)
+
+        try:
+            start=time.perf_counter()
+            if self.coalescer.window>0:
+                await self.coalescer.submit(entities,relationships)
+            else:
+                await self._write_rows(entities,relationships)
+            seconds=time.perf_counter()-start
+            print(f"Storing time taken: {seconds:.4f}")
+            print(f"Stored {len(entities)} entities and {len(relationships)} relationships successfully\n")
+        except Exception as e:
+            print(f"Storage error: {e}\n")
+            raise
+        return {"entities":len(entities),"relationships":len(relationships),"seconds":seconds}
+
+    async def _write_rows(self,entities:List[Dict[str,Any]],relationships:List[Dict[str,Any]]):
+        """Entities first, then the relationships between them"""
+        await self._write_chunks(MERGE_ENTITIES_QUERY,entities,"Entities")
+        await self._write_chunks(MERGE_RELATIONSHIPS_QUERY,relationships,"Relationships")
         
-        # Prepare batch with new triple fields
-        batch = [
-            {
-                "subject": triple["subject"],
-                "subject_type": triple.get("subject_type", "Concept"),
-                "relation": triple["relation"].upper().replace(' ', '_').replace('-', '_'),
-                "object": triple["object"],
-                "object_type": triple.get("object_type", "Concept"),
-                "evidence": triple.get("evidence", ""),
-                "formality_level": triple.get("formality_level", "conceptual"),
-                "page": triple.get("page", None),
-                "confidence": triple.get("confidence", "medium"),
-                "source": source,
-                "document_id": document_id
-            }
-            for triple in triples
-        ]
+    async def get_stored_triples(self,document_id:str)->List[Dict[str,Any]]:
+        async with self.driver.session() as session:
+            result=await session.run(STORED_TRIPLES_QUERY,document_id=document_id)
+            return [record.data() async for record in result]
 
-        # Single query for all
-        query = """
-        UNWIND $batch as row
-        MERGE (s:Entity {name: row.subject, document_id: row.document_id})
-        SET s.type = row.subject_type
-
-        MERGE (o:Entity {name: row.object, document_id: row.document_id})
-        SET o.type = row.object_type
-
-        MERGE (s)-[r:RELATED {type: row.relation, source: row.source, document_id: row.document_id}]->(o)
-        ON CREATE SET 
-            r.source = row.source,
-            r.evidence = row.evidence, 
-            r.page = row.page,
-            r.confidence = row.confidence,
-            r.formality_level = row.formality_level
+    async def sync_triples(self,document_id:str, triples: List[Dict[str,Any]], source: str, partial:bool=False)->Dict[str,int]:
+        """
+        Incremental re-ingestion: diff the document's stored triples against `triples`
+        and only insert new ones, update changed properties and delete the ones that are gone.
+        partial: `triples` come from an extraction with failed chunks, so a stored triple
+        missing from them is not known to be gone; nothing is deleted.
         """
+        start=time.perf_counter()
+        stored=await self.get_stored_triples(document_id)
+        diff=diff_triples(stored,triples,source)
+        print(
+            f"Triple diff for {document_id}: {len(diff['insert'])} new, {len(diff['update'])} changed, "
+            f"{len(diff['delete'])} removed, {len(diff['unchanged'])} unchanged"
+        )
+        if partial and diff["delete"]:
+            print(f"Partial extraction: keeping {len(diff['delete'])} stored triples")
+            diff["delete"]=[]
 
-        
+        if diff["delete"]:
+            await self._write_chunks(DELETE_RELATIONSHIPS_QUERY,diff["delete"],"Deletes")
+        if diff["update"]:
+            await self._write_chunks(UPDATE_RELATIONSHIPS_QUERY,diff["update"],"Updates",source=source)
+        if diff["insert"]:
+            await self.store_triples_batch(document_id,diff["insert"],source)
+        if diff["delete"]:
+            await self._write_chunk(DELETE_ORPHAN_ENTITIES_QUERY,[],"Orphan entities",document_id=document_id)
+
+        print(f"Incremental sync time taken: {time.perf_counter()-start:.4f}")
+        return {name:len(rows) for name,rows in diff.items()}
+
+    async def swap_triples(self,document_id:str, triples: List[Dict[str,Any]], source: str, before:Optional[Callable[[Any],Awaitable[None]]]=None)->Dict[str,int]:
+        """
+        Replace the document's triples with `triples` in a single transaction, so readers
+        see either the old graph or the new one and never a mix (used by hi_res upgrades).
+        `before(tx)` runs first in the same transaction, e.g. to replace the structure nodes.
+        """
+        start=time.perf_counter()
+        stored=await self.get_stored_triples(document_id)
+        diff=diff_triples(stored,triples,source)
+        entities,relationships=_merge_rows(document_id,diff["insert"],source)
+
+        async def swap(tx):
+            if before is not None:
+                await before(tx)
+            if diff["delete"]:
+                await _run_and_consume(tx,DELETE_RELATIONSHIPS_QUERY,rows=diff["delete"])
+            if diff["update"]:
+                await _run_and_consume(tx,UPDATE_RELATIONSHIPS_QUERY,rows=diff["update"],source=source)
+            if entities:
+                await _run_and_consume(tx,MERGE_ENTITIES_QUERY,rows=entities)
+                await _run_and_consume(tx,MERGE_RELATIONSHIPS_QUERY,rows=relationships)
+            if diff["delete"]:
+                await _run_and_consume(tx,DELETE_ORPHAN_ENTITIES_QUERY,document_id=document_id)
+
+        # managed transaction: retried as a whole by the driver on transient errors
         async with self.driver.session() as session:
-            try:
-                start=time.perf_counter()
-                await session.execute_write(
-                    lambda tx:tx.run(query,batch=batch)
-                )
-                end=time.perf_counter()
-                print(f"Storing time taken: {end-start:.4f}")
-                print(f"Stored successfully\n")
-            except Exception as e:
-                print(f"Storage error: {e}\n")
-                raise
-        
+            await session.execute_write(swap)
+        print(
+            f"Swapped graph of {document_id}: {len(diff['insert'])} new, {len(diff['update'])} changed, "
+            f"{len(diff['delete'])} removed in {time.perf_counter()-start:.4f}s"
+        )
+        return {name:len(rows) for name,rows in diff.items()}
+
     async def get_statistics(self,document_id:str) -> Dict:
         """Get statistics"""
         stats = {}
@@ -3,10 +3,13 @@ This file contains the logic for creating a structured representation of the pap
 such as  paper_title, author, and sections nodes.
 """
 
-from typing import List,Dict
+from typing import Any,AsyncIterator,List,Dict,Optional,Tuple
 from .graph_config import driver
 from neo4j import AsyncSession
-import json,re
+import json,os,re
+
+# streamed authors/sections are written in UNWIND batches of up to this many items
+STRUCTURE_WRITE_BATCH=int(os.getenv("STRUCTURE_WRITE_BATCH","16"))
 
 def parse_str_to_json(text: str):
     match = re.search(r"```json\s*(.*?)```", text, flags=re.DOTALL)
@@ -23,6 +26,133 @@ def parse_str_to_json(text: str):
         clean_text = json_text.replace("\n", "").replace("\r", "").replace("\t", " ")
         return json.loads(clean_text)
 
+def _loads_lenient(json_text: str):
+    try:
+        return json.loads(json_text)
+    except json.JSONDecodeError:
+        # same fallback as parse_str_to_json
+        return json.loads(json_text.replace("\n", "").replace("\r", "").replace("\t", " "))
+
+
+class StructureStreamParser:
+    """
+    Incremental parser for the structure extraction json:
+    emits ("title", str), ("author", dict) and ("section", dict) as soon as each value is complete.
+    Anything before the first "{" (a ```json fence) is ignored.
+    """
+
+    def __init__(self) -> None:
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._object_start = 0
+        self._pending_key: Optional[str] = None
+        self._key: Optional[str] = None
+        self._expect_value = False
+        self._started = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        self._buffer += chunk
+        events = []
+        while self._pos < len(self._buffer):
+            char = self._buffer[self._pos]
+            if not self._started:
+                self._started = char == "{"
+                if self._started:
+                    self._depth = 1
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        value = self._buffer[self._string_start:self._pos + 1]
+                        if self._expect_value:
+                            self._expect_value = False
+                            if self._key == "document_title":
+                                events.append(("title", _loads_lenient(value)))
+                        else:
+                            self._pending_key = _loads_lenient(value)
+            elif char == '"':
+                self._in_string = True
+                self._string_start = self._pos
+            elif char == ":" and self._depth == 1:
+                self._key = self._pending_key
+                self._expect_value = True
+            elif char in "{[":
+                self._depth += 1
+                if self._depth == 2:
+                    self._expect_value = False
+                if self._depth == 3 and char == "{":
+                    self._object_start = self._pos
+            elif char in "}]":
+                if self._depth == 3 and char == "}" and self._key in ("authors", "sections"):
+                    try:
+                        item = _loads_lenient(self._buffer[self._object_start:self._pos + 1])
+                        events.append(("author" if self._key == "authors" else "section", item))
+                    except json.JSONDecodeError as e:
+                        print(f"Skipping unparsable {self._key} entry: {e}")
+                self._depth -= 1
+            elif char == "," and self._depth == 1:
+                self._expect_value = False
+            self._pos += 1
+        return events
+
+
+async def build_structured_graph_stream(chunks: AsyncIterator[str], document_id: str) -> Dict:
+    """
+    Store title, authors and sections while the structure json is still being generated.
+    Authors and sections are buffered and written in UNWIND batches: the authors once the
+    first section arrives (they come first in the json), the rest every
+    STRUCTURE_WRITE_BATCH items and at the end of the stream.
+    Returns the assembled struct_data (same shape as parse_str_to_json output) for caching.
+    """
+    parser = StructureStreamParser()
+    text_parts: List[str] = []
+    struct_data: Dict[str, Any] = {"document_title": None, "authors": [], "sections": []}
+    buffers: Dict[str, List[Dict]] = {"author": [], "section": []}
+
+    async with driver.session() as session:
+        async def flush(kind: str):
+            # authors and sections are linked to the Paper node, so they wait for the title
+            title = struct_data["document_title"]
+            if not buffers[kind] or title is None:
+                return
+            if kind == "author":
+                await create_author_nodes(title, buffers[kind], document_id, session)
+            else:
+                await create_sections_nodes(title, buffers[kind], document_id, session)
+            buffers[kind] = []
+
+        async for chunk in chunks:
+            text_parts.append(chunk)
+            for kind, value in parser.feed(chunk):
+                if kind == "title":
+                    struct_data["document_title"] = value
+                    await create_title_node(value, document_id, session)
+                    continue
+                struct_data["authors" if kind == "author" else "sections"].append(value)
+                buffers[kind].append(value)
+                if kind == "section":
+                    await flush("author")
+                if len(buffers[kind]) >= STRUCTURE_WRITE_BATCH:
+                    await flush(kind)
+
+        if struct_data["document_title"] is None:
+            # nothing usable was streamed; parse the complete answer like the non streaming path
+            full = parse_str_to_json("".join(text_parts))
+            await build_structured_graph(full, document_id)
+            return full
+        await flush("author")
+        await flush("section")
+    return struct_data
+
+
 async def build_structured_graph(struct_data: Dict, document_id: str):
     document_title: str = struct_data["document_title"]
     authors: List[Dict] = struct_data["authors"]
@@ -75,3 +205,68 @@ async def create_sections_nodes(document_title: str, sections: list[dict], docum
     """
     await session.execute_write(lambda tx: tx.run(query, sections=sections, title=document_title, document_id=document_id))
 
+
+# structure replacement for hi_res upgrades: properties are overwritten (SET, not ON CREATE SET)
+# and nodes that are not part of the new structure are removed
+REPLACE_TITLE_QUERY = """
+MERGE (p:Paper {title: $title, document_id: $document_id})
+WITH p
+MATCH (old:Paper {document_id: $document_id})
+WHERE old <> p
+DETACH DELETE old
+"""
+
+REPLACE_AUTHORS_QUERY = """
+UNWIND $authors AS a
+MERGE (auth:Author {name: a.name, document_id: $document_id})
+SET auth.email = a.email, auth.affiliations = a.affiliations
+WITH auth
+MATCH (p:Paper {title: $title, document_id: $document_id})
+MERGE (auth)-[:AUTHORED]->(p)
+"""
+
+REPLACE_SECTIONS_QUERY = """
+UNWIND $sections AS s
+MERGE (sec:Section {section_name: s.section_name, section_number: s.section_number, document_id: $document_id})
+SET sec.start_page = s.start_page,
+    sec.confidence = s.confidence,
+    sec.content = s.content
+WITH sec
+MATCH (p:Paper {title: $title, document_id: $document_id})
+MERGE (p)-[:HAS_SECTION]->(sec)
+"""
+
+DELETE_STALE_STRUCTURE_QUERY = """
+MATCH (auth:Author {document_id: $document_id})
+WHERE NOT auth.name IN $author_names
+DETACH DELETE auth
+WITH count(*) AS ignored
+MATCH (sec:Section {document_id: $document_id})
+WHERE NOT sec.section_name + '|' + coalesce(toString(sec.section_number), '') IN $section_keys
+DETACH DELETE sec
+"""
+
+
+def _section_key(section: Dict) -> str:
+    number = section.get("section_number")
+    return f"{section.get('section_name')}|{'' if number is None else number}"
+
+
+async def replace_structured_graph_tx(tx, struct_data: Dict, document_id: str):
+    """Replace title, authors and sections of a document inside the caller's transaction"""
+    document_title: str = struct_data["document_title"]
+    authors: List[Dict] = struct_data.get("authors") or []
+    sections: List[Dict] = struct_data.get("sections") or []
+    for query, params in (
+        (REPLACE_TITLE_QUERY, {}),
+        (REPLACE_AUTHORS_QUERY, {"authors": authors}),
+        (REPLACE_SECTIONS_QUERY, {"sections": sections}),
+    ):
+        result = await tx.run(query, title=document_title, document_id=document_id, **params)
+        await result.consume()
+    result = await tx.run(
+        DELETE_STALE_STRUCTURE_QUERY, document_id=document_id,
+        author_names=[a.get("name") for a in authors],
+        section_keys=[_section_key(s) for s in sections],
+    )
+    await result.consume()
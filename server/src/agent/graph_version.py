@@ -0,0 +1,26 @@
+"""
+Per-document graph version counter in redis.
+
+Bumped whenever a document's graph is (re)written, so process local caches
+(graph snapshots, answer caches) can tell their copy is stale without talking to neo4j.
+"""
+from src.database.redis_client import redis_client
+
+GRAPH_VERSION_KEY="graph:version:{document_id}"
+
+
+async def get_graph_version(document_id)->int:
+    try:
+        value=await redis_client.get(GRAPH_VERSION_KEY.format(document_id=document_id))
+        return int(value) if value else 0
+    except Exception as e:
+        print(f"Graph version read error: {e}")
+        return -1
+
+
+async def bump_graph_version(document_id)->int:
+    try:
+        return int(await redis_client.incr(GRAPH_VERSION_KEY.format(document_id=document_id)))
+    except Exception as e:
+        print(f"Graph version bump error: {e}")
+        return -1
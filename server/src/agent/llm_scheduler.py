@@ -0,0 +1,227 @@
+"""
+Shared scheduler for every LLM call made by the server (extractor, RAG agent, deep mode).
+
+Per provider:
+ - an adaptive concurrency limit: additive increase on success, halved on every 429 (AIMD)
+ - token buckets for requests/minute and tokens/minute (prompt size estimated from characters)
+ - a priority queue so interactive questions are dispatched before queued ingestion chunks
+
+Failed calls are retried with exponential backoff and full jitter when the error looks
+like a rate limit or a transient provider/network failure.
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+PRIORITY_INTERACTIVE=0
+PRIORITY_INGESTION=1
+
+LLM_MAX_RETRIES=int(os.getenv("LLM_MAX_RETRIES","4"))
+LLM_RETRY_BASE_DELAY=float(os.getenv("LLM_RETRY_BASE_DELAY","1.0"))
+LLM_RETRY_MAX_DELAY=float(os.getenv("LLM_RETRY_MAX_DELAY","30.0"))
+
+_TRANSIENT_STATUS={429,500,502,503,504}
+_TRANSIENT_NAMES=("ratelimit","resourceexhausted","timeout","serviceunavailable","connection","overloaded")
+
+
+def estimate_tokens(text:str)->int:
+    """~4 characters per token; good enough for budgeting"""
+    return max(1,len(text)//4)
+
+
+def _status_code(error:Exception)->Optional[int]:
+    for source in (error,getattr(error,"response",None)):
+        code=getattr(source,"status_code",None) or getattr(source,"code",None)
+        if isinstance(code,int):
+            return code
+    return None
+
+
+def is_rate_limited(error:Exception)->bool:
+    if _status_code(error)==429:
+        return True
+    name=type(error).__name__.lower()
+    message=str(error).lower()
+    return "ratelimit" in name or "resourceexhausted" in name or "429" in message or "rate limit" in message or "quota" in message
+
+
+def is_transient(error:Exception)->bool:
+    if is_rate_limited(error) or isinstance(error,asyncio.TimeoutError):
+        return True
+    if _status_code(error) in _TRANSIENT_STATUS:
+        return True
+    name=type(error).__name__.lower()
+    return any(part in name for part in _TRANSIENT_NAMES)
+
+
+# requests/minute when neither LLM_<PROVIDER>_RPM nor LLM_RPM is set (0 = unlimited);
+# conservative paid tier figures, raise them to match the account's quota
+_DEFAULT_RPM={"gemini":"300","openai":"500","deepseek":"0","groq":"30","ollama":"0"}
+
+
+def _env_number(provider:str,name:str,default:str)->float:
+    """LLM_<PROVIDER>_<NAME>, falling back to LLM_<NAME>"""
+    return float(os.getenv(f"LLM_{provider.upper()}_{name}",os.getenv(f"LLM_{name}",default)))
+
+
+class TokenBucket:
+    """Refills `per_minute` units per minute; per_minute<=0 means unlimited"""
+
+    def __init__(self,per_minute:float) -> None:
+        self.capacity=per_minute
+        self.rate=per_minute/60.0
+        self.level=per_minute
+        self.updated=time.monotonic()
+
+    def _refill(self):
+        now=time.monotonic()
+        self.level=min(self.capacity,self.level+(now-self.updated)*self.rate)
+        self.updated=now
+
+    def wait_time(self,amount:float)->float:
+        if self.capacity<=0:
+            return 0.0
+        self._refill()
+        # a request bigger than the whole bucket waits for a full bucket instead of forever
+        amount=min(amount,self.capacity)
+        return 0.0 if self.level>=amount else (amount-self.level)/self.rate
+
+    def consume(self,amount:float):
+        if self.capacity>0:
+            self.level-=min(amount,self.capacity)
+
+
+class ProviderScheduler:
+    def __init__(self,provider:str) -> None:
+        self.provider=provider
+        self.max_concurrency=int(_env_number(provider,"CONCURRENCY","8"))
+        self.limit=float(self.max_concurrency)
+        self.requests=TokenBucket(_env_number(provider,"RPM",_DEFAULT_RPM.get(provider,"60")))
+        self.tokens=TokenBucket(_env_number(provider,"TPM","0"))
+        self.in_flight=0
+        self._waiting:List[Tuple[int,int,int,asyncio.Future]]=[]
+        self._sequence=itertools.count()
+        self._timer:Optional[asyncio.TimerHandle]=None
+        self.stats:Dict[str,int]={"calls":0,"rate_limited":0,"retries":0,"failures":0}
+
+    async def acquire(self,priority:int,tokens:int):
+        future=asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting,(priority,next(self._sequence),tokens,future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # slot was granted right before the cancellation
+                self.release(rate_limited=False)
+            raise
+
+    def release(self,rate_limited:bool):
+        self.in_flight-=1
+        if rate_limited:
+            self.limit=max(1.0,self.limit/2)
+        else:
+            self.limit=min(float(self.max_concurrency),self.limit+1/self.limit)
+        self._dispatch()
+
+    def _dispatch(self):
+        while self._waiting and self.in_flight<int(self.limit):
+            _,_,tokens,future=self._waiting[0]
+            if future.done():
+                heapq.heappop(self._waiting)
+                continue
+            wait=max(self.requests.wait_time(1),self.tokens.wait_time(tokens))
+            if wait>0:
+                if self._timer is None:
+                    self._timer=asyncio.get_running_loop().call_later(wait,self._on_timer)
+                return
+            heapq.heappop(self._waiting)
+            self.requests.consume(1)
+            self.tokens.consume(tokens)
+            self.in_flight+=1
+            future.set_result(None)
+
+    def _on_timer(self):
+        self._timer=None
+        self._dispatch()
+
+    def metrics(self)->Dict[str,Any]:
+        return {
+            **self.stats,
+            "concurrency_limit":int(self.limit),
+            "max_concurrency":self.max_concurrency,
+            "in_flight":self.in_flight,
+            "waiting":sum(1 for *_,future in self._waiting if not future.done()),
+        }
+
+
+class LLMScheduler:
+    def __init__(self) -> None:
+        self._providers:Dict[str,ProviderScheduler]={}
+
+    def provider(self,provider:str)->ProviderScheduler:
+        scheduler=self._providers.get(provider)
+        if scheduler is None:
+            scheduler=ProviderScheduler(provider)
+            self._providers[provider]=scheduler
+        return scheduler
+
+    async def _backoff(self,scheduler:ProviderScheduler,attempt:int,error:Exception):
+        delay=random.uniform(0,min(LLM_RETRY_MAX_DELAY,LLM_RETRY_BASE_DELAY*2**attempt))
+        scheduler.stats["retries"]+=1
+        print(f"LLM call to {scheduler.provider} failed ({type(error).__name__}), retry {attempt+1}/{LLM_MAX_RETRIES} in {delay:.1f}s")
+        await asyncio.sleep(delay)
+
+    async def run(self,provider:str,call:Callable[[],Awaitable[Any]],priority:int=PRIORITY_INGESTION,tokens:int=1)->Any:
+        """Await `call()` under the provider's limits, retrying rate limits and transient errors"""
+        scheduler=self.provider(provider)
+        for attempt in range(LLM_MAX_RETRIES+1):
+            await scheduler.acquire(priority,tokens)
+            scheduler.stats["calls"]+=1
+            rate_limited=False
+            try:
+                return await call()
+            except Exception as e:
+                rate_limited=is_rate_limited(e)
+                scheduler.stats["rate_limited"]+=int(rate_limited)
+                if attempt==LLM_MAX_RETRIES or not is_transient(e):
+                    scheduler.stats["failures"]+=1
+                    raise
+                error=e
+            finally:
+                scheduler.release(rate_limited)
+            await self._backoff(scheduler,attempt,error)
+
+    async def stream(self,provider:str,call:Callable[[],AsyncIterator[Any]],priority:int=PRIORITY_INTERACTIVE,tokens:int=1)->AsyncIterator[Any]:
+        """Like run() for streaming calls; only retried while nothing has been yielded yet"""
+        scheduler=self.provider(provider)
+        for attempt in range(LLM_MAX_RETRIES+1):
+            await scheduler.acquire(priority,tokens)
+            scheduler.stats["calls"]+=1
+            rate_limited=False
+            started=False
+            try:
+                async for chunk in call():
+                    started=True
+                    yield chunk
+                return
+            except Exception as e:
+                rate_limited=is_rate_limited(e)
+                scheduler.stats["rate_limited"]+=int(rate_limited)
+                if started or attempt==LLM_MAX_RETRIES or not is_transient(e):
+                    scheduler.stats["failures"]+=1
+                    raise
+                error=e
+            finally:
+                scheduler.release(rate_limited)
+            await self._backoff(scheduler,attempt,error)
+
+    def metrics(self)->Dict[str,Dict[str,Any]]:
+        return {name:scheduler.metrics() for name,scheduler in self._providers.items()}
+
+
+llm_scheduler=LLMScheduler()
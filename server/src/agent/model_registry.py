@@ -0,0 +1,80 @@
+"""
+Process wide registry for local NLP models (spaCy pipelines, embedding models).
+
+Every model is loaded at most once per process, lazily on first use or eagerly by
+`warmup()` from the FastAPI lifespan. Load time and resident memory growth are
+recorded per model and exposed through `metrics()`.
+
+Pipelines:
+ - QUERY_PIPELINE  -> entity/POS extraction for agent queries (parser, lemmatizer disabled)
+ - INGEST_PIPELINE -> full pipeline used during ingestion
+"""
+import os
+import resource
+import threading
+import time
+from typing import Any, Dict, Tuple
+
+SPACY_MODEL=os.getenv("SPACY_MODEL","en_core_web_sm")
+QUERY_PIPELINE:Tuple[str,...]=("parser","lemmatizer")
+INGEST_PIPELINE:Tuple[str,...]=()
+WARMUP_EMBEDDINGS=os.getenv("WARMUP_EMBEDDINGS","0")=="1"
+
+
+def _rss_mb()->float:
+    """Current resident set size; falls back to peak rss where /proc is unavailable"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages=int(f.read().split()[1])
+        return pages*os.sysconf("SC_PAGE_SIZE")/(1024*1024)
+    except (OSError,ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024
+
+
+class ModelRegistry:
+    def __init__(self) -> None:
+        self._models:Dict[Tuple,Any]={}
+        self._metrics:Dict[str,Dict[str,float]]={}
+        self._lock=threading.Lock()
+
+    def _load(self,key:Tuple,name:str,loader):
+        model=self._models.get(key)
+        if model is not None:
+            return model
+        with self._lock:
+            model=self._models.get(key)
+            if model is None:
+                rss_before=_rss_mb()
+                start=time.perf_counter()
+                model=loader()
+                self._metrics[name]={
+                    "load_seconds":round(time.perf_counter()-start,4),
+                    "rss_delta_mb":round(_rss_mb()-rss_before,2)
+                }
+                print(f"✓ Loaded {name} in {self._metrics[name]['load_seconds']}s (+{self._metrics[name]['rss_delta_mb']}MB)")
+                self._models[key]=model
+        return model
+
+    def get_spacy(self,disable:Tuple[str,...]=INGEST_PIPELINE,model:str=SPACY_MODEL):
+        import spacy
+        disable=tuple(sorted(disable))
+        name=f"spacy:{model}" + (f"[-{','.join(disable)}]" if disable else "")
+        return self._load(("spacy",model,disable),name,lambda:spacy.load(model,disable=list(disable)))
+
+    def get_embedding(self,provider:str,model:str):
+        from .model_factory import Embedding_Factory
+        return self._load(("embedding",provider,model),f"embedding:{provider}:{model}",lambda:Embedding_Factory.create_embedding(provider,model))
+
+    def warmup(self):
+        """Load the models every request path needs; called once at startup"""
+        self.get_spacy(QUERY_PIPELINE)
+        self.get_spacy(INGEST_PIPELINE)
+        if WARMUP_EMBEDDINGS:
+            from .deep_retrieval import DEEP_EMBEDDING_MODEL, DEEP_EMBEDDING_PROVIDER
+            self.get_embedding(DEEP_EMBEDDING_PROVIDER,DEEP_EMBEDDING_MODEL)
+
+    def metrics(self)->Dict[str,Any]:
+        return {"models":dict(self._metrics),"rss_mb":round(_rss_mb(),2)}
+
+
+model_registry=ModelRegistry()
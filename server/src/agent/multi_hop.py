@@ -0,0 +1,133 @@
+"""
+Bounded multi-hop path search over one document's knowledge graph.
+
+Paths always start from Entity nodes found through the document-scoped full-text
+index, and every expanded relationship must belong to the document, so the search
+never walks other papers' subgraphs:
+ - "X to Y" style queries   -> shortest paths between the X anchors and the Y anchors
+ - single concept queries   -> breadth first search, one round trip per hop,
+                               at most MULTI_HOP_FANOUT edges followed per node
+"""
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+from .graph_index import ENTITY_FULLTEXT_INDEX, fulltext_query
+
+MULTI_HOP_MAX_DEPTH=int(os.getenv("MULTI_HOP_MAX_DEPTH","3"))
+MULTI_HOP_FANOUT=int(os.getenv("MULTI_HOP_FANOUT","15"))
+MULTI_HOP_ANCHORS=int(os.getenv("MULTI_HOP_ANCHORS","10"))
+MULTI_HOP_MAX_PATHS=int(os.getenv("MULTI_HOP_MAX_PATHS","10"))
+MULTI_HOP_MAX_FRONTIER=int(os.getenv("MULTI_HOP_MAX_FRONTIER","200"))
+
+_CONNECTOR=re.compile(r"\s+(?:to|->|→|and|vs\.?|versus|with)\s+",re.IGNORECASE)
+_BETWEEN=re.compile(r"^\s*(?:between|from)\s+",re.IGNORECASE)
+
+ANCHOR_QUERY="""
+CALL db.index.fulltext.queryNodes($index, $search) YIELD node, score
+RETURN elementId(node) AS id, node.name AS name
+ORDER BY score DESC LIMIT $limit
+"""
+
+EXPAND_QUERY="""
+UNWIND $frontier AS node_id
+MATCH (n:Entity)-[r:RELATED]->(m:Entity)
+WHERE elementId(n) = node_id AND r.document_id = $document_id
+WITH node_id, r, m
+ORDER BY CASE r.confidence WHEN 'high' THEN 0 WHEN 'medium' THEN 1 ELSE 2 END
+WITH node_id, collect({relation: r.type, evidence: r.evidence, target: elementId(m), name: m.name})[..$fanout] AS edges
+RETURN node_id, edges
+"""
+
+# variable length bounds can't be parameters, MULTI_HOP_MAX_DEPTH is formatted in
+SHORTEST_PATH_QUERY="""
+MATCH (s:Entity) WHERE elementId(s) IN $start_ids
+MATCH (t:Entity) WHERE elementId(t) IN $end_ids AND s <> t
+MATCH path = shortestPath((s)-[:RELATED*1..{depth}]->(t))
+WHERE ALL(rel IN relationships(path) WHERE rel.document_id = $document_id)
+RETURN
+    [node IN nodes(path) | node.name] AS entities,
+    [rel IN relationships(path) | rel.type] AS relations,
+    [rel IN relationships(path) | rel.evidence] AS evidence
+ORDER BY length(path)
+LIMIT $limit
+"""
+
+
+def split_path_query(path_query:str)->Tuple[str,Optional[str]]:
+    """'ReAct to evaluation metrics' -> ('ReAct', 'evaluation metrics')"""
+    text=_BETWEEN.sub("",path_query)
+    parts=_CONNECTOR.split(text,maxsplit=1)
+    if len(parts)==2 and parts[0].strip() and parts[1].strip():
+        return parts[0].strip(),parts[1].strip()
+    return text.strip(),None
+
+
+async def find_anchors(session,text:str,document_id:str,limit:int=MULTI_HOP_ANCHORS)->List[Dict[str,Any]]:
+    search=fulltext_query(text,document_id,match_all=False)
+    if not search:
+        return []
+    result=await session.run(ANCHOR_QUERY,index=ENTITY_FULLTEXT_INDEX,search=search,limit=limit)
+    return [record.data() async for record in result]
+
+
+async def shortest_paths(session,start_ids:List[str],end_ids:List[str],document_id:str,max_depth:int=MULTI_HOP_MAX_DEPTH,limit:int=MULTI_HOP_MAX_PATHS)->List[Dict[str,Any]]:
+    result=await session.run(
+        SHORTEST_PATH_QUERY.replace("{depth}",str(int(max_depth))),
+        start_ids=start_ids,end_ids=end_ids,document_id=document_id,limit=limit
+    )
+    return [record.data() async for record in result]
+
+
+async def bounded_bfs(session,anchors:List[Dict[str,Any]],document_id:str,max_depth:int=MULTI_HOP_MAX_DEPTH,fanout:int=MULTI_HOP_FANOUT,limit:int=MULTI_HOP_MAX_PATHS)->Tuple[List[Dict[str,Any]],int]:
+    """Expand level by level from the anchors; shorter paths are returned first. Returns (paths, hops run)"""
+    # node id -> partial paths ending at that node
+    frontier:Dict[str,List[Dict[str,Any]]]={
+        a["id"]:[{"ids":[a["id"]],"entities":[a["name"]],"relations":[],"evidence":[]}] for a in anchors
+    }
+    paths=[]
+    hops=0
+    for _ in range(max_depth):
+        if not frontier or len(paths)>=limit:
+            break
+        hops+=1
+        result=await session.run(EXPAND_QUERY,frontier=list(frontier),document_id=document_id,fanout=fanout)
+        next_frontier:Dict[str,List[Dict[str,Any]]]={}
+        frontier_size=0
+        async for record in result:
+            for partial in frontier.get(record["node_id"],[]):
+                for edge in record["edges"]:
+                    if edge["target"] in partial["ids"]:
+                        continue  # no cycles
+                    path={
+                        "ids":partial["ids"]+[edge["target"]],
+                        "entities":partial["entities"]+[edge["name"]],
+                        "relations":partial["relations"]+[edge["relation"]],
+                        "evidence":partial["evidence"]+[edge["evidence"]],
+                    }
+                    paths.append(path)
+                    if frontier_size<MULTI_HOP_MAX_FRONTIER:
+                        next_frontier.setdefault(edge["target"],[]).append(path)
+                        frontier_size+=1
+        frontier=next_frontier
+    return [{k:p[k] for k in ("entities","relations","evidence")} for p in paths[:limit]],hops
+
+
+async def find_paths(session,path_query:str,document_id:str)->Tuple[List[Dict[str,Any]],int]:
+    """Returns (paths, neo4j round trips used)"""
+    start_text,end_text=split_path_query(path_query)
+    starts=await find_anchors(session,start_text,document_id)
+    round_trips=1
+    if not starts:
+        return [],round_trips
+
+    if end_text:
+        ends=await find_anchors(session,end_text,document_id)
+        round_trips+=1
+        if ends:
+            paths=await shortest_paths(session,[a["id"] for a in starts],[a["id"] for a in ends],document_id)
+            round_trips+=1
+            if paths:
+                return paths,round_trips
+
+    paths,hops=await bounded_bfs(session,starts,document_id)
+    return paths,round_trips+hops
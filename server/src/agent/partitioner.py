@@ -0,0 +1,281 @@
+"""
+File contains:
+ -unstructured pdf partitioning into the {PAGE X} / [Category] text layout
+ -persistent process pool so partitioning never runs on the event loop
+
+Config (env):
+ PARTITION_WORKERS   -> partition processes running at the same time (default: cpu count)
+ PARTITION_TIMEOUT   -> seconds a single partition job may run before it is interrupted
+ PARTITION_KILL_GRACE -> further seconds before a job stuck in native code has its worker killed
+ PARTITION_MAX_TASKS_PER_CHILD -> jobs a worker runs before it is replaced (0: never)
+ PARTITION_MEMORY_MB -> address space (RLIMIT_AS) cap per partition process (default 0: disabled;
+                        hi_res needs a generous value since torch/onnx reserve large virtual mappings)
+ PARTITION_PAGE_PARALLEL  -> split pdfs into page ranges partitioned concurrently (1/0)
+ PARTITION_MIN_PAGES_PER_RANGE -> smallest page range handed to a single process
+"""
+import asyncio
+import contextlib
+import itertools
+import os
+import queue
+import signal
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+import math
+import multiprocessing
+from typing import Dict, List, Optional, Tuple
+from PyPDF2 import PdfReader, PdfWriter
+from src.storage.backends import read_object
+
+PARTITION_WORKERS=int(os.getenv("PARTITION_WORKERS",str(os.cpu_count() or 2)))
+PARTITION_TIMEOUT=float(os.getenv("PARTITION_TIMEOUT","600"))
+# seconds past PARTITION_TIMEOUT before a job that ignores the timeout has its worker killed
+PARTITION_KILL_GRACE=float(os.getenv("PARTITION_KILL_GRACE","30"))
+PARTITION_MAX_TASKS_PER_CHILD=int(os.getenv("PARTITION_MAX_TASKS_PER_CHILD","50"))
+# off by default: hi_res (torch/onnx) reserves far more address space than it uses
+PARTITION_MEMORY_MB=int(os.getenv("PARTITION_MEMORY_MB","0"))
+PARTITION_PAGE_PARALLEL=os.getenv("PARTITION_PAGE_PARALLEL","1")=="1"
+PARTITION_MIN_PAGES_PER_RANGE=int(os.getenv("PARTITION_MIN_PAGES_PER_RANGE","4"))
+
+
+class PartitionError(Exception):
+    """Raised when a partition job times out or its worker process dies"""
+
+
+def clean_text(text: str) -> str:
+    text = text.replace("“", '"').replace("”", '"').replace("‘", "'").replace("’", "'")
+    return text
+
+
+def partition_pdf_elements(pdf_bytes: bytes, quality: str, page_offset: int = 0) -> List[Tuple[int, str, str]]:
+    """Partition raw pdf bytes into (page, category, text) tuples in document order"""
+    from unstructured.partition.pdf import partition_pdf
+
+    pdf_file_like = BytesIO(pdf_bytes)
+    elements = partition_pdf(
+        file=pdf_file_like,
+        strategy="hi_res" if quality == "H" else "fast",
+        infer_table_structure=True if quality == "H" else False,
+        languages=['english']
+    )
+    items = []
+    for el in elements:
+        if hasattr(el, "text") and el.text.strip():
+            page = getattr(el.metadata, "page_number", 0) or 0
+            items.append((page + page_offset, el.category, el.text.strip()))
+    return items
+
+
+def format_elements(items: List[Tuple[int, str, str]]) -> str:
+    """Render elements into the {PAGE X} / [Category] text layout"""
+    pages = {}
+    # Group text by page
+    for page, category, text in items:
+        pages.setdefault(page, []).append((category, text))
+
+    # Combine each page into a single string with page marker
+    all_text = ""
+    for page, page_items in sorted(pages.items()):
+        all_text += f"{{PAGE {page}}}\\n"
+        for category, text in page_items:
+            cleaned_text = clean_text(text)  # clean each text block
+            all_text += f"[{category}] {cleaned_text}\\n"
+        all_text += "\\n"
+
+    return all_text
+
+
+def partition_pdf_bytes(pdf_bytes: bytes, quality: str) -> str:
+    """Partition raw pdf bytes; returns a single string with page markers"""
+    return format_elements(partition_pdf_elements(pdf_bytes, quality))
+
+
+def count_pdf_pages(pdf_bytes: bytes) -> int:
+    return len(PdfReader(BytesIO(pdf_bytes)).pages)
+
+
+def split_pdf_pages(pdf_bytes: bytes, pages_per_range: int) -> List[Tuple[int, bytes]]:
+    """Split a pdf into standalone pdfs of `pages_per_range` pages; returns (page_offset, bytes) pairs"""
+    reader = PdfReader(BytesIO(pdf_bytes))
+    total = len(reader.pages)
+    ranges = []
+    for start in range(0, total, pages_per_range):
+        writer = PdfWriter()
+        for index in range(start, min(start + pages_per_range, total)):
+            writer.add_page(reader.pages[index])
+        buffer = BytesIO()
+        writer.write(buffer)
+        ranges.append((start, buffer.getvalue()))
+    return ranges
+
+
+_task_pids=None
+
+
+def _init_worker(memory_mb:int,task_pids):
+    """Runs first in every partition process"""
+    global _task_pids
+    _task_pids=task_pids
+    if memory_mb<=0:
+        return
+    try:
+        import resource
+        limit=memory_mb*1024*1024
+        resource.setrlimit(resource.RLIMIT_AS,(limit,limit))
+    except (ImportError,ValueError,OSError) as e:
+        print(f"Partition worker memory cap not applied: {e}")
+
+
+def _run_task(task_id:int,timeout:float,fn,args):
+    """Runs one job inside a pool worker: reports the worker pid, then runs `fn` under a soft timeout"""
+    _task_pids.put((task_id,os.getpid()))  # type: ignore
+
+    def expired(signum,frame):
+        raise PartitionError(f"Partitioning timed out after {timeout}s")
+
+    # the alarm only interrupts python code; a job stuck in native code is killed by the parent
+    alarm=hasattr(signal,"SIGALRM") and timeout>0
+    if alarm:
+        signal.signal(signal.SIGALRM,expired)
+        signal.setitimer(signal.ITIMER_REAL,timeout)
+    try:
+        return fn(*args)
+    finally:
+        if alarm:
+            signal.setitimer(signal.ITIMER_REAL,0)
+
+
+class PartitionExecutor:
+    """
+    Persistent pool of spawned partition processes, so unstructured and the hi_res
+    models are loaded once per worker instead of once per job or page range.
+    Workers are recycled after PARTITION_MAX_TASKS_PER_CHILD jobs to bound leaks.
+
+    A job over PARTITION_TIMEOUT is interrupted inside its worker, which stays alive.
+    If it does not return within PARTITION_KILL_GRACE more seconds, only that worker
+    is killed. A dead worker (crash, OOM kill or the kill above) breaks the whole pool,
+    so the pool is rebuilt and the other jobs that were in flight are retried once,
+    each in a single worker pool of its own.
+    """
+
+    def __init__(self,workers:int=PARTITION_WORKERS,timeout:float=PARTITION_TIMEOUT,memory_mb:int=PARTITION_MEMORY_MB,max_tasks_per_child:int=PARTITION_MAX_TASKS_PER_CHILD) -> None:
+        self.workers=workers
+        self.timeout=timeout
+        self.memory_mb=memory_mb
+        self.max_tasks_per_child=max_tasks_per_child
+        self._semaphore:Optional[asyncio.Semaphore]=None
+        self._pool:Optional[ProcessPoolExecutor]=None
+        # pids reported by tasks as they start, shared by every pool of the executor
+        self._task_pids=None
+        self._pids:Dict[int,int]={}
+        self._task_ids=itertools.count()
+
+    def _new_pool(self,workers:int)->ProcessPoolExecutor:
+        ctx=multiprocessing.get_context("spawn")
+        if self._task_pids is None:
+            self._task_pids=ctx.Queue()
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=ctx,
+            initializer=_init_worker,
+            initargs=(self.memory_mb,self._task_pids),
+            max_tasks_per_child=self.max_tasks_per_child or None,
+        )
+
+    def _get_pool(self)->ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool=self._new_pool(self.workers)
+        return self._pool
+
+    def _reset(self,pool:ProcessPoolExecutor):
+        """Drop a broken pool; the next job starts a fresh one"""
+        if self._pool is pool:
+            self._pool=None
+            pool.shutdown(wait=False,cancel_futures=True)
+
+    def _worker_pid(self,task_id:int)->Optional[int]:
+        """Pid of the worker running `task_id`, forgetting it"""
+        while self._task_pids is not None:
+            try:
+                started,pid=self._task_pids.get_nowait()
+            except (queue.Empty,OSError,EOFError):
+                break
+            self._pids[started]=pid
+        return self._pids.pop(task_id,None)
+
+    async def _run_on(self,pool:ProcessPoolExecutor,fn,args):
+        task_id=next(self._task_ids)
+        try:
+            future=asyncio.wrap_future(pool.submit(_run_task,task_id,self.timeout,fn,args))
+            return await asyncio.wait_for(future,timeout=self.timeout+PARTITION_KILL_GRACE if self.timeout>0 else None)
+        except asyncio.TimeoutError:
+            pid=self._worker_pid(task_id)
+            if pid is not None:
+                with contextlib.suppress(OSError):
+                    os.kill(pid,signal.SIGKILL)
+            self._reset(pool)
+            raise PartitionError(f"Partitioning timed out after {self.timeout}s")
+        except MemoryError:
+            raise PartitionError(f"Partition worker exceeded {self.memory_mb}MB")
+        finally:
+            self._worker_pid(task_id)
+
+    async def run(self,fn,*args):
+        if self._semaphore is None:
+            self._semaphore=asyncio.Semaphore(self.workers)
+        # a free worker is waiting for the job, so the timeout does not count queueing
+        async with self._semaphore:
+            pool=self._get_pool()
+            try:
+                return await self._run_on(pool,fn,args)
+            except BrokenProcessPool:
+                self._reset(pool)
+            # every job in flight fails with the dead worker; each is retried in a pool of its
+            # own, so a job that crashes again cannot take the others down a second time
+            print("Partition pool broken by a dead worker, retrying the job in its own process")
+            isolated=self._new_pool(1)
+            try:
+                return await self._run_on(isolated,fn,args)
+            except BrokenProcessPool:
+                raise PartitionError("Partition worker crashed")
+            finally:
+                isolated.shutdown(wait=False,cancel_futures=True)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._worker_pid(-1)
+            for pid in self._pids.values():
+                with contextlib.suppress(OSError):
+                    os.kill(pid,signal.SIGKILL)
+            self._reset(self._pool)
+
+
+partition_executor=PartitionExecutor()
+
+
+async def download_pdf(url:str)->bytes:
+    return await read_object(url)
+
+
+async def partition_pages_parallel(pdf_bytes:bytes,quality:str)->str:
+    """Partition page ranges concurrently across the pool and merge them back in page order"""
+    total_pages=await asyncio.to_thread(count_pdf_pages,pdf_bytes)
+    pages_per_range=max(PARTITION_MIN_PAGES_PER_RANGE,math.ceil(total_pages/partition_executor.workers))
+    if total_pages<=pages_per_range:
+        return await partition_executor.run(partition_pdf_bytes,pdf_bytes,quality)
+
+    ranges=await asyncio.to_thread(split_pdf_pages,pdf_bytes,pages_per_range)
+    print(f"Partitioning {total_pages} pages in {len(ranges)} ranges of {pages_per_range}")
+    results=await asyncio.gather(*[
+        partition_executor.run(partition_pdf_elements,range_bytes,quality,offset)
+        for offset,range_bytes in ranges
+    ])
+    # gather keeps range order and each range is already in document order
+    return format_elements([item for range_items in results for item in range_items])
+
+
+async def partition_pdf_bytes_async(pdf_bytes:bytes,quality:str,page_parallel:bool=PARTITION_PAGE_PARALLEL)->str:
+    if page_parallel:
+        return await partition_pages_parallel(pdf_bytes,quality)
+    return await partition_executor.run(partition_pdf_bytes,pdf_bytes,quality)
@@ -0,0 +1,183 @@
+"""
+Staged async pipeline connected by bounded queues.
+
+Each stage has a fixed number of worker coroutines pulling (context, payload) items
+from its queue; a handler pushes its output into the next stage with `Stage.put`,
+which blocks while that queue is full. A slow stage therefore throttles the stages
+feeding it (backpressure) instead of letting work pile up in memory, while all
+stages keep running at the same time for different chunks and documents.
+
+Per stage counters: items processed, errors, busy time, average/max latency,
+queue depth and time producers spent blocked on a full queue, plus any extra
+metrics registered by the pipeline's owner (e.g. extraction chunk coverage).
+Worker processes publish them to redis (PIPELINE_METRICS_KEY) for /metrics/pipeline.
+"""
+import asyncio
+import json
+import os
+import socket
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from src.database.redis_client import redis_client
+
+PIPELINE_METRICS_KEY="pipeline:metrics:{host}:{pid}"
+PIPELINE_METRICS_TTL=int(os.getenv("PIPELINE_METRICS_TTL","300"))
+
+
+class PipelineContext:
+    """State of one unit of work (a document) travelling through the stages"""
+
+    def __init__(self) -> None:
+        self.future:asyncio.Future=asyncio.get_running_loop().create_future()
+
+    @property
+    def finished(self)->bool:
+        # also true when the submitter stopped waiting (cancelled)
+        return self.future.done()
+
+    def resolve(self,result:Any=None):
+        if not self.future.done():
+            self.future.set_result(result)
+
+    def fail(self,error:BaseException):
+        if not self.future.done():
+            self.future.set_exception(error)
+
+
+class StageMetrics:
+    def __init__(self) -> None:
+        self.items=0
+        self.errors=0
+        self.busy_seconds=0.0
+        self.max_latency=0.0
+        self.blocked_seconds=0.0
+
+    def record(self,seconds:float):
+        self.items+=1
+        self.busy_seconds+=seconds
+        self.max_latency=max(self.max_latency,seconds)
+
+
+class Stage:
+    def __init__(self,name:str,handler:Callable[[Any,Any],Awaitable[None]],workers:int,queue_size:int) -> None:
+        self.name=name
+        self.handler=handler
+        self.workers=max(1,workers)
+        self.queue:asyncio.Queue[Tuple[PipelineContext,Any]]=asyncio.Queue(maxsize=max(1,queue_size))
+        self.metrics=StageMetrics()
+        self._busy=0
+        self._started=time.perf_counter()
+        self._tasks:List[asyncio.Task]=[]
+
+    async def put(self,context:PipelineContext,payload:Any=None):
+        if self.queue.full():
+            start=time.perf_counter()
+            await self.queue.put((context,payload))
+            self.metrics.blocked_seconds+=time.perf_counter()-start
+        else:
+            self.queue.put_nowait((context,payload))
+
+    async def _work(self):
+        while True:
+            context,payload=await self.queue.get()
+            try:
+                # items of a failed or abandoned document are dropped
+                if context.finished:
+                    continue
+                self._busy+=1
+                start=time.perf_counter()
+                try:
+                    await self.handler(context,payload)
+                finally:
+                    self._busy-=1
+                    self.metrics.record(time.perf_counter()-start)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.metrics.errors+=1
+                print(f"Pipeline stage {self.name} error: {e}")
+                context.fail(e)
+            finally:
+                self.queue.task_done()
+
+    def start(self):
+        # a fresh queue, bound to the loop the workers run on
+        self.queue=asyncio.Queue(maxsize=self.queue.maxsize)
+        self._started=time.perf_counter()
+        self._tasks=[asyncio.ensure_future(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks,return_exceptions=True)
+        self._tasks=[]
+
+    def stats(self)->Dict[str,Any]:
+        m=self.metrics
+        return {
+            "workers":self.workers,
+            "busy_workers":self._busy,
+            "queue_depth":self.queue.qsize(),
+            "queue_size":self.queue.maxsize,
+            "items":m.items,
+            "errors":m.errors,
+            "avg_latency":m.busy_seconds/m.items if m.items else 0.0,
+            "max_latency":m.max_latency,
+            # busy worker seconds per worker: how saturated the stage is
+            "utilization":m.busy_seconds/(self.workers*max(1e-9,time.perf_counter()-self._started)),
+            "backpressure_seconds":m.blocked_seconds,
+        }
+
+
+class Pipeline:
+    def __init__(self,stages:List[Stage],extra_metrics:Optional[Dict[str,Callable[[],Dict[str,Any]]]]=None) -> None:
+        self.stages=stages
+        self.extra_metrics=extra_metrics or {}
+        self._loop:Optional[asyncio.AbstractEventLoop]=None
+
+    def __getitem__(self,name:str)->Stage:
+        for stage in self.stages:
+            if stage.name==name:
+                return stage
+        raise KeyError(name)
+
+    def start(self):
+        """Start the stage workers on the running loop (idempotent)"""
+        loop=asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self._loop=loop
+        for stage in self.stages:
+            stage.start()
+
+    async def stop(self):
+        for stage in self.stages:
+            await stage.stop()
+        self._loop=None
+
+    def metrics(self)->Dict[str,Any]:
+        metrics={stage.name:stage.stats() for stage in self.stages}
+        for name,stats in self.extra_metrics.items():
+            metrics[name]=stats()
+        return metrics
+
+    async def publish_metrics(self):
+        try:
+            key=PIPELINE_METRICS_KEY.format(host=socket.gethostname(),pid=os.getpid())
+            await redis_client.set(key,json.dumps(self.metrics()),ex=PIPELINE_METRICS_TTL)
+        except Exception as e:
+            print(f"Pipeline metrics publish error: {e}")
+
+
+async def collect_pipeline_metrics()->Dict[str,Any]:
+    """Latest published stage metrics of every live worker process"""
+    result={}
+    try:
+        async for key in redis_client.scan_iter(match=PIPELINE_METRICS_KEY.format(host="*",pid="*")):
+            value=await redis_client.get(key)
+            if value:
+                name=key.decode() if isinstance(key,bytes) else key
+                result[name.split(":",2)[2]]=json.loads(value)
+    except Exception as e:
+        print(f"Pipeline metrics read error: {e}")
+    return result
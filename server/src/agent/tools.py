@@ -7,10 +7,37 @@ from .graph_config import driver
 from typing import List,Dict,Any      
 from langchain_core.documents import Document
 import json
-import spacy
+import time
+from .model_registry import model_registry, QUERY_PIPELINE
+from .graph_index import ENTITY_FULLTEXT_INDEX, fulltext_query
+from .multi_hop import find_paths
+from .graph_snapshot import snapshot_cache
+
+
+class ToolMetrics:
+    """Per-tool call counts, neo4j round trips and latency"""
+
+    def __init__(self) -> None:
+        self._stats:Dict[str,Dict[str,float]]={}
+
+    def record(self,tool_name:str,round_trips:int,seconds:float):
+        stats=self._stats.setdefault(tool_name,{"calls":0,"round_trips":0,"total_seconds":0.0})
+        stats["calls"]+=1
+        stats["round_trips"]+=round_trips
+        stats["total_seconds"]+=seconds
+        print(f"{tool_name}: {round_trips} round trip(s) in {seconds*1000:.1f}ms")
+
+    def stats(self)->Dict[str,Dict[str,float]]:
+        return {
+            name:{**stats,"round_trips_per_call":stats["round_trips"]/stats["calls"],"avg_ms":1000*stats["total_seconds"]/stats["calls"]}
+            for name,stats in self._stats.items()
+        }
+
+
+tool_metrics=ToolMetrics()
 def _create_kg_search_tool(document_id:str) -> BaseTool:
         """Create knowledge graph search tool for agent"""
-        nlp_model = spacy.load("en_core_web_sm")
+        nlp_model = model_registry.get_spacy(QUERY_PIPELINE)
         @tool
         async def search_kg(query: str, document_id: str):
             """Search the knowledge graph for relevant relationships with extended triple schema."""
@@ -33,70 +60,88 @@ def _create_kg_search_tool(document_id:str) -> BaseTool:
                 if not entities:
                     return "[]"
 
+                searches = [q for q in (fulltext_query(entity, document_id) for entity in entities[:5]) if q]
+                if not searches:
+                    return "[]"
+
                 results_json = []
                 seen = set()
 
+                # one round trip for all entities: anchor each on the document-scoped
+                # full-text index, expand, and rank relationships matched by more entities first
                 query_cypher = """
-                    MATCH (n:Entity)-[r:RELATED]->(m:Entity)
-                    WHERE (toLower(n.name) CONTAINS $entity OR toLower(m.name) CONTAINS $entity)
-                    AND r.document_id = $document_id
+                    UNWIND range(0, size($searches) - 1) AS i
+                    CALL {
+                        WITH i
+                        CALL db.index.fulltext.queryNodes($index, $searches[i]) YIELD node AS e, score
+                        WITH e, score ORDER BY score DESC LIMIT $anchors
+                        RETURN e, score
+                    }
+                    MATCH (e)-[r:RELATED]-(:Entity)
+                    WHERE r.document_id = $document_id
+                    WITH r, count(DISTINCT i) AS hits, max(score) AS score
+                    ORDER BY hits DESC, score DESC
+                    LIMIT $limit
+                    WITH r, startNode(r) AS n, endNode(r) AS m
                     RETURN n.name AS subject, n.type AS subject_type,
                         r.type AS relation, r.evidence AS evidence,
                         r.page AS page, r.confidence AS confidence,
                         m.name AS object, m.type AS object_type
-                    LIMIT $limit
                 """
 
-                async with driver.session() as session:
-                    for entity in entities[:5]:
-                        try:
-                            result = await session.run(
-                                query_cypher,
-                                entity=entity.lower(),
-                                document_id=document_id,
-                                limit=50,
-                            )
-                            records = [record async for record in result]
-
-                            for rec in records:
-                                row = rec.data()
-                                subj = row.get("subject")
-                                obj = row.get("object")
-                                rel = row.get("relation")
-                                evidence = row.get("evidence", "")
-                                page = row.get("page", "NAN")
-                                confidence = row.get("confidence", "medium")
-                                sub_type = row.get("subject_type", "Concept")
-                                obj_type = row.get("object_type", "Concept")
-
-                                if not subj or not obj or not rel:
-                                    continue
-
-                                # Normalize relation
-                                rel_norm = "_".join(rel.strip().split()).lower()
-
-                                key = f"{subj}→{rel_norm}→{obj}"
-                                if key in seen:
-                                    continue
-                                seen.add(key)
-
-                                # Escape evidence
-                                evidence = evidence.replace('"', '\\"').replace("\n", "\\n").replace("\t", "\\t")
-
-                                results_json.append({
-                                    "subject": subj,
-                                    "subject_type": sub_type,
-                                    "relation": rel_norm,
-                                    "object": obj,
-                                    "object_type": obj_type,
-                                    "evidence": evidence,
-                                    "formality_level": "conceptual",  # default
-                                    "page": page,
-                                    "confidence": confidence
-                                })
-
-                        except Exception as e:
-                            print(f"Query error for entity={entity}: {e}")
+                start = time.perf_counter()
+                snapshot = await snapshot_cache.get(document_id)
+                if snapshot is not None:
+                    rows = snapshot.search(entities[:5])
+                    tool_metrics.record("search_kg", round_trips=0, seconds=time.perf_counter() - start)
+                else:
+                    async with driver.session() as session:
+                        result = await session.run(
+                            query_cypher,
+                            index=ENTITY_FULLTEXT_INDEX,
+                            searches=searches,
+                            anchors=25,
+                            document_id=document_id,
+                            limit=50 * len(searches),
+                        )
+                        rows = [record.data() async for record in result]
+                    tool_metrics.record("search_kg", round_trips=1, seconds=time.perf_counter() - start)
+
+                for row in rows:
+                    subj = row.get("subject")
+                    obj = row.get("object")
+                    rel = row.get("relation")
+                    evidence = row.get("evidence") or ""
+                    page = row.get("page", "NAN")
+                    confidence = row.get("confidence", "medium")
+                    sub_type = row.get("subject_type", "Concept")
+                    obj_type = row.get("object_type", "Concept")
+
+                    if not subj or not obj or not rel:
+                        continue
+
+                    # Normalize relation
+                    rel_norm = "_".join(rel.strip().split()).lower()
+
+                    key = f"{subj}→{rel_norm}→{obj}"
+                    if key in seen:
+                        continue
+                    seen.add(key)
+
+                    # Escape evidence
+                    evidence = evidence.replace('"', '\\"').replace("\n", "\\n").replace("\t", "\\t")
+
+                    results_json.append({
+                        "subject": subj,
+                        "subject_type": sub_type,
+                        "relation": rel_norm,
+                        "object": obj,
+                        "object_type": obj_type,
+                        "evidence": evidence,
+                        "formality_level": "conceptual",  # default
+                        "page": page,
+                        "confidence": confidence
+                    })
 
                 return json.dumps(results_json, indent=2) if results_json else "[]"
 
@@ -120,24 +165,45 @@ def _create_kg_entity_lookup_tool(document_id:str) -> BaseTool:
             Use this when you need comprehensive information about a specific concept.
             """
             try:
-                query = """
+                # exact (document_id, name_lower) index seek first, full-text prefix match otherwise
+                exact_query = """
+                MATCH (e:Entity {document_id: $document_id, name_lower: $name})-[r]->(target)
+                WHERE r.document_id=$document_id
+                RETURN e.name + ' --' + type(r) + '--> ' + target.name AS relationship, r.evidence as evidence
+                LIMIT 20
+                """
+                fulltext_lookup = """
+                CALL db.index.fulltext.queryNodes($index, $search) YIELD node AS e, score
+                WITH e ORDER BY score DESC LIMIT 10
                 MATCH (e)-[r]->(target)
-                WHERE toLower(e.name) CONTAINS toLower($entity) AND r.document_id=$document_id
+                WHERE r.document_id=$document_id
                 RETURN e.name + ' --' + type(r) + '--> ' + target.name AS relationship, r.evidence as evidence
                 LIMIT 20
                 """
                 
-                async with driver.session() as session:
-                    results = await session.run(query, entity=entity_name,document_id=document_id)
-                    records= [record async for record in results]
+                start = time.perf_counter()
+                snapshot = await snapshot_cache.get(document_id)
+                if snapshot is not None:
+                    records = snapshot.lookup(entity_name)
+                    round_trips = 0
+                else:
+                    round_trips = 1
+                    async with driver.session() as session:
+                        results = await session.run(exact_query, name=entity_name.strip().lower(),document_id=document_id)
+                        records= [record.data() async for record in results]
+                        search = fulltext_query(entity_name, document_id)
+                        if not records and search:
+                            round_trips += 1
+                            results = await session.run(fulltext_lookup, index=ENTITY_FULLTEXT_INDEX, search=search, document_id=document_id)
+                            records= [record.data() async for record in results]
+                tool_metrics.record("entity_lookup", round_trips=round_trips, seconds=time.perf_counter() - start)
                 
                 if not records:
                     return f"No relationships found for entity: {entity_name}"  
                 
                 # Safely extract relationships
                 relationships = []
-                for r in records:
-                    rec=r.data()
+                for rec in records:
                     if rec and "relationship" in rec:
                         relationship = rec["relationship"]
                         evidence = rec.get("evidence", "No evidence")
@@ -162,32 +228,21 @@ def _create_multi_hop_tool(document_id:str) -> BaseTool:
             Use this for complex questions requiring chaining multiple relationships.
             """
             try:
-                # Simple multi-hop query
-                query = """
-                  MATCH path = (start)-[*1..3]->(end)
-WHERE (toLower(start.name) CONTAINS $user_query
-   OR toLower(end.name) CONTAINS $user_query)
-AND ALL(rel IN relationships(path) WHERE rel.document_id = $document_id)
-WITH path, length(path) AS pathLength
-ORDER BY pathLength
-LIMIT 10
-RETURN
-    [node IN nodes(path) | node.name] AS entities,
-    [rel IN relationships(path) | type(rel)] AS relations,
-    [rel IN relationships(path) | rel.evidence] AS evidence;
-
-                """
-                
-                async with driver.session() as session:
-                    results = await session.run(query, user_query=path_query,document_id=document_id)
-                    records=[record async for record in results]
+                # anchored, document-scoped and bounded; see multi_hop.py
+                start_time = time.perf_counter()
+                snapshot = await snapshot_cache.get(document_id)
+                if snapshot is not None:
+                    records, round_trips = snapshot.paths(path_query), 0
+                else:
+                    async with driver.session() as session:
+                        records, round_trips = await find_paths(session, path_query, document_id)
+                tool_metrics.record("multi_hop_search", round_trips=round_trips, seconds=time.perf_counter() - start_time)
                 
                 if not records:
                     return "No multi-hop paths found."
                 
                 formatted = []
-                for i, record in enumerate(records, 1):
-                    rec = record.data()
+                for i, rec in enumerate(records, 1):
                     if not rec:
                         continue
 
@@ -3,7 +3,7 @@ from fastapi import APIRouter, Body, Depends, HTTPException
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.status import HTTP_201_CREATED
-from src.database.crud.agent_session import get_agent_session
+from src.database.crud.agent_session import ask_agent_session
 from src.database.deps import get_db
 from src.schemas.response import  AgentResponse, SessionOut
 from src.schemas.request import SessionBody
@@ -23,9 +23,9 @@ async def create_session(new_session:SessionBody,db:AsyncSession=Depends(get_db)
 
 @session_router.post("/ask",response_model=AgentResponse)
 async def get_agent(session_in:SessionBody,question:str=Body()):
-    agent=await get_agent_session(**session_in.model_dump())
-    if agent:
-        response=await agent.answer_question(question)
+    # repeated questions on an unchanged graph are served from the answer cache
+    response=await ask_agent_session(**session_in.model_dump(),question=question)
+    if response:
         return response["answer"]
     else:
         raise  HTTPException(status_code=500,detail="Failed to initialize the agent response")
@@ -1,24 +1,45 @@
+import json
+import os
 from fastapi import APIRouter, Body, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from starlette.status import HTTP_404_NOT_FOUND
+from starlette.status import HTTP_400_BAD_REQUEST, HTTP_404_NOT_FOUND
 from src.database.crud.document import DocumentCRUD
 from src.database.deps import get_db
 from src.database.models import DocumentModel
 from src.schemas.request import SessionBody
-from src.utils.extractor import get_pdf_from_url
+from src.utils.citations import EvidenceStreamParser, parse_answer
+from src.utils.extractor import get_document_pages, join_pages
+from src.agent.deep_retrieval import retrieve_passages
 from src.test import answer_question
-import asyncio
 
 deep_agent_router = APIRouter(prefix="/deep")
 doc_crud = DocumentCRUD(DocumentModel)
+# "auto" sends the full text for short papers and top-k passages for long ones
+DEEP_FULLTEXT_MAX_CHARS = int(os.getenv("DEEP_FULLTEXT_MAX_CHARS", "60000"))
 
-@deep_agent_router.post("/ask")
-async def question(session: SessionBody, query: str = Body(), db: AsyncSession = Depends(get_db)):
+
+async def _get_document_text(session: SessionBody, query: str, mode: str, db: AsyncSession) -> str:
     doc_obj = await doc_crud.get(db, session.document_id)
     if not doc_obj:
         raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="Document not found")
+    if mode not in ("auto", "full", "retrieval"):
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail="mode must be one of auto, full, retrieval")
+
+    pages = await get_document_pages(doc_obj.document_id, str(doc_obj.file_path), db)  # type: ignore
+    text = join_pages(pages)
+    if mode == "full" or (mode == "auto" and len(text) <= DEEP_FULLTEXT_MAX_CHARS):
+        return text
+    return await retrieve_passages(doc_obj.document_id, pages, query)
+
 
-    text = await get_pdf_from_url(url=str(doc_obj.file_path))
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@deep_agent_router.post("/ask")
+async def question(session: SessionBody, query: str = Body(), mode: str = Body("auto"), db: AsyncSession = Depends(get_db)):
+    text = await _get_document_text(session, query, mode, db)
 
     # --- collect full answer ---
     full_answer = []
@@ -27,23 +48,48 @@ async def question(session: SessionBody, query: str = Body(), db: AsyncSession =
     full_answer_text = "".join(full_answer)
 
     # --- parse citations ---
-    answer_text = full_answer_text
-    citations = []
-
-
-    print(answer_text)
-
-    if "---EVIDENCE---" in full_answer_text:
-        parts = full_answer_text.split("---EVIDENCE---")
-        answer_text = parts[0].strip()
-        evidence_text = parts[1].replace("---END-EVIDENCE---", "").strip()
-        # parse each citation line
-        lines = evidence_text.splitlines()
-        for i in range(0, len(lines), 2):
-            if i + 1 < len(lines):
-                citations.append(lines[i+1].strip())
+    answer_text, citations = parse_answer(full_answer_text)
 
     return {
         "answer": answer_text,
         "citations": citations
     }
+
+
+@deep_agent_router.post("/ask/stream")
+async def question_stream(session: SessionBody, query: str = Body(), mode: str = Body("auto"), db: AsyncSession = Depends(get_db)):
+    """
+    Server-Sent Events version of /ask:
+     - event: token    -> answer text as it is generated (evidence block withheld)
+     - event: citation -> {"index": n, "text": ...} as soon as each evidence line completes
+     - event: done     -> {"answer": ..., "citations": [...]}
+     - event: error    -> {"detail": ...}
+    """
+    text = await _get_document_text(session, query, mode, db)
+
+    async def event_stream():
+        parser = EvidenceStreamParser()
+
+        def events(answer_text, new_citations):
+            if answer_text:
+                yield _sse("token", answer_text)
+            first_index = len(parser.citations) - len(new_citations) + 1
+            for index, citation in enumerate(new_citations, start=first_index):
+                yield _sse("citation", {"index": index, "text": citation})
+
+        try:
+            async for chunk in answer_question(query, text):
+                for event in events(*parser.feed(chunk)):
+                    yield event
+            for event in events(*parser.close()):
+                yield event
+            yield _sse("done", {"answer": parser.answer, "citations": parser.citations})
+        except Exception as e:
+            print(f"Deep stream error: {e}")
+            yield _sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,56 @@
+from fastapi import APIRouter
+from src.agent.agent_pool import agent_pool
+from src.agent.answer_cache import answer_cache
+from src.agent.graph_config import pool_metrics
+from src.agent.llm_scheduler import llm_scheduler
+from src.agent.model_registry import model_registry
+from src.agent.pipeline import collect_pipeline_metrics
+from src.agent.tools import tool_metrics
+
+metrics_router=APIRouter(prefix="/metrics")
+
+
+@metrics_router.get("/models")
+async def model_metrics():
+    """Load time and memory of the shared NLP models"""
+    return model_registry.metrics()
+
+
+@metrics_router.get("/agents")
+async def agent_pool_metrics():
+    return agent_pool.stats()
+
+
+@metrics_router.get("/tools")
+async def tool_call_metrics():
+    """Neo4j round trips and latency per agent tool call"""
+    return tool_metrics.stats()
+
+
+
+@metrics_router.get("/neo4j")
+async def neo4j_pool_metrics():
+    """Connection pool configuration and warm-up time"""
+    return pool_metrics()
+
+
+
+@metrics_router.get("/llm")
+async def llm_scheduler_metrics():
+    """Adaptive concurrency, queue depth and 429s per LLM provider"""
+    return llm_scheduler.metrics()
+
+
+
+@metrics_router.get("/pipeline")
+async def ingestion_pipeline_metrics():
+    """Throughput, latency, queue depth and backpressure per ingestion stage, and extraction
+    chunk coverage, per worker process"""
+    return await collect_pipeline_metrics()
+
+
+
+@metrics_router.get("/answers")
+async def answer_cache_metrics():
+    """Exact and semantic hits of the /agent/session/ask answer cache"""
+    return answer_cache.stats()
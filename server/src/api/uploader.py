@@ -1,4 +1,5 @@
 import uuid
+from typing import List
 from fastapi import APIRouter, Depends, File, Form, HTTPException ,UploadFile
 from src.database.crud.chat_session import ChatSessionCRUD
 from src.schemas.request import AskQuery, SessionBody
@@ -8,14 +9,19 @@ from src.database.crud.storage import StorageCRUD
 from src.database.deps import get_db
 from src.database.models import DocumentModel
 from src.schemas.document import  DocumentOut
-from starlette.status import HTTP_201_CREATED, HTTP_400_BAD_REQUEST, HTTP_500_INTERNAL_SERVER_ERROR 
-from src.agent.builder import build_knowledge_graph
-from src.schemas.response import AgentResponse,ExtractionResponse
+from starlette.status import HTTP_201_CREATED, HTTP_400_BAD_REQUEST, HTTP_404_NOT_FOUND, HTTP_409_CONFLICT, HTTP_413_CONTENT_TOO_LARGE, HTTP_500_INTERNAL_SERVER_ERROR 
+from src.database.crud.ingestion_job import IngestionJobCRUD
+from src.agent.builder import FAST_QUALITY, HI_RES_QUALITY, INGESTION_TIERED
+from src.ingestion.batch import BatchTooLarge, collect_batch_pdfs
+from src.ingestion.queue import enqueue_job, request_cancel
+from src.schemas.response import AgentResponse,BatchFileResult,BatchStatusResponse,BatchUploadResponse,ExtractionResponse,IngestionJobOut
 upload_router=APIRouter(prefix="/upload")
 
 
 document_crud=DocumentCRUD(DocumentModel)       
 storage_crud=StorageCRUD()
+# fast tier first when tiered, the worker queues the hi_res upgrade
+UPLOAD_QUALITY=FAST_QUALITY if INGESTION_TIERED else HI_RES_QUALITY
 
 @upload_router.post("/pdf",response_model=ExtractionResponse,status_code=HTTP_201_CREATED)
 async def extract_pdf(user_id:uuid.UUID=Form(...,description="user id"),file:UploadFile=File(...,description="pdf file to upload"),db:AsyncSession=Depends(get_db)):
@@ -43,15 +49,21 @@ async def extract_pdf(user_id:uuid.UUID=Form(...,description="user id"),file:Upl
 
             )
         doc_out=await document_crud.create(db=db,obj_in=doc_in)
-        await build_knowledge_graph(pdf_path=str(doc_out.file_path),document_id=str(doc_out.document_id),provider="gemini",model="gemini-2.5-flash",quality="H")
+        document_id=uuid.UUID(str(doc_out.document_id))
 
-        session_in=SessionBody(user_id=user_id,document_id=uuid.UUID(str(doc_out.document_id)),provider="gemini",model="gemini-2.5-flash")
+        session_in=SessionBody(user_id=user_id,document_id=document_id,provider="gemini",model="gemini-2.5-flash")
         session_out=await ChatSessionCRUD.create_session(session_in,db)
 
-        response=ExtractionResponse(doc_out=doc_out,session_out=session_out)
+        # graph building happens in the ingestion worker, see src/ingestion/worker.py
+        job_out=await IngestionJobCRUD.create_job(document_id,user_id,"gemini","gemini-2.5-flash",UPLOAD_QUALITY,db)
+        await enqueue_job(job_out.job_id)
+
+        response=ExtractionResponse(doc_out=doc_out,session_out=session_out,job_out=job_out)
 
         return response 
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error reading file:{e}")
         raise HTTPException( 
@@ -60,4 +72,95 @@ async def extract_pdf(user_id:uuid.UUID=Form(...,description="user id"),file:Upl
             )
 
 
+@upload_router.post("/batch",response_model=BatchUploadResponse,status_code=HTTP_201_CREATED)
+async def extract_pdf_batch(user_id:uuid.UUID=Form(...,description="user id"),files:List[UploadFile]=File(...,description="pdf files and/or zip archives of pdfs"),db:AsyncSession=Depends(get_db)):
+    """
+    Upload many papers at once. Every distinct pdf gets a document, a chat session and an
+    ingestion job tagged with the batch id; pdfs whose content the user already uploaded
+    (or that appear twice in the batch) are reported as duplicates and not processed again.
+    Progress per file: GET /upload/batches/{batch_id}
+    """
+    try:
+        pdfs=await collect_batch_pdfs(files)
+    except BatchTooLarge as e:
+        raise HTTPException(
+            status_code=HTTP_413_CONTENT_TOO_LARGE,
+            detail=str(e)
+        )
+    try:
+        batch_id=uuid.uuid4()
+        existing=await document_crud.get_by_hashes(db,user_id,[pdf.content_hash for pdf in pdfs if pdf.content_hash])
+        seen:dict={}
+        results=[]
+        for pdf in pdfs:
+            if pdf.error:
+                results.append(BatchFileResult(file_name=pdf.file_name,status="rejected",detail=pdf.error))
+                continue
+            duplicate=existing.get(pdf.content_hash) or seen.get(pdf.content_hash)  # type: ignore
+            if duplicate is not None:
+                results.append(BatchFileResult(
+                    file_name=pdf.file_name,status="duplicate",document_id=duplicate.document_id,
+                    detail="Same content as an already uploaded document"
+                ))
+                continue
+            try:
+                doc_in=await storage_crud.upload_fileobj(user_id,pdf.file_name,pdf.fileobj)  # type: ignore
+                doc_out=await document_crud.create(db=db,obj_in=doc_in)
+                seen[pdf.content_hash]=doc_out
+                document_id=uuid.UUID(str(doc_out.document_id))
+
+                session_in=SessionBody(user_id=user_id,document_id=document_id,provider="gemini",model="gemini-2.5-flash")
+                session_out=await ChatSessionCRUD.create_session(session_in,db)
+
+                # all jobs share the ingestion workers: partition pool, llm scheduler and neo4j write coalescing
+                job_out=await IngestionJobCRUD.create_job(document_id,user_id,"gemini","gemini-2.5-flash",UPLOAD_QUALITY,db,batch_id=batch_id)
+                await enqueue_job(job_out.job_id)
+                results.append(BatchFileResult(
+                    file_name=pdf.file_name,status="queued",document_id=document_id,
+                    session_id=session_out.session_id,job_id=job_out.job_id
+                ))
+            except Exception as e:
+                print(f"Batch upload error for {pdf.file_name}: {e}")
+                detail=e.detail if isinstance(e,HTTPException) else str(e)
+                results.append(BatchFileResult(file_name=pdf.file_name,status="rejected",detail=str(detail)))
+        return BatchUploadResponse(batch_id=batch_id,files=results)
+    finally:
+        for pdf in pdfs:
+            pdf.close()
+
+
+@upload_router.get("/batches/{batch_id}",response_model=BatchStatusResponse)
+async def get_batch_status(batch_id:uuid.UUID,db:AsyncSession=Depends(get_db)):
+    jobs=await IngestionJobCRUD.list_batch_jobs(batch_id,db)
+    if not jobs:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND,detail="Batch not found")
+    counts:dict={}
+    for job in jobs:
+        counts[str(job.status)]=counts.get(str(job.status),0)+1
+    progress=sum(int(job.progress) for job in jobs)/len(jobs)  # type: ignore
+    return BatchStatusResponse(
+        batch_id=batch_id,total=len(jobs),counts=counts,progress=progress,
+        jobs=[IngestionJobOut.model_validate(job) for job in jobs]
+    )
+
+
+@upload_router.get("/jobs/{job_id}",response_model=IngestionJobOut)
+async def get_ingestion_job(job_id:uuid.UUID,db:AsyncSession=Depends(get_db)):
+    job=await IngestionJobCRUD.get_job(job_id,db)
+    if not job:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND,detail="Job not found")
+    return job
+
 
+@upload_router.post("/jobs/{job_id}/cancel",response_model=IngestionJobOut)
+async def cancel_ingestion_job(job_id:uuid.UUID,db:AsyncSession=Depends(get_db)):
+    job=await IngestionJobCRUD.get_job(job_id,db)
+    if not job:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND,detail="Job not found")
+    if job.status in ("completed","failed","cancelled"):
+        raise HTTPException(status_code=HTTP_409_CONFLICT,detail=f"Job already {job.status}")
+    await request_cancel(job_id)
+    if job.status=="queued":
+        # the worker drops it when dequeued; running jobs stop at the next stage boundary
+        job=await IngestionJobCRUD.update_job(job_id,db,status="cancelled")
+    return job
@@ -1,8 +1,9 @@
 import json
 from src.database.redis_client import redis_client
-from src.agent.agent import Neo4jRAGSystem
+from src.agent.agent_pool import agent_pool, AGENT_POOL_TTL
+from src.agent.answer_cache import answer_cache
 
-async def get_agent_session(user_id:str,document_id:str,provider,model):
+async def get_session_config(user_id:str,document_id:str,provider,model)->dict:
     key=f"agent:{user_id}-{document_id}"
     data =await redis_client.get(key)
     if data:
@@ -14,17 +15,27 @@ async def get_agent_session(user_id:str,document_id:str,provider,model):
             "provider":provider,
             "model":model
         }
-        await redis_client.setex(key,1800,json.dumps(config,default=str))
+        await redis_client.setex(key,AGENT_POOL_TTL,json.dumps(config,default=str))
 
-    await redis_client.expire(key,1800)
-    agent=Neo4jRAGSystem(
+    await redis_client.expire(key,AGENT_POOL_TTL)
+    return config
+
+
+async def ask_agent_session(user_id:str,document_id:str,provider,model,question:str):
+    """Answer from the answer cache when possible, otherwise run the agent and cache a successful answer"""
+    config=await get_session_config(user_id,document_id,provider,model)
+    lookup=await answer_cache.get(config["document_id"],config["provider"],config["model"],question)
+    if lookup.answer is not None:
+        return {"question":question,"answer":lookup.answer,"success":True,"cached":True}
+    agent=await agent_pool.get(
         user_id=config["user_id"],
         document_id=config["document_id"],
         provider=config["provider"],
         model=config["model"]
     )
-        
-
-    return agent
-
-
+    if agent is None:
+        return None
+    response=await agent.answer_question(question)
+    if response["success"]:
+        await answer_cache.set(lookup,response["answer"])
+    return response
@@ -1,7 +1,7 @@
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio.session import AsyncSession
 from uuid import UUID
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 from src.database.models import DocumentModel
 from src.schemas.document import DocumentCreate, DocumentUpdate 
@@ -24,6 +24,15 @@ class DocumentCRUD:
         docs_obj=await db.execute(select(self.model).where(self.model.user_id==user_id))
         return list(docs_obj.scalars().all()) 
 
+   async def get_by_hashes(self,db:AsyncSession,user_id:UUID,content_hashes:List[str])->Dict[str,DocumentModel]:
+        """content_hash -> the user's document with that content, for upload deduplication"""
+        if not content_hashes:
+            return {}
+        docs_obj=await db.execute(
+            select(self.model).where(self.model.user_id==user_id,self.model.content_hash.in_(content_hashes))
+        )
+        return {str(doc.content_hash):doc for doc in docs_obj.scalars().all()}
+
    async def update(self,db:AsyncSession,doc_obj:DocumentModel,obj_in:DocumentUpdate)->DocumentModel:
         update_data=obj_in.model_dump(exclude_unset=True)
         for field,value in update_data:
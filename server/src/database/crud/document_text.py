@@ -0,0 +1,42 @@
+import gzip
+import json
+import uuid
+from typing import List, Optional
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio.session import AsyncSession
+from src.database.models import DocumentTextModel
+
+
+class DocumentTextCRUD:
+    def __init__(self) -> None:
+        pass
+
+    @staticmethod
+    async def save_pages(document_id:uuid.UUID,pages:List[str],db:AsyncSession)->DocumentTextModel:
+        """Insert or replace the page segmented text of a document.
+        A single upsert, so two jobs storing the same document at once cannot both insert"""
+        values={
+            "pages":gzip.compress(json.dumps(pages).encode()),
+            "page_count":len(pages),
+            "char_count":sum(len(page) for page in pages),
+        }
+        stmt=insert(DocumentTextModel).values(document_id=document_id,**values)
+        stmt=stmt.on_conflict_do_update(index_elements=[DocumentTextModel.document_id],set_=values)
+        result=await db.execute(stmt.returning(DocumentTextModel))
+        db_obj=result.scalars().first()
+        await db.commit()
+        return db_obj  # type: ignore
+
+    @staticmethod
+    async def has_pages(document_id:uuid.UUID,db:AsyncSession)->bool:
+        result=await db.execute(select(DocumentTextModel.document_id).where(DocumentTextModel.document_id==document_id))
+        return result.scalars().first() is not None
+
+    @staticmethod
+    async def get_pages(document_id:uuid.UUID,db:AsyncSession)->Optional[List[str]]:
+        result=await db.execute(select(DocumentTextModel.pages).where(DocumentTextModel.document_id==document_id))
+        data=result.scalars().first()
+        if data is None:
+            return None
+        return json.loads(gzip.decompress(data))
@@ -0,0 +1,52 @@
+import uuid
+from typing import List, Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio.session import AsyncSession
+from src.database.models import IngestionJobModel
+
+
+class IngestionJobCRUD:
+    def __init__(self) -> None:
+        pass
+
+    @staticmethod
+    async def create_job(document_id:uuid.UUID,user_id:uuid.UUID,provider:str,model:str,quality:str,db:AsyncSession,max_attempts:int=3,batch_id:Optional[uuid.UUID]=None)->IngestionJobModel:
+        db_obj=IngestionJobModel(
+            document_id=document_id,
+            user_id=user_id,
+            batch_id=batch_id,
+            provider=provider,
+            model=model,
+            quality=quality,
+            status="queued",
+            progress=0,
+            attempts=0,
+            max_attempts=max_attempts
+        )
+        db.add(db_obj)
+        await db.commit()
+        await db.refresh(db_obj)
+        return db_obj
+
+    @staticmethod
+    async def get_job(job_id:uuid.UUID,db:AsyncSession)->Optional[IngestionJobModel]:
+        result=await db.execute(select(IngestionJobModel).where(IngestionJobModel.job_id==job_id))
+        return result.scalars().first()
+
+    @staticmethod
+    async def list_batch_jobs(batch_id:uuid.UUID,db:AsyncSession)->List[IngestionJobModel]:
+        result=await db.execute(
+            select(IngestionJobModel).where(IngestionJobModel.batch_id==batch_id).order_by(IngestionJobModel.created_at)
+        )
+        return list(result.scalars().all())
+
+    @staticmethod
+    async def update_job(job_id:uuid.UUID,db:AsyncSession,**fields)->Optional[IngestionJobModel]:
+        db_obj=await IngestionJobCRUD.get_job(job_id,db)
+        if db_obj is None:
+            return None
+        for field,value in fields.items():
+            setattr(db_obj,field,value)
+        await db.commit()
+        await db.refresh(db_obj)
+        return db_obj
@@ -1,55 +1,91 @@
 
 
 from datetime import  datetime,timezone
+import asyncio
+import hashlib
 import uuid
+from typing import AsyncIterator, BinaryIO, Optional
 from fastapi import HTTPException, UploadFile
 from starlette.status import HTTP_413_CONTENT_TOO_LARGE
-from  src.database.supabase_client import supabase
 from src.schemas.document import DocumentCreate
+from src.storage.backends import STORAGE_CHUNK_SIZE, StorageBackend, get_storage_backend
 
 BUCKET_NAME = "pdfs" 
 MAX_FILE_SIZE=10*1024*1024
 
 class StorageCRUD:
-    def __init__(self) -> None:
-        pass
+    def __init__(self,backend:Optional[StorageBackend]=None) -> None:
+        self.backend=backend or get_storage_backend()
 
     async def upload_pdf(self,user_id:uuid.UUID,uploaded_file:UploadFile)->DocumentCreate | None:
         try:
             if uploaded_file.filename is None:
                 raise ValueError("Uploaded file has no file name")
-            file_name=uploaded_file.filename.strip() 
-            document_id=uuid.uuid4()
-            file_content=await uploaded_file.read()
-            file_size=len(file_content)
-
-            if file_size>MAX_FILE_SIZE:
+            if uploaded_file.size is not None and uploaded_file.size>MAX_FILE_SIZE:
                 raise HTTPException( 
                 status_code=HTTP_413_CONTENT_TOO_LARGE,
                 detail="File size exceeded")
 
-            file_path=f"{user_id}/{document_id}/{file_name}"
-
-            supabase.storage.from_(BUCKET_NAME).upload(file_path,file_content)
-
-            public_url=supabase.storage.from_(BUCKET_NAME).get_public_url(file_path)
+            async def chunks():
+                while True:
+                    chunk=await uploaded_file.read(STORAGE_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    yield chunk
 
-            doc_in=DocumentCreate(
-                user_id=user_id,
-                document_id=document_id,
-                file_name=file_name,
-                file_path=public_url, 
-                upload_timestamp=datetime.now(timezone.utc),
-                file_size=file_size
-            )
-            return doc_in 
+            return await self.upload_stream(user_id,uploaded_file.filename,chunks(),uploaded_file.content_type or "application/pdf")
 
+        except HTTPException:
+            raise
         except Exception as e:
             print(f"Bucket Upload error: {e}")
 
-    def delete_pdf(self,file_path:str):
+    async def upload_fileobj(self,user_id:uuid.UUID,file_name:str,fileobj:BinaryIO)->DocumentCreate:
+        """Upload from a (spooled) local file object, reading it off the event loop"""
+        async def chunks():
+            while True:
+                chunk=await asyncio.to_thread(fileobj.read,STORAGE_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+
+        return await self.upload_stream(user_id,file_name,chunks(),"application/pdf")
+
+    async def upload_stream(self,user_id:uuid.UUID,file_name:str,chunks:AsyncIterator[bytes],content_type:str)->DocumentCreate:
+        file_name=file_name.strip()
+        document_id=uuid.uuid4()
+        file_path=f"{user_id}/{document_id}/{file_name}"
+        digest=hashlib.sha256()
+        file_size=0
+
+        async def checked_chunks():
+            # hash and size are computed while streaming, nothing holds the whole file
+            nonlocal file_size
+            async for chunk in chunks:
+                file_size+=len(chunk)
+                if file_size>MAX_FILE_SIZE:
+                    raise HTTPException( 
+                    status_code=HTTP_413_CONTENT_TOO_LARGE,
+                    detail="File size exceeded")
+                digest.update(chunk)
+                yield chunk
+
+        await self.backend.upload(BUCKET_NAME,file_path,checked_chunks(),content_type)
+
+        public_url=self.backend.public_url(BUCKET_NAME,file_path)
+
+        return DocumentCreate(
+            user_id=user_id,
+            document_id=document_id,
+            file_name=file_name,
+            file_path=public_url, 
+            upload_timestamp=datetime.now(timezone.utc),
+            file_size=file_size,
+            content_hash=digest.hexdigest()
+        )
+
+    async def delete_pdf(self,file_path:str):
          try:
-            response=supabase.storage.from_(BUCKET_NAME).remove([file_path])
+            await self.backend.delete(BUCKET_NAME,file_path)
          except Exception as e:
             print(f"Bucket Deletiton error:{e}")
-
@@ -1,7 +1,7 @@
 from datetime import datetime,timezone
 import uuid
 from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy import Column, Integer,String ,ForeignKey,Text,DateTime
+from sqlalchemy import Column, Integer,String ,ForeignKey,Text,DateTime,LargeBinary
 from sqlalchemy.orm import relationship
 from src.database.database import Base
 
@@ -23,6 +23,7 @@ class DocumentModel(Base):
     file_name=Column(String,nullable=False)
     file_path=Column(String,nullable=False,unique=True)
     file_size=Column(Integer,nullable=False)
+    content_hash=Column(String(64),index=True,nullable=True)  # sha256 of the pdf bytes
     upload_timestamp = Column(
         DateTime(timezone=True),
         default=lambda: datetime.now(timezone.utc),
@@ -51,3 +52,29 @@ class ChatHistory(Base):
     session = relationship("SessionModel", back_populates="chat_history")
 
 
+class DocumentTextModel(Base):
+    __tablename__="document_texts"
+    document_id=Column(UUID(as_uuid=True),ForeignKey("documents.document_id",ondelete="CASCADE"),primary_key=True)
+    pages=Column(LargeBinary,nullable=False)  # gzip compressed json list, one string per page
+    page_count=Column(Integer,nullable=False)
+    char_count=Column(Integer,nullable=False)
+    created_at=Column(DateTime(timezone=True),default=lambda:datetime.now(timezone.utc),nullable=False)
+
+
+class IngestionJobModel(Base):
+    __tablename__="ingestion_jobs"
+    job_id=Column(UUID(as_uuid=True),primary_key=True,default=generate_uuid)
+    document_id=Column(UUID(as_uuid=True),ForeignKey("documents.document_id"),nullable=False,index=True)
+    user_id=Column(UUID(as_uuid=True),index=True,nullable=False)
+    batch_id=Column(UUID(as_uuid=True),nullable=True,index=True)  # set for jobs created by /upload/batch
+    provider=Column(String,nullable=False)
+    model=Column(String,nullable=False)
+    quality=Column(String,nullable=False,default="H")
+    status=Column(String,nullable=False,default="queued")  # queued | running | completed | failed | cancelled
+    stage=Column(String,nullable=True)
+    progress=Column(Integer,nullable=False,default=0)
+    attempts=Column(Integer,nullable=False,default=0)
+    max_attempts=Column(Integer,nullable=False,default=3)
+    error=Column(Text,nullable=True)
+    created_at=Column(DateTime(timezone=True),default=lambda:datetime.now(timezone.utc),nullable=False)
+    updated_at=Column(DateTime(timezone=True),default=lambda:datetime.now(timezone.utc),onupdate=lambda:datetime.now(timezone.utc),nullable=False)
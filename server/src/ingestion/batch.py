@@ -0,0 +1,137 @@
+"""
+Helpers for /upload/batch: unpack the uploaded pdfs and zip archives into spooled
+files, hash them and drop duplicates before anything is sent to storage.
+
+Every pdf is copied to a SpooledTemporaryFile (memory up to BATCH_SPOOL_MEMORY, disk
+beyond), so a large batch never sits in RAM; all file work runs in a thread.
+"""
+import asyncio
+import hashlib
+import os
+import tempfile
+import zipfile
+from typing import BinaryIO, List, Optional
+from fastapi import UploadFile
+from src.database.crud.storage import MAX_FILE_SIZE
+from src.storage.backends import STORAGE_CHUNK_SIZE
+
+BATCH_MAX_FILES=int(os.getenv("BATCH_MAX_FILES","250"))
+BATCH_SPOOL_MEMORY=int(os.getenv("BATCH_SPOOL_MEMORY",str(1024*1024)))
+
+
+class BatchTooLarge(Exception):
+    """More than BATCH_MAX_FILES pdfs in the uploads and archives of one batch"""
+
+
+class BatchPdf:
+    def __init__(self,file_name:str,fileobj:Optional[BinaryIO]=None,error:Optional[str]=None) -> None:
+        self.file_name=file_name
+        self.fileobj=fileobj
+        self.error=error
+        self.content_hash:Optional[str]=None
+        self.size=0
+
+    def close(self):
+        if self.fileobj is not None:
+            self.fileobj.close()
+
+
+def _spool(source:BinaryIO)->BinaryIO:
+    """Copy `source` into a spooled temp file, failing once MAX_FILE_SIZE is exceeded"""
+    spooled=tempfile.SpooledTemporaryFile(max_size=BATCH_SPOOL_MEMORY)
+    size=0
+    while True:
+        chunk=source.read(STORAGE_CHUNK_SIZE)
+        if not chunk:
+            break
+        size+=len(chunk)
+        if size>MAX_FILE_SIZE:
+            spooled.close()
+            raise ValueError("File size exceeded")
+        spooled.write(chunk)
+    spooled.seek(0)
+    return spooled  # type: ignore
+
+
+def _hash(pdf:BatchPdf):
+    digest=hashlib.sha256()
+    assert pdf.fileobj is not None
+    while True:
+        chunk=pdf.fileobj.read(STORAGE_CHUNK_SIZE)
+        if not chunk:
+            break
+        pdf.size+=len(chunk)
+        digest.update(chunk)
+    pdf.fileobj.seek(0)
+    pdf.content_hash=digest.hexdigest()
+
+
+def _is_zip_pdf(member:zipfile.ZipInfo)->bool:
+    name=os.path.basename(member.filename)
+    return not member.is_dir() and name.lower().endswith(".pdf") and not member.filename.startswith("__MACOSX/")
+
+
+def _count_pdfs(files:List[UploadFile])->int:
+    """Pdfs in the batch, read from the zip directories only (nothing is extracted)"""
+    count=0
+    for upload in files:
+        if (upload.filename or "").strip().lower().endswith(".zip"):
+            try:
+                with zipfile.ZipFile(upload.file) as zf:
+                    count+=sum(1 for member in zf.infolist() if _is_zip_pdf(member))
+            except zipfile.BadZipFile:
+                count+=1
+            upload.file.seek(0)
+        else:
+            count+=1
+    return count
+
+
+def _unpack_zip(archive:BinaryIO,archive_name:str)->List[BatchPdf]:
+    pdfs=[]
+    try:
+        with zipfile.ZipFile(archive) as zf:
+            for member in zf.infolist():
+                if not _is_zip_pdf(member):
+                    continue
+                name=os.path.basename(member.filename)
+                if member.file_size>MAX_FILE_SIZE:
+                    pdfs.append(BatchPdf(name,error="File size exceeded"))
+                    continue
+                try:
+                    with zf.open(member) as source:
+                        pdfs.append(BatchPdf(name,_spool(source)))
+                except Exception as e:
+                    pdfs.append(BatchPdf(name,error=str(e)))
+    except zipfile.BadZipFile:
+        pdfs.append(BatchPdf(archive_name,error="Invalid zip archive"))
+    return pdfs
+
+
+def _collect(files:List[UploadFile])->List[BatchPdf]:
+    # reject oversized batches before anything is spooled to disk
+    count=_count_pdfs(files)
+    if count>BATCH_MAX_FILES:
+        raise BatchTooLarge(f"A batch may contain at most {BATCH_MAX_FILES} pdfs, got {count}")
+    pdfs:List[BatchPdf]=[]
+    for upload in files:
+        name=(upload.filename or "").strip()
+        lower=name.lower()
+        if lower.endswith(".zip"):
+            pdfs.extend(_unpack_zip(upload.file,name))
+        elif lower.endswith(".pdf"):
+            try:
+                pdfs.append(BatchPdf(name,_spool(upload.file)))
+            except Exception as e:
+                pdfs.append(BatchPdf(name,error=str(e)))
+        else:
+            pdfs.append(BatchPdf(name or "<unnamed>",error="Only pdf and zip files are accepted"))
+    for pdf in pdfs:
+        if pdf.fileobj is not None:
+            _hash(pdf)
+    return pdfs
+
+
+async def collect_batch_pdfs(files:List[UploadFile])->List[BatchPdf]:
+    """Pdfs of the batch in upload order, each with its content hash or an error; raises BatchTooLarge"""
+    return await asyncio.to_thread(_collect,files)
@@ -0,0 +1,161 @@
+"""
+Redis backed queue for ingestion jobs.
+
+Job rows live in postgres (ingestion_jobs), redis only carries job ids:
+ - ingestion:queue       -> pending job ids (FIFO)
+ - ingestion:background  -> pending background jobs (hi_res upgrades), only taken when the queue is empty
+ - ingestion:processing  -> job ids picked up by a worker but not acknowledged yet
+ - ingestion:heartbeat   -> sorted set: job id -> last heartbeat of the worker running it
+ - ingestion:owner       -> hash: job id -> worker (host:pid) running it
+ - ingestion:origin      -> hash: job id -> queue it was pushed to ("queue" or "background")
+ - ingestion:delayed     -> sorted set: "<queue|background>:<job id>" -> time the retry is due
+ - ingestion:cancel:<id> -> cancellation flag checked by the worker between stages
+
+Only processing entries whose heartbeat is older than INGESTION_HEARTBEAT_TIMEOUT are
+recovered, so jobs still running on live workers (on any host) are left alone; they go back
+to the queue they came from, so a recovered background job stays behind fresh uploads.
+"""
+import os
+import time
+from typing import Optional, Tuple
+from src.database.redis_client import redis_client
+
+QUEUE_KEY="ingestion:queue"
+BACKGROUND_QUEUE_KEY="ingestion:background"
+PROCESSING_KEY="ingestion:processing"
+HEARTBEAT_KEY="ingestion:heartbeat"
+OWNER_KEY="ingestion:owner"
+ORIGIN_KEY="ingestion:origin"
+DELAYED_KEY="ingestion:delayed"
+HEARTBEAT_TIMEOUT=float(os.getenv("INGESTION_HEARTBEAT_TIMEOUT","120"))
+
+# move due retries to their queue; ZREM and RPUSH in one script so a retry is never lost or doubled
+_PROMOTE_SCRIPT="""
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, 100)
+for _, member in ipairs(due) do
+    redis.call('ZREM', KEYS[1], member)
+    local sep = string.find(member, ':', 1, true)
+    local origin = string.sub(member, 1, sep - 1)
+    local job_id = string.sub(member, sep + 1)
+    local target = KEYS[2]
+    if origin == 'background' then target = KEYS[3] end
+    redis.call('HSET', KEYS[4], job_id, origin)
+    redis.call('RPUSH', target, job_id)
+end
+return #due
+"""
+CANCEL_KEY="ingestion:cancel:{job_id}"
+CANCEL_TTL=int(os.getenv("INGESTION_CANCEL_TTL","86400"))
+
+
+def _decode(value)->str:
+    return value.decode() if isinstance(value,bytes) else str(value)
+
+
+def _origin(background:bool)->str:
+    return "background" if background else "queue"
+
+
+async def enqueue_job(job_id,background:bool=False)->None:
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.hset(ORIGIN_KEY,str(job_id),_origin(background))
+        pipe.rpush(BACKGROUND_QUEUE_KEY if background else QUEUE_KEY,str(job_id))
+        await pipe.execute()
+
+
+async def schedule_retry(job_id,delay:float,background:bool=False)->None:
+    """Requeue `job_id` after `delay` seconds without holding a worker slot meanwhile"""
+    member=f"{_origin(background)}:{job_id}"
+    await redis_client.zadd(DELAYED_KEY,{member:time.time()+delay})
+
+
+async def promote_due_jobs()->int:
+    return int(await redis_client.eval(_PROMOTE_SCRIPT,4,DELAYED_KEY,QUEUE_KEY,BACKGROUND_QUEUE_KEY,ORIGIN_KEY,time.time()))  # type: ignore
+
+
+async def dequeue_job(timeout:int=5,background:bool=True)->Tuple[Optional[str],bool]:
+    """
+    Atomically move the next job id into the processing list, blocking up to `timeout` seconds.
+    Foreground jobs always go first; background jobs are only taken when `background` is set
+    and the queue is empty. Returns (job id or None, whether it is a background job).
+    """
+    await promote_due_jobs()
+    job_id=await redis_client.lmove(QUEUE_KEY,PROCESSING_KEY,"LEFT","RIGHT")  # type: ignore
+    if job_id is not None:
+        return _decode(job_id),False
+    if background:
+        job_id=await redis_client.lmove(BACKGROUND_QUEUE_KEY,PROCESSING_KEY,"LEFT","RIGHT")  # type: ignore
+        if job_id is not None:
+            return _decode(job_id),True
+    job_id=await redis_client.blmove(QUEUE_KEY,PROCESSING_KEY,timeout,"LEFT","RIGHT")  # type: ignore
+    if job_id is None:
+        return None,False
+    return _decode(job_id),False
+
+
+async def claim_job(job_id,owner:str)->None:
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.zadd(HEARTBEAT_KEY,{str(job_id):time.time()})
+        pipe.hset(OWNER_KEY,str(job_id),owner)
+        await pipe.execute()
+
+
+async def heartbeat(job_ids)->None:
+    """Refresh the heartbeat of the jobs a worker is running"""
+    if job_ids:
+        now=time.time()
+        await redis_client.zadd(HEARTBEAT_KEY,{str(job_id):now for job_id in job_ids})
+
+
+async def ack_job(job_id)->None:
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.lrem(PROCESSING_KEY,1,str(job_id))
+        pipe.zrem(HEARTBEAT_KEY,str(job_id))
+        pipe.hdel(OWNER_KEY,str(job_id))
+        pipe.hdel(ORIGIN_KEY,str(job_id))
+        await pipe.execute()
+
+
+async def recover_jobs(timeout:float=HEARTBEAT_TIMEOUT)->int:
+    """
+    Push jobs whose worker stopped sending heartbeats (crashed or killed) back onto the queue
+    they were enqueued on.
+    A job that never got a heartbeat (its worker died before claiming it) is recovered
+    one timeout after it was first seen.
+    """
+    recovered=0
+    now=time.time()
+    for value in await redis_client.lrange(PROCESSING_KEY,0,-1):  # type: ignore
+        job_id=_decode(value)
+        beat=await redis_client.zscore(HEARTBEAT_KEY,job_id)
+        if beat is None:
+            # possibly dequeued a moment ago and not claimed yet: start its clock instead
+            await redis_client.zadd(HEARTBEAT_KEY,{job_id:now},nx=True)
+            continue
+        if now-beat<timeout:
+            continue
+        # LREM decides which of several recovering workers requeues the job
+        if await redis_client.lrem(PROCESSING_KEY,1,job_id):  # type: ignore
+            owner=await redis_client.hget(OWNER_KEY,job_id)  # type: ignore
+            origin=await redis_client.hget(ORIGIN_KEY,job_id)  # type: ignore
+            background=origin is not None and _decode(origin)==_origin(True)
+            print(f"Recovering ingestion job {job_id} from {_decode(owner) if owner else 'unknown worker'}")
+            async with redis_client.pipeline(transaction=True) as pipe:
+                pipe.rpush(BACKGROUND_QUEUE_KEY if background else QUEUE_KEY,job_id)
+                pipe.zrem(HEARTBEAT_KEY,job_id)
+                pipe.hdel(OWNER_KEY,job_id)
+                await pipe.execute()
+            recovered+=1
+    return recovered
+
+
+async def request_cancel(job_id)->None:
+    await redis_client.setex(CANCEL_KEY.format(job_id=job_id),CANCEL_TTL,1)
+
+
+async def is_cancelled(job_id)->bool:
+    return bool(await redis_client.exists(CANCEL_KEY.format(job_id=job_id)))
+
+
+async def clear_cancel(job_id)->None:
+    await redis_client.delete(CANCEL_KEY.format(job_id=job_id))
@@ -0,0 +1,220 @@
+"""
+Ingestion worker: pulls job ids from the redis queue and builds the knowledge graph
+outside of the HTTP request.
+
+Run with:
+    python -m src.ingestion.worker --processes 4
+
+Each process runs its own event loop with INGESTION_JOBS_PER_PROCESS jobs in flight.
+Concurrent jobs of a process share the staged ingestion pipeline (see agent/builder.py),
+the partition processes, the llm scheduler and the neo4j write coalescer (so graph writes
+of different documents go out in the same transactions); throughput scales further by
+adding processes (or hosts pointing at the same redis/postgres).
+
+With INGESTION_TIERED=1 a completed fast job queues a hi_res upgrade job on the background
+queue; at most INGESTION_BACKGROUND_JOBS_PER_PROCESS of those run per process. The upgrade
+re-extracts only the pages whose text changed from the fast tier (see agent/builder.py).
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import uuid
+from src.agent.builder import FAST_QUALITY, HI_RES_QUALITY, INGESTION_TIERED, build_knowledge_graph, ingestion_pipeline
+from src.agent.graph_store import kg_store
+from src.agent.graph_config import close_driver
+from src.database.crud.ingestion_job import IngestionJobCRUD
+from src.database.database import AsyncSessionLocal
+from src.database.models import DocumentModel
+from src.database.crud.document import DocumentCRUD
+from src.database.crud.document_text import DocumentTextCRUD
+from src.utils.extractor import store_document_pages
+from .queue import HEARTBEAT_TIMEOUT, ack_job, claim_job, clear_cancel, dequeue_job, enqueue_job, heartbeat, is_cancelled, recover_jobs, schedule_retry
+
+INGESTION_WORKERS=int(os.getenv("INGESTION_WORKERS","2"))
+RETRY_DELAY=float(os.getenv("INGESTION_RETRY_DELAY","5"))
+INGESTION_JOBS_PER_PROCESS=int(os.getenv("INGESTION_JOBS_PER_PROCESS","4"))
+# background (hi_res upgrade) jobs a process runs at once, so they never fill every slot
+INGESTION_BACKGROUND_JOBS_PER_PROCESS=int(os.getenv("INGESTION_BACKGROUND_JOBS_PER_PROCESS","1"))
+
+HEARTBEAT_INTERVAL=float(os.getenv("INGESTION_HEARTBEAT_INTERVAL",str(HEARTBEAT_TIMEOUT/4)))
+WORKER_ID=f"{socket.gethostname()}:{os.getpid()}"
+
+_background_running=0
+# job ids this process is running, kept alive by _heartbeat_loop
+_running:set=set()
+
+document_crud=DocumentCRUD(DocumentModel)
+
+
+class JobCancelled(Exception):
+    """Raised from the progress callback when a job was cancelled mid-build"""
+
+
+async def _update(job_id:uuid.UUID,**fields):
+    async with AsyncSessionLocal() as db:
+        return await IngestionJobCRUD.update_job(job_id,db,**fields)
+
+
+async def run_job(job_id:uuid.UUID):
+    async with AsyncSessionLocal() as db:
+        job=await IngestionJobCRUD.get_job(job_id,db)
+        if job is None:
+            print(f"Ingestion job {job_id} not found, skipping")
+            return
+        if job.status in ("completed","cancelled"):
+            return
+        if await is_cancelled(job_id):
+            await IngestionJobCRUD.update_job(job_id,db,status="cancelled")
+            await clear_cancel(job_id)
+            return
+        doc=await document_crud.get(db,job.document_id)  # type: ignore
+        if doc is None:
+            await IngestionJobCRUD.update_job(job_id,db,status="failed",error="Document not found")
+            return
+        attempts=job.attempts+1
+        job=await IngestionJobCRUD.update_job(job_id,db,status="running",attempts=attempts,error=None)
+
+    async def on_progress(stage:str,percent:int):
+        if await is_cancelled(job_id):
+            raise JobCancelled()
+        await _update(job_id,stage=stage,progress=percent)
+
+    # in tiered mode a hi_res job follows a fast one and swaps its graph in
+    upgrade=INGESTION_TIERED and job.quality==HI_RES_QUALITY
+    # page text for deep mode, stored once so /deep/ask never re-downloads the pdf;
+    # taken from the bytes the pipeline downloads, and skipped on retries once stored
+    async with AsyncSessionLocal() as db:
+        pages_stored=upgrade or await DocumentTextCRUD.has_pages(doc.document_id,db)  # type: ignore
+
+    async def store_pages(pdf_bytes:bytes):
+        nonlocal pages_stored
+        if not pages_stored:
+            async with AsyncSessionLocal() as db:
+                await store_document_pages(doc.document_id,str(doc.file_path),db,pdf_bytes=pdf_bytes)  # type: ignore
+            pages_stored=True
+
+    try:
+        await build_knowledge_graph(
+            pdf_path=str(doc.file_path),
+            document_id=str(doc.document_id),
+            provider=str(job.provider),  # type: ignore
+            model=str(job.model),  # type: ignore
+            quality=str(job.quality),  # type: ignore
+            on_progress=on_progress,
+            file_hash=doc.content_hash,  # type: ignore
+            upgrade=upgrade,
+            on_download=store_pages
+        )
+        if not pages_stored:
+            # the partitioned text came from the cache, so the pdf was not downloaded
+            async with AsyncSessionLocal() as db:
+                await store_document_pages(doc.document_id,str(doc.file_path),db)  # type: ignore
+        await _update(job_id,status="completed",stage="completed",progress=100)
+        if INGESTION_TIERED and job.quality==FAST_QUALITY:
+            # the document is queryable now; the hi_res rebuild runs when workers are idle
+            async with AsyncSessionLocal() as db:
+                upgrade_job=await IngestionJobCRUD.create_job(
+                    doc.document_id,job.user_id,str(job.provider),str(job.model),HI_RES_QUALITY,db  # type: ignore
+                )
+            await enqueue_job(upgrade_job.job_id,background=True)
+    except JobCancelled:
+        print(f"Ingestion job {job_id} cancelled")
+        await _update(job_id,status="cancelled")
+        await clear_cancel(job_id)
+    except Exception as e:
+        print(f"Ingestion job {job_id} failed (attempt {attempts}): {e}")
+        if attempts<job.max_attempts:  # type: ignore
+            await _update(job_id,status="queued",error=str(e))
+            # delayed requeue: the slot is free for other jobs while the retry waits
+            await schedule_retry(job_id,RETRY_DELAY*attempts,background=upgrade)
+        else:
+            await _update(job_id,status="failed",error=str(e))
+
+
+async def _next_job():
+    global _background_running
+    # the background slot is reserved before dequeuing, so concurrent consumers can't overshoot it
+    reserved=_background_running<INGESTION_BACKGROUND_JOBS_PER_PROCESS
+    _background_running+=int(reserved)
+    background=False
+    try:
+        job_id,background=await dequeue_job(background=reserved)
+        return job_id,background
+    finally:
+        if reserved and not background:
+            _background_running-=1
+
+
+async def consume_jobs():
+    global _background_running
+    while True:
+        job_id,background=await _next_job()
+        if job_id is None:
+            continue
+        _running.add(job_id)
+        try:
+            await claim_job(job_id,WORKER_ID)
+            await run_job(uuid.UUID(job_id))
+        except Exception as e:
+            print(f"Ingestion worker error for job {job_id}: {e}")
+        finally:
+            _running.discard(job_id)
+            if background:
+                _background_running-=1
+            await ack_job(job_id)
+            await ingestion_pipeline.publish_metrics()
+
+
+async def _heartbeat_loop():
+    """Keep this process's jobs alive and requeue the jobs of workers that stopped beating"""
+    while True:
+        try:
+            await heartbeat(list(_running))
+            recovered=await recover_jobs()
+            if recovered:
+                print(f"Requeued {recovered} stale ingestion jobs")
+        except Exception as e:
+            print(f"Ingestion heartbeat error: {e}")
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+
+async def worker_loop():
+    print(f"Ingestion worker {os.getpid()} started ({INGESTION_JOBS_PER_PROCESS} concurrent jobs)")
+    await kg_store.initialize()
+    try:
+        await asyncio.gather(_heartbeat_loop(),*(consume_jobs() for _ in range(max(1,INGESTION_JOBS_PER_PROCESS))))
+    finally:
+        await ingestion_pipeline.stop()
+        await close_driver()
+
+
+def _run_process():
+    asyncio.run(worker_loop())
+
+
+def main():
+    parser=argparse.ArgumentParser(description="Knowledge graph ingestion worker")
+    parser.add_argument("--processes",type=int,default=INGESTION_WORKERS)
+    parser.add_argument("--recover",action="store_true",help="requeue jobs whose worker stopped sending heartbeats (workers also do this periodically)")
+    args=parser.parse_args()
+
+    if args.recover:
+        recovered=asyncio.run(recover_jobs())
+        print(f"Requeued {recovered} stale jobs")
+
+    ctx=multiprocessing.get_context("spawn")
+    processes=[ctx.Process(target=_run_process,daemon=False) for _ in range(args.processes)]
+    for p in processes:
+        p.start()
+    try:
+        for p in processes:
+            p.join()
+    except KeyboardInterrupt:
+        for p in processes:
+            p.terminate()
+
+
+if __name__=="__main__":
+    main()
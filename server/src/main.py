@@ -1,27 +1,33 @@
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from src.api.deep_agent import deep_agent_router 
 from src.api.auth import auth_router
 from src.api.uploader import upload_router
 from src.api.agent_session import session_router 
+from src.api.metrics import metrics_router
+from src.agent.model_registry import model_registry
+from src.agent.graph_store import kg_store
+from src.agent.graph_config import close_driver, warmup_driver
 from fastapi.middleware.cors import CORSMiddleware
-# from src.agent.graph_store import kg_store 
 origins = [
     "http://localhost:3000",
     "http://127.0.0.1:3000"
 ]
 
-"""
 @asynccontextmanager   
 async def lifespan(app:FastAPI):
+    # load spaCy (and optional embeddings) once before serving the first request
+    await asyncio.to_thread(model_registry.warmup)
+    # constraints + entity lookup indexes used by the agent tools
     await kg_store.initialize()
+    # open pooled connections before the first burst of agent tool calls
+    await warmup_driver()
     yield
-    await kg_store.driver.close()
+    await close_driver()
 
 
-
-"""
-app=FastAPI()
+app=FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -33,3 +39,4 @@ app.include_router(deep_agent_router)
 app.include_router(auth_router)
 app.include_router(upload_router)
 app.include_router(session_router)
+app.include_router(metrics_router)
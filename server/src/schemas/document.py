@@ -10,6 +10,7 @@ class DocumentBase(BaseModel):
     file_path: str
     file_size: int
     upload_timestamp: datetime  
+    content_hash: Optional[str] = None
 
     model_config={
         "from_attributes":True
@@ -1,7 +1,8 @@
 
 
 
-from typing import List
+from datetime import datetime
+from typing import Dict, List, Optional
 import uuid
 from pydantic import BaseModel
 
@@ -38,8 +39,45 @@ class SessionOut(BaseModel):
       
         
     
+class IngestionJobOut(BaseModel):
+      job_id:uuid.UUID
+      document_id:uuid.UUID
+      batch_id:Optional[uuid.UUID]=None
+      status:str
+      stage:Optional[str]=None
+      progress:int
+      attempts:int
+      error:Optional[str]=None
+      created_at:datetime
+      updated_at:datetime
+      model_config={
+            "from_attributes":True
+    }
+
+
 class ExtractionResponse(BaseModel):
       doc_out: DocumentBase
       session_out:SessionOut
+      job_out:IngestionJobOut
+
+
+class BatchFileResult(BaseModel):
+      file_name:str
+      status:str  # queued | duplicate | rejected
+      document_id:Optional[uuid.UUID]=None
+      session_id:Optional[uuid.UUID]=None
+      job_id:Optional[uuid.UUID]=None
+      detail:Optional[str]=None
+
+
+class BatchUploadResponse(BaseModel):
+      batch_id:uuid.UUID
+      files:List[BatchFileResult]
 
 
+class BatchStatusResponse(BaseModel):
+      batch_id:uuid.UUID
+      total:int
+      counts:Dict[str,int]
+      progress:float
+      jobs:List[IngestionJobOut]
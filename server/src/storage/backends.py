@@ -0,0 +1,131 @@
+"""
+Object storage backends for uploaded pdfs.
+
+Uploads are streamed: the request body is read in STORAGE_CHUNK_SIZE pieces, hashed and
+size checked on the fly and forwarded to the backend, so memory per upload stays bounded.
+
+ - supabase : streamed POST to the storage REST api with httpx (STORAGE_BACKEND=supabase, default)
+ - local    : files under LOCAL_STORAGE_DIR, written off the event loop (STORAGE_BACKEND=local),
+              addressed by file:// urls; meant for tests and local development
+"""
+import asyncio
+import os
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import AsyncIterator, Optional
+from urllib.parse import quote, unquote, urlparse
+import httpx
+from dotenv import load_dotenv
+load_dotenv()
+
+STORAGE_BACKEND=os.getenv("STORAGE_BACKEND","supabase")
+STORAGE_CHUNK_SIZE=int(os.getenv("STORAGE_CHUNK_SIZE",str(256*1024)))
+LOCAL_STORAGE_DIR=os.getenv("LOCAL_STORAGE_DIR","./storage")
+SUPABASE_URL=os.getenv("SUPABASE_URL","")
+SUPABASE_KEY=os.getenv("SUPABASE_KEY","")
+SUPABASE_UPLOAD_TIMEOUT=float(os.getenv("SUPABASE_UPLOAD_TIMEOUT","120"))
+
+
+class StorageBackend(ABC):
+    @abstractmethod
+    async def upload(self,bucket:str,path:str,chunks:AsyncIterator[bytes],content_type:str)->None:
+        ...
+
+    @abstractmethod
+    def public_url(self,bucket:str,path:str)->str:
+        ...
+
+    @abstractmethod
+    async def delete(self,bucket:str,path:str)->None:
+        ...
+
+    async def read(self,url:str)->bytes:
+        """Bytes of an object given the url stored in documents.file_path"""
+        if url.startswith("file://"):
+            return await asyncio.to_thread(Path(unquote(urlparse(url).path)).read_bytes)
+        async with httpx.AsyncClient(follow_redirects=True) as client:
+            response=await client.get(url)
+            response.raise_for_status()
+        return response.content
+
+
+class SupabaseStorageBackend(StorageBackend):
+    def __init__(self,url:str=SUPABASE_URL,key:str=SUPABASE_KEY) -> None:
+        self.url=url.rstrip("/")
+        self.key=key
+
+    def _object_url(self,bucket:str,path:str)->str:
+        return f"{self.url}/storage/v1/object/{bucket}/{quote(path)}"
+
+    def _headers(self)->dict:
+        return {"Authorization":f"Bearer {self.key}","apikey":self.key}
+
+    async def upload(self,bucket:str,path:str,chunks:AsyncIterator[bytes],content_type:str)->None:
+        # httpx sends an async iterator body with chunked transfer encoding;
+        # an exception raised by the iterator aborts the request before anything is stored
+        async with httpx.AsyncClient(timeout=SUPABASE_UPLOAD_TIMEOUT) as client:
+            response=await client.post(
+                self._object_url(bucket,path),
+                content=chunks,
+                headers={**self._headers(),"Content-Type":content_type,"x-upsert":"false"},
+            )
+            response.raise_for_status()
+
+    def public_url(self,bucket:str,path:str)->str:
+        return f"{self.url}/storage/v1/object/public/{bucket}/{quote(path)}"
+
+    async def delete(self,bucket:str,path:str)->None:
+        async with httpx.AsyncClient() as client:
+            response=await client.request(
+                "DELETE",f"{self.url}/storage/v1/object/{bucket}",
+                json={"prefixes":[path]},headers=self._headers(),
+            )
+            response.raise_for_status()
+
+
+class LocalStorageBackend(StorageBackend):
+    def __init__(self,root:str=LOCAL_STORAGE_DIR) -> None:
+        self.root=Path(root).resolve()
+
+    def _path(self,bucket:str,path:str)->Path:
+        target=(self.root/bucket/path).resolve()
+        if self.root not in target.parents:
+            raise ValueError(f"Invalid storage path: {path}")
+        return target
+
+    async def upload(self,bucket:str,path:str,chunks:AsyncIterator[bytes],content_type:str)->None:
+        target=self._path(bucket,path)
+        partial=target.with_name(target.name+".part")
+        await asyncio.to_thread(target.parent.mkdir,parents=True,exist_ok=True)
+        handle=await asyncio.to_thread(open,partial,"wb")
+        try:
+            async for chunk in chunks:
+                await asyncio.to_thread(handle.write,chunk)
+            await asyncio.to_thread(handle.close)
+            # only complete uploads become visible
+            await asyncio.to_thread(os.replace,partial,target)
+        except BaseException:
+            await asyncio.to_thread(handle.close)
+            await asyncio.to_thread(partial.unlink,missing_ok=True)
+            raise
+
+    def public_url(self,bucket:str,path:str)->str:
+        return self._path(bucket,path).as_uri()
+
+    async def delete(self,bucket:str,path:str)->None:
+        await asyncio.to_thread(self._path(bucket,path).unlink,missing_ok=True)
+
+
+_backend:Optional[StorageBackend]=None
+
+
+def get_storage_backend()->StorageBackend:
+    global _backend
+    if _backend is None:
+        _backend=LocalStorageBackend() if STORAGE_BACKEND=="local" else SupabaseStorageBackend()
+    return _backend
+
+
+async def read_object(url:str)->bytes:
+    """Download an uploaded pdf from whichever backend stored it"""
+    return await get_storage_backend().read(url)
@@ -1,8 +1,8 @@
-import asyncio
 from dotenv import load_dotenv
 from langchain_core.prompts import PromptTemplate
 from langchain_google_genai import ChatGoogleGenerativeAI
 from pypdf import PdfReader
+from src.agent.llm_scheduler import PRIORITY_INTERACTIVE, estimate_tokens, llm_scheduler
 
 def extract_pdf_text(path: str) -> str:
     reader = PdfReader(path)
@@ -97,13 +97,16 @@ prompt = PromptTemplate(
 chain = prompt | llm
 
 async def answer_question(query: str, text: str):
-    for chunk in chain.stream({
-        "pdf_text": text,
-        "query": query
-    }):
+    """Yields tokens as the model produces them (async streaming, never blocks the loop)"""
+    stream = llm_scheduler.stream(
+        "gemini", lambda: chain.astream({
+            "pdf_text": text,
+            "query": query
+        }),
+        priority=PRIORITY_INTERACTIVE, tokens=estimate_tokens(text)+estimate_tokens(query)
+    )
+    async for chunk in stream:
         content = chunk.content
         if isinstance(content, (list, dict)):
             content = str(content)
         yield content 
-        await asyncio.sleep(0)
-
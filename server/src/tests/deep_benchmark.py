@@ -0,0 +1,76 @@
+"""
+Benchmark full-text vs retrieval deep mode on a local pdf.
+
+    python -m src.tests.deep_benchmark --pdf src/data/sample.pdf \
+        --question "What is the main contribution?" --question "How is it evaluated?"
+
+Reports per question: prompt size (approx tokens), time to first token, total latency
+and answer coverage (share of the full-text answer's citations whose text also appears
+in the retrieval answer's evidence, plus answer term overlap).
+"""
+import argparse
+import asyncio
+import time
+from src.agent.deep_retrieval import DocumentChunkIndex, format_passages, tokenize
+from src.test import answer_question
+from src.utils.citations import parse_answer
+from src.utils.extractor import extract_pdf_pages, join_pages
+
+
+def approx_tokens(text:str)->int:
+    return len(text)//4
+
+
+async def run_mode(question:str,context:str):
+    start=time.perf_counter()
+    first_token=None
+    parts=[]
+    async for chunk in answer_question(question,context):
+        if first_token is None:
+            first_token=time.perf_counter()-start
+        parts.append(chunk)
+    total=time.perf_counter()-start
+    answer,citations=parse_answer("".join(parts))
+    return {"ttft":first_token or total,"latency":total,"answer":answer,"citations":citations}
+
+
+def coverage(full:dict,retrieval:dict)->dict:
+    full_citations=[c.strip('"').lower() for c in full["citations"]]
+    retrieval_evidence=" ".join(c.strip('"').lower() for c in retrieval["citations"])
+    cited=sum(1 for c in full_citations if c and c[:60] in retrieval_evidence)
+    full_terms=set(tokenize(full["answer"]))
+    retrieval_terms=set(tokenize(retrieval["answer"]))
+    return {
+        "citation_coverage":cited/len(full_citations) if full_citations else 1.0,
+        "term_overlap":len(full_terms & retrieval_terms)/len(full_terms) if full_terms else 1.0
+    }
+
+
+async def main():
+    parser=argparse.ArgumentParser()
+    parser.add_argument("--pdf",required=True)
+    parser.add_argument("--question",action="append",required=True)
+    parser.add_argument("--top-k",type=int,default=8)
+    args=parser.parse_args()
+
+    with open(args.pdf,"rb") as f:
+        pages=extract_pdf_pages(f.read())
+    full_text=join_pages(pages)
+    index=DocumentChunkIndex(pages)
+    print(f"{len(pages)} pages, {len(index.chunks)} chunks, full text ~{approx_tokens(full_text):,} tokens\n")
+
+    for question in args.question:
+        passages=format_passages(await index.search(question,args.top_k))
+        full=await run_mode(question,full_text)
+        retrieval=await run_mode(question,passages)
+        cov=coverage(full,retrieval)
+
+        print(f"Q: {question}")
+        print(f"{'mode':<10}{'prompt tokens':>15}{'ttft (s)':>12}{'latency (s)':>14}{'citations':>11}")
+        for name,context,result in (("full",full_text,full),("retrieval",passages,retrieval)):
+            print(f"{name:<10}{approx_tokens(context):>15,}{result['ttft']:>12.2f}{result['latency']:>14.2f}{len(result['citations']):>11}")
+        print(f"citation coverage: {cov['citation_coverage']:.0%}  answer term overlap: {cov['term_overlap']:.0%}\n")
+
+
+if __name__=="__main__":
+    asyncio.run(main())
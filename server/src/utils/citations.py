@@ -0,0 +1,85 @@
+"""
+Parser for the deep mode answer format:
+
+    answer text with [^1] markers
+    ---EVIDENCE---
+    @cite[1]
+    "quoted evidence"
+    ---END-EVIDENCE---
+
+Works incrementally so tokens can be streamed to the client while the evidence
+block is still being generated.
+"""
+from typing import List, Tuple
+
+EVIDENCE_START="---EVIDENCE---"
+EVIDENCE_END="---END-EVIDENCE---"
+
+
+class EvidenceStreamParser:
+    def __init__(self) -> None:
+        self._buffer=""
+        self._in_evidence=False
+        self._pending_cite=False
+        self.answer_parts:List[str]=[]
+        self.citations:List[str]=[]
+
+    def feed(self,chunk:str)->Tuple[str,List[str]]:
+        """Returns (answer text safe to emit, citations completed by this chunk)"""
+        self._buffer+=chunk
+        if self._in_evidence:
+            return "",self._drain_lines()
+
+        index=self._buffer.find(EVIDENCE_START)
+        if index==-1:
+            # hold back a possible partial marker at the end of the buffer
+            safe=len(self._buffer)-(len(EVIDENCE_START)-1)
+            if safe<=0:
+                return "",[]
+            text=self._buffer[:safe]
+            self._buffer=self._buffer[safe:]
+            self.answer_parts.append(text)
+            return text,[]
+
+        text=self._buffer[:index]
+        self._buffer=self._buffer[index+len(EVIDENCE_START):]
+        self._in_evidence=True
+        self.answer_parts.append(text)
+        return text,self._drain_lines()
+
+    def close(self)->Tuple[str,List[str]]:
+        """Flush whatever is left once the model stops generating"""
+        if not self._in_evidence:
+            text=self._buffer
+            self._buffer=""
+            self.answer_parts.append(text)
+            return text,[]
+        return "",self._drain_lines(final=True)
+
+    @property
+    def answer(self)->str:
+        return "".join(self.answer_parts).strip()
+
+    def _drain_lines(self,final:bool=False)->List[str]:
+        lines=self._buffer.split("\n")
+        self._buffer="" if final else lines.pop()
+        new_citations=[]
+        for line in lines:
+            line=line.strip()
+            if not line or line==EVIDENCE_END:
+                continue
+            if line.startswith("@cite["):
+                self._pending_cite=True
+                continue
+            if self._pending_cite:
+                self.citations.append(line)
+                new_citations.append(line)
+                self._pending_cite=False
+        return new_citations
+
+
+def parse_answer(full_text:str)->Tuple[str,List[str]]:
+    parser=EvidenceStreamParser()
+    parser.feed(full_text)
+    parser.close()
+    return parser.answer,parser.citations
@@ -1,25 +1,80 @@
 import asyncio
-import httpx
+import os
+import uuid
+from collections import OrderedDict
+from typing import List, Optional
 from io import BytesIO
-from PyPDF2 import PdfReader  
+from PyPDF2 import PdfReader
+from sqlalchemy.ext.asyncio.session import AsyncSession
+from src.database.crud.document_text import DocumentTextCRUD
+from src.storage.backends import read_object
+
+PAGE_CACHE_SIZE=int(os.getenv("PAGE_CACHE_SIZE","64"))
+
+
+def extract_pdf_pages(pdf_bytes:bytes)->List[str]:
+    """One string per page, empty pages kept so list index == page number - 1"""
+    reader = PdfReader(BytesIO(pdf_bytes))
+    return [page.extract_text() or "" for page in reader.pages]
+
+
+def join_pages(pages:List[str])->str:
+    return "\n".join(page for page in pages if page)
+
+
+async def get_pdf_pages_from_url(url:str)->List[str]:
+    pdf_bytes = await read_object(url)
+    return await asyncio.to_thread(extract_pdf_pages,pdf_bytes)
+
 
 async def get_pdf_from_url(url: str) -> str:
-    async with httpx.AsyncClient(follow_redirects=True) as client:
-        response = await client.get(url)
-        response.raise_for_status()
+    return join_pages(await get_pdf_pages_from_url(url))
+
+
+class PageTextCache:
+    """Process level LRU of document_id -> page texts"""
+
+    def __init__(self,max_size:int) -> None:
+        self.max_size=max_size
+        self._items:OrderedDict[str,List[str]]=OrderedDict()
+
+    def get(self,document_id)->Optional[List[str]]:
+        key=str(document_id)
+        pages=self._items.get(key)
+        if pages is not None:
+            self._items.move_to_end(key)
+        return pages
+
+    def put(self,document_id,pages:List[str]):
+        key=str(document_id)
+        self._items[key]=pages
+        self._items.move_to_end(key)
+        while len(self._items)>self.max_size:
+            self._items.popitem(last=False)
+
+
+page_cache=PageTextCache(PAGE_CACHE_SIZE)
 
-    pdf_bytes = response.content
-    pdf_file_like = BytesIO(pdf_bytes)
 
-    def extract_pdf_text(file_like) -> str:
-        reader = PdfReader(file_like)
-        text = []
-        for page in reader.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text.append(page_text)
-        return "\n".join(text)
+async def store_document_pages(document_id:uuid.UUID,file_path:str,db:AsyncSession,pdf_bytes:Optional[bytes]=None)->List[str]:
+    """Extract page text once (at ingestion) and persist it compressed in postgres;
+    pass `pdf_bytes` when the pdf was already downloaded"""
+    if pdf_bytes is None:
+        pages=await get_pdf_pages_from_url(file_path)
+    else:
+        pages=await asyncio.to_thread(extract_pdf_pages,pdf_bytes)
+    await DocumentTextCRUD.save_pages(document_id,pages,db)
+    page_cache.put(document_id,pages)
+    return pages
 
-    text = extract_pdf_text(pdf_file_like)
-    return text
 
+async def get_document_pages(document_id:uuid.UUID,file_path:str,db:AsyncSession)->List[str]:
+    """LRU -> postgres -> download fallback for documents ingested before texts were stored"""
+    pages=page_cache.get(document_id)
+    if pages is not None:
+        return pages
+    pages=await DocumentTextCRUD.get_pages(document_id,db)
+    if pages is None:
+        return await store_document_pages(document_id,file_path,db)
+    page_cache.put(document_id,pages)
+    return pages